@@ -11,7 +11,7 @@ jest.unstable_mockModule("child_process", () => ({
 // Re-import mocked version
 const { execFile } = await import("child_process");
 
-const { handlePathRequest } = await import("../controllers/pathfinderController.js");
+const { handlePathRequest, getPathRequestStats } = await import("../controllers/pathfinderController.js");
 
 // Setup express app
 const app = express();
@@ -109,4 +109,105 @@ describe("Path Request Handler (handlePathRequest)", () => {
             expect.any(Function)
         );
     });
+
+    // Resolves once `count` more requests than `before` have reached runPathfinder
+    const waitForRequests = async (before, count) => {
+        while (getPathRequestStats().requests - before.requests < count) {
+            await new Promise((resolve) => setTimeout(resolve, 5));
+        }
+    };
+
+    test("coalesces identical concurrent requests into one python run", async () => {
+        const pending = [];
+        execFile.mockImplementation((cmd, args, opts, cb) => {
+            pending.push(cb);
+        });
+        const before = getPathRequestStats();
+
+        // Same query, different case: both should wait on a single run
+        const responses = Promise.all([
+            request(app).post("/find-path").send(validPayload),
+            request(app).post("/find-path").send({ ...validPayload, startBuildingCode: "sw03", goalRoom: "b202" }),
+        ]);
+        await waitForRequests(before, 2);
+
+        expect(execFile).toHaveBeenCalledTimes(1);
+        pending[0](null, mockPythonOutput, "");
+
+        const [first, second] = await responses;
+        expect(first.body).toEqual({ success: true, output: mockPythonOutput });
+        expect(second.body).toEqual({ success: true, output: mockPythonOutput });
+
+        const after = getPathRequestStats();
+        expect(after.runs - before.runs).toBe(1);
+        expect(after.coalesced - before.coalesced).toBe(1);
+        expect(after.inFlight).toBe(0);
+    });
+
+    test("runs different queries separately", async () => {
+        execFile.mockImplementation((cmd, args, opts, cb) => {
+            setTimeout(() => cb(null, "ok", ""), 5);
+        });
+
+        await Promise.all([
+            request(app).post("/find-path").send(validPayload),
+            request(app).post("/find-path").send({ ...validPayload, goalRoom: "B203" }),
+        ]);
+
+        expect(execFile).toHaveBeenCalledTimes(2);
+        expect(getPathRequestStats().inFlight).toBe(0);
+    });
+
+    test("clears the in-flight run after an error so the next request runs again", async () => {
+        const pending = [];
+        execFile.mockImplementation((cmd, args, opts, cb) => {
+            pending.push(cb);
+        });
+        const before = getPathRequestStats();
+
+        const responses = Promise.all([
+            request(app).post("/find-path").send(validPayload),
+            request(app).post("/find-path").send(validPayload),
+        ]);
+        await waitForRequests(before, 2);
+        pending[0](new Error("Execution failed"), "", "Traceback");
+
+        const [first, second] = await responses;
+        expect(first.status).toBe(500);
+        expect(second.body).toEqual({ success: false, error: "Traceback" });
+        expect(getPathRequestStats().inFlight).toBe(0);
+
+        execFile.mockImplementation((cmd, args, opts, cb) => {
+            cb(null, mockPythonOutput, "");
+        });
+        const retry = await request(app).post("/find-path").send(validPayload);
+        expect(retry.body).toEqual({ success: true, output: mockPythonOutput });
+        expect(execFile).toHaveBeenCalledTimes(2);
+    });
+
+    test("a waiter that throws does not stop the others", async () => {
+        const pending = [];
+        execFile.mockImplementation((cmd, args, opts, cb) => {
+            pending.push(cb);
+        });
+        const response = () => {
+            const res = { status: jest.fn(() => res), json: jest.fn() };
+            return res;
+        };
+        const broken = response();
+        broken.json.mockImplementation(() => {
+            throw new Error("socket closed");
+        });
+        const healthy = response();
+
+        handlePathRequest({ body: validPayload }, broken);
+        handlePathRequest({ body: validPayload }, healthy);
+        expect(execFile).toHaveBeenCalledTimes(1);
+
+        pending[0](null, mockPythonOutput, "");
+
+        expect(broken.json).toHaveBeenCalledTimes(1);
+        expect(healthy.json).toHaveBeenCalledWith({ success: true, output: mockPythonOutput });
+        expect(getPathRequestStats().inFlight).toBe(0);
+    });
 });
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Chunked tile store for floor grids.
+
+A floor grid is cut into TILE_SIZE x TILE_SIZE tiles. Tiles that are all
+free or all wall are only recorded in a small per-tile kind table; mixed
+tiles are stored as separate members of floorplan_tiles.npz and read the
+first time a lookup touches them, then kept in a small LRU cache. Scalar
+and window lookups (A* and line-of-sight checks) only pay memory and I/O for
+the regions a search actually visits. Engines that need the whole floor at
+once (the numpy BFS / wavefront queries, pyramid, skeleton, route tables and
+the worker pool) are eager: they take one dense copy through dense(), which
+reads each mixed tile once without going through the cache.
+"""
+
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+# === CONFIG ===
+TILE_SIZE = 64     # cells per tile side
+CACHE_TILES = 256  # mixed tiles kept in memory per grid
+
+FREE, WALL, MIXED = 0, 1, 2 # tile kinds
+
+# =============================================================
+# === BUILD ===
+# =============================================================
+
+def save_grid_tiles(grid, path, tile=TILE_SIZE):
+    """
+    Writes a 0/1 grid (1 = wall) as a tile store.
+    Returns: (number of mixed tiles, total number of tiles)
+    """
+    grid = np.asarray(grid)
+    rows, cols = grid.shape
+    tiles_r, tiles_c = -(-rows // tile), -(-cols // tile)
+    kinds = np.empty((tiles_r, tiles_c), dtype=np.uint8)
+    members = {}
+
+    for tr in range(tiles_r):
+        for tc in range(tiles_c):
+            block = grid[tr * tile:(tr + 1) * tile, tc * tile:(tc + 1) * tile] != 0
+            if not block.any():
+                kinds[tr, tc] = FREE
+            elif block.all():
+                kinds[tr, tc] = WALL
+            else:
+                kinds[tr, tc] = MIXED
+                members[f"t{tr}_{tc}"] = block.astype(np.uint8)
+
+    np.savez_compressed(path, shape=np.array(grid.shape), tile=np.array(tile), kinds=kinds,
+                        digest=np.array(grid_digest(grid)), **members)
+    return len(members), kinds.size
+
+
+def grid_digest(grid):
+    """sha1 of the wall cells of a grid; a TiledGrid answers from its store without reading tiles."""
+    if isinstance(grid, TiledGrid):
+        return grid.digest
+    return hashlib.sha1(np.ascontiguousarray(np.asarray(grid) != 0).tobytes()).hexdigest()
+
+
+def dense(grid):
+    """The grid as an in-memory array, for the engines that need every cell (see TiledGrid.dense)."""
+    return grid.dense() if isinstance(grid, TiledGrid) else np.asarray(grid)
+
+# =============================================================
+# === LAZY GRID ===
+# =============================================================
+
+class TiledGrid:
+    """
+    Read-only, array-like view of a tile store. Supports grid.shape,
+    grid[r, c] (negative indices count from the end, like numpy),
+    grid[r0:r1, c0:c1] and np.asarray(grid) / dense() (the whole floor).
+    """
+
+    def __init__(self, path, cache_tiles=CACHE_TILES):
+        self.path = path
+        self._npz = np.load(path)
+        self.shape = tuple(int(n) for n in self._npz["shape"])
+        self.tile = int(self._npz["tile"])
+        self.kinds = self._npz["kinds"]
+        self._kind_rows = self.kinds.tolist() # plain lists: faster scalar lookups
+        self.dtype = np.dtype(np.uint8)
+        self.ndim = 2
+        self.cache_tiles = cache_tiles
+        self._cache = OrderedDict()
+        self._last_key, self._last_tile = None, None
+        self.loads = 0 # tiles read from disk so far
+        self._digest = str(self._npz["digest"]) if "digest" in self._npz.files else None
+
+    @property
+    def digest(self):
+        if self._digest is None: # store written before digests were recorded
+            self._digest = grid_digest(self.dense())
+        return self._digest
+
+    def _tile(self, tr, tc):
+        key = (tr, tc)
+        block = self._cache.get(key)
+        if block is None:
+            block = self._npz[f"t{tr}_{tc}"]
+            self.loads += 1
+            self._cache[key] = block
+            if len(self._cache) > self.cache_tiles:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return block
+
+    def _check(self, i, axis):
+        n = self.shape[axis]
+        if not -n <= i < n:
+            raise IndexError(f"index {i} is out of bounds for axis {axis} with size {n}")
+        return i + n if i < 0 else i
+
+    def __getitem__(self, index):
+        r, c = index
+        try:
+            if not (0 <= r < self.shape[0] and 0 <= c < self.shape[1]):
+                r, c = self._check(r, 0), self._check(c, 1)
+            tr, tc = r // self.tile, c // self.tile
+        except TypeError: # slices
+            return self.window(r, c)
+        kind = self._kind_rows[tr][tc]
+        if kind != MIXED:
+            return kind
+        # Searches mostly stay on one tile between lookups
+        if self._last_key != (tr, tc):
+            self._last_key, self._last_tile = (tr, tc), self._tile(tr, tc)
+        return self._last_tile[r - tr * self.tile, c - tc * self.tile]
+
+    def window(self, rows, cols):
+        """Dense uint8 copy of grid[rows, cols] (slices with step 1), built from tiles."""
+        if not isinstance(rows, slice):
+            rows = self._check(rows, 0)
+        if not isinstance(cols, slice):
+            cols = self._check(cols, 1)
+        r0, r1, _ = rows.indices(self.shape[0]) if isinstance(rows, slice) else (rows, rows + 1, 1)
+        c0, c1, _ = cols.indices(self.shape[1]) if isinstance(cols, slice) else (cols, cols + 1, 1)
+        out = np.zeros((max(r1 - r0, 0), max(c1 - c0, 0)), dtype=np.uint8)
+        t = self.tile
+        for tr in range(r0 // t, -(-r1 // t)):
+            for tc in range(c0 // t, -(-c1 // t)):
+                kind = self._kind_rows[tr][tc]
+                if kind == FREE:
+                    continue
+                # Overlap of this tile with the window, in grid coordinates
+                ar, br = max(r0, tr * t), min(r1, (tr + 1) * t)
+                ac, bc = max(c0, tc * t), min(c1, (tc + 1) * t)
+                dest = out[ar - r0:br - r0, ac - c0:bc - c0]
+                if kind == WALL:
+                    dest[:] = 1
+                else:
+                    dest[:] = self._tile(tr, tc)[ar - tr * t:br - tr * t, ac - tc * t:bc - tc * t]
+        if not isinstance(rows, slice):
+            out = out[0]
+        elif not isinstance(cols, slice):
+            out = out[:, 0]
+        return out
+
+    def dense(self):
+        """
+        Dense uint8 copy of the whole floor. Mixed tiles are read straight from
+        the store, so this neither evicts the tiles lazy lookups keep cached
+        nor counts towards `loads`.
+        """
+        out = np.zeros(self.shape, dtype=np.uint8)
+        t = self.tile
+        for tr, tc in zip(*np.nonzero(self.kinds != FREE)):
+            block = out[tr * t:(tr + 1) * t, tc * t:(tc + 1) * t]
+            block[:] = 1 if self.kinds[tr, tc] == WALL else self._npz[f"t{tr}_{tc}"]
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        grid = self.dense()
+        return grid if dtype is None else grid.astype(dtype)
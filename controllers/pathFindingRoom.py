@@ -3,13 +3,22 @@
 Multi-building, multi-floor pathfinder.py
 """
 
-import sys, os, json
+import sys, os, json, time
+import contextlib
+import itertools
+import hashlib
 import numpy as np
 import heapq
+import queue
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
 from collections import deque
 import matplotlib.pyplot as plt
 from matplotlib import colors as mcolors
 from PIL import Image, ImageDraw # Import Pillow for image overlay
+import visibilityGraph
+import gridTiles
 
 # === CONFIG ===
 BASE_DIR = "floorPlans"
@@ -21,6 +30,30 @@ ALL_BUILDING_DATA = {} # Stores grids, connections, meta, etc. {b_code: {floor_n
 ROOM_COORDS = {}    # {room_id: [(b_code, floor, r, c), ...]}
 STAIRS = {}      # {stair_name: {(b_code, floor): (r, c)}}
 ENTRANCES = {}     # {entrance_label: [(b_code, floor, r, c), ...]}
+PORTALS = {}       # {(b_code, floor, r, c): [(b_code, floor, r, c), ...]} stair + entrance hops
+FACILITY_MAPS = {} # {(b_code, kind): nearest-facility map, see build_facility_map}
+FACILITY_MAP_FILE = "facility_maps.npz" # saved facility maps, see save_facility_maps
+FREE_MASKS = {}    # {(b_code, floor): bool array of walkable cells}, see free_mask
+ROUTE_TABLES = {}  # {b_code: precomputed intra-building routes or None}, see build_route_table
+ROUTE_TABLE_FILE = "route_table.npz"
+SKELETON_GRAPHS = {} # {(b_code, floor): corridor skeleton graph}, see load_skeleton_graph
+SKELETON_FILE = "skeleton_graph.npz"
+VISIBILITY_GRAPHS = {} # {(b_code, floor): DXF visibility graph}, see load_visibility_graph
+VISIBILITY_FILE = "visibility_graph.npz"
+GRID_TILES_FILE = "floorplan_tiles.npz" # chunked grid store, see gridTiles.py
+ANYTIME_EPSILON = 2.5 # first inflation of anytime_astar()
+ANYTIME_STEP = 0.5    # inflation decrease per improvement pass
+CLOSURES = {}        # {closure_id: {"kind": "area" | "portal", ...}}, see close_area / close_portal
+CLOSURE_IDS = itertools.count(1) # never reused, so a reopen cannot free an id for a live closure
+CLOSED_CELLS = {}    # {(b_code, floor): bool array, True where closed} overlay on the grids
+CLOSED_PORTALS = set() # {(src_state, dest_state)} closed stair/entrance hops
+ROUTE_CACHE = {}     # {(start, goal): RoutePlanner}, see lpa_multi_floor
+ROUTE_CACHE_SIZE = 64
+BATCH_IN_FLIGHT = 4  # batch requests queued per worker before reading pauses, see run_batch
+BATCH_POLL_S = 0.05  # longest a finished batch result waits while input is idle
+POOL_POLL_S = 1.0    # how often a blocked RouteWorkerPool.results() checks that the workers are alive
+PYRAMID_FACTORS = (16, 4) # coarse levels tried by pyramid_multi_floor, coarsest first
+CORRIDOR_RADIUS = 1       # coarse cells kept around the coarse path when refining
 
 # =============================================================
 # === DATA LOADING ===
@@ -36,6 +69,8 @@ def load_floor_data(base_dir, building_code):
     direction = building_code[:2]
     building_number = building_code[2:]
     building_dir = os.path.join(base_dir, direction, building_number)
+    # Saved nearest-facility maps; read on the first lookup, see load_facility_map
+    facility_maps_path = os.path.join(building_dir, FACILITY_MAP_FILE)
 
     if not os.path.exists(building_dir):
         raise FileNotFoundError(f"Building directory not found: {building_dir}")
@@ -49,17 +84,22 @@ def load_floor_data(base_dir, building_code):
         
         # Paths
         grid_path = os.path.join(floor_path, "floorplan_grid.npy")
+        tiles_path = os.path.join(floor_path, GRID_TILES_FILE)
         labels_path = os.path.join(floor_path, "labels.json")
         meta_path = os.path.join(floor_path, "meta.json")
         connections_path = os.path.join(floor_path, "connections.json") 
         # Path for the image used in the overlay
         image_path = os.path.join(floor_path, "floorplan_image.png")
 
-        if not os.path.exists(grid_path) or not os.path.exists(labels_path) or not os.path.exists(meta_path):
+        if not (os.path.exists(grid_path) or os.path.exists(tiles_path)) or not os.path.exists(labels_path) or not os.path.exists(meta_path):
             continue
 
-        # Load Grid and Meta
-        grid = np.load(grid_path, allow_pickle=True)
+        # Load Grid (lazily from the tile store unless the .npy is newer) and Meta
+        if os.path.exists(tiles_path) and (not os.path.exists(grid_path)
+                                           or os.path.getmtime(tiles_path) >= os.path.getmtime(grid_path)):
+            grid = gridTiles.TiledGrid(tiles_path)
+        else:
+            grid = np.load(grid_path, allow_pickle=True)
         with open(meta_path, "r") as f:
             meta = json.load(f)
         with open(labels_path, "r") as f:
@@ -120,12 +160,14 @@ def load_floor_data(base_dir, building_code):
         floor_rooms = {}
         floor_stairs = {}
         floor_entrances = {}
+        dxf_points = {} # grid (row, col) -> exact DXF (x, y) of the label
 
         for item in raw_labels:
             label = item["label"].strip().lower()
             gx, gy = item["x"], item["y"]
             row, col = to_grid_coords(gx, gy)
             grid_coords = (row, col)
+            dxf_points[grid_coords] = (gx, gy)
 
             if label.startswith("stairs"):
                 stair_name = label.split()[-1].upper()
@@ -143,13 +185,128 @@ def load_floor_data(base_dir, building_code):
             "stairs": floor_stairs,
             "entrances": floor_entrances,
             "connections": connections,
+            "dxf_points": dxf_points,
             "meta": meta, # Store meta for image coord conversion
             "image_path": image_path, # Store image path
+            "facility_maps": facility_maps_path,
             "to_image_coords": to_image_coords # Store the converter function
         }
-        
+
     return building_data
 
+
+def discover_buildings(base_dir=BASE_DIR):
+    """
+    Lists every building code (e.g. 'sw03') under base_dir that has at least
+    one floor with a generated grid.
+    """
+    codes = []
+    for direction in sorted(os.listdir(base_dir)):
+        direction_dir = os.path.join(base_dir, direction)
+        if not os.path.isdir(direction_dir):
+            continue
+        for number in sorted(os.listdir(direction_dir)):
+            building_dir = os.path.join(direction_dir, number)
+            if not os.path.isdir(building_dir):
+                continue
+            if any(os.path.exists(os.path.join(building_dir, f, name))
+                   for f in os.listdir(building_dir) if f.startswith("F")
+                   for name in ("floorplan_grid.npy", GRID_TILES_FILE)):
+                codes.append(f"{direction}{number}")
+    return codes
+
+
+def load_buildings(building_codes, base_dir=BASE_DIR):
+    """
+    Loads the given buildings into the global lookup tables
+    (ALL_BUILDING_DATA, ROOM_COORDS, STAIRS, ENTRANCES) and rebuilds PORTALS.
+    Raises FileNotFoundError if a building directory is missing.
+    """
+    for b_code in building_codes:
+        if b_code in ALL_BUILDING_DATA:
+            continue
+        print(f"Loading data for building {b_code}...")
+        building_data = load_floor_data(base_dir, b_code)
+
+        building_stairs_merged = {}
+
+        ALL_BUILDING_DATA[b_code] = {}
+        ALL_BUILDING_DATA[b_code]["grids"] = {}
+
+        for floor_num, data in building_data.items():
+
+            # Store data by floor
+            ALL_BUILDING_DATA[b_code][floor_num] = data
+            ALL_BUILDING_DATA[b_code]["grids"][floor_num] = data["grid"]
+
+            # Consolidate stairs into the temporary structure
+            for stair_name, floor_map in data["stairs"].items():
+                building_stairs_merged.setdefault(stair_name, {}).update(floor_map)
+
+            # Consolidate global ROOM_COORDS
+            for room_id, locations in data["rooms"].items():
+                ROOM_COORDS.setdefault(room_id, []).extend(
+                    [(b_code, f, r_coord, c_coord) for f, (r_coord, c_coord) in locations]
+                )
+
+            # Consolidate global ENTRANCES
+            for entrance_label, locations in data["entrances"].items():
+                ENTRANCES.setdefault(entrance_label, []).extend(
+                    [(b_code, f, r_coord, c_coord) for f, (r_coord, c_coord) in locations]
+                )
+
+        # --- Consolidate Merged Stairs into the GLOBAL STAIRS dictionary ---
+        for stair_name, floor_map in building_stairs_merged.items():
+            for floor, (r, c) in floor_map.items():
+                STAIRS.setdefault(stair_name, {})[(b_code, floor)] = (r, c)
+
+    build_portal_index()
+
+
+def build_portal_index():
+    """
+    Precomputes every stair and entrance hop as {source_state: [dest_state, ...]}
+    so neighbors() does a single dict lookup instead of scanning STAIRS and the
+    floor's connections for every expanded cell.
+    """
+    PORTALS.clear()
+    ROUTE_CACHE.clear() # planners keep portal-dependent search state
+
+    # --- 1. Stair connections (Within the same building) ---
+    for stair_name, floor_map in STAIRS.items():
+        for (b_code, floor), pos in floor_map.items():
+            for (other_b_code, other_floor), other_pos in floor_map.items():
+                if other_b_code == b_code and other_floor != floor:
+                    PORTALS.setdefault((b_code, floor, pos[0], pos[1]), []).append(
+                        (b_code, other_floor, other_pos[0], other_pos[1])
+                    )
+
+    # --- 2. Cross-Building Connections (Entrance Portals) ---
+    for b_code, b_data in ALL_BUILDING_DATA.items():
+        for floor in b_data["grids"]:
+            floor_data = b_data[floor]
+            conn_data = floor_data.get("connections", {})
+            if not conn_data:
+                continue
+
+            for i, (current_entrance_label, connected_entrance_label) in enumerate(conn_data.get("connectedEntrances", [])):
+                dest_b_code = conn_data["connectedBuildings"][i]
+                dest_floor_str = conn_data["connectedFloors"][i]
+
+                try:
+                    dest_floor = int(dest_floor_str[1:])
+                except ValueError: continue
+
+                dest_entrance_locs = ENTRANCES.get(connected_entrance_label.lower(), [])
+                dest_point = next(((b, f, row, col) for b, f, row, col in dest_entrance_locs
+                                    if b == dest_b_code and f == dest_floor), None)
+                if not dest_point:
+                    continue
+
+                for entrance_floor, (r, c) in floor_data["entrances"].get(current_entrance_label.lower(), []):
+                    if entrance_floor == floor:
+                        PORTALS.setdefault((b_code, floor, r, c), []).append(dest_point)
+
 # =============================================================
 # === PATHFINDING ALGORITHM ===
 # =============================================================
@@ -165,6 +322,61 @@ def heuristic(a, b):
     
     return abs(r_a - r_b) + abs(c_a - c_b) + 10 * abs(floor_a - floor_b) + building_penalty
 
+
+INF = float('inf')
+
+def goal_lower_bound(goal):
+    """
+    Admissible, consistent alternative to heuristic() for searches that need
+    a real bound (anytime A*, LPA*). Lower bounds for every portal endpoint
+    come from a Dijkstra back from the goal over the endpoints, with Manhattan
+    distance between points on one floor and 1 per hop; a state's bound is
+    the best Manhattan distance to a bounded point on its floor plus that
+    point's bound (INF if its floor cannot reach the goal at all).
+    Closed hops are kept, so the bound stays valid when they reopen.
+    Returns a memoised function state -> bound.
+    """
+    reverse_portals = {}
+    for src, dests in PORTALS.items():
+        for dest in dests:
+            reverse_portals.setdefault(dest, []).append(src)
+    points = {goal} | set(PORTALS) | set(reverse_portals)
+    by_floor = {}
+    for q in points:
+        by_floor.setdefault((q[0], q[1]), []).append(q)
+
+    bound = {goal: 0}
+    open_heap = [(0, 0, goal)]
+    counter = 1
+    done = set()
+    while open_heap:
+        d, _, v = heapq.heappop(open_heap)
+        if v in done:
+            continue
+        done.add(v)
+        moves = [(q, abs(q[2] - v[2]) + abs(q[3] - v[3])) for q in by_floor[(v[0], v[1])]]
+        moves += [(src, 1) for src in reverse_portals.get(v, ())]
+        for q, cost in moves:
+            if d + cost < bound.get(q, INF):
+                bound[q] = d + cost
+                heapq.heappush(open_heap, (d + cost, counter, q)); counter += 1
+
+    anchors = {}
+    for q, d in bound.items():
+        anchors.setdefault((q[0], q[1]), []).append((q[2], q[3], d))
+    cache = {}
+
+    def h(state):
+        # Consistent: a minimum of 1-Lipschitz terms on a floor, and a hop
+        # never lowers the bound by more than its cost of 1
+        if state not in cache:
+            r, c = state[2], state[3]
+            cache[state] = min((abs(r - ar) + abs(c - ac) + d
+                                for ar, ac, d in anchors.get((state[0], state[1]), ())), default=INF)
+        return cache[state]
+
+    return h
+
 def neighbors(state):
     b_code, floor, r, c = state
     
@@ -172,52 +384,28 @@ def neighbors(state):
         return
 
     # --- 1. Same Floor / Same Building (Standard Movement) ---
-    grid = ALL_BUILDING_DATA[b_code]["grids"][floor] 
-    floor_data = ALL_BUILDING_DATA[b_code][floor]
+    grid = ALL_BUILDING_DATA[b_code]["grids"][floor]
     rows, cols = grid.shape
+    closed = CLOSED_CELLS.get((b_code, floor))
 
     for dr, dc in [(-1,0),(1,0),(0,-1),(0,1)]:
         nr, nc = r+dr, c+dc
-        if 0 <= nr < rows and 0 <= nc < cols and grid[nr, nc] == 0:
-            yield (b_code, floor, nr, nc) 
-
-    # --- 2. Stair connections (Within the same building) ---
-    for stair_name, floor_map in STAIRS.items():
-        if floor_map.get((b_code, floor)) == (r, c):
-            for (other_b_code, other_floor), pos in floor_map.items():
-                if other_b_code == b_code and other_floor != floor:
-                    yield (b_code, other_floor, pos[0], pos[1])
+        if 0 <= nr < rows and 0 <= nc < cols and grid[nr, nc] == 0 and (closed is None or not closed[nr, nc]):
+            yield (b_code, floor, nr, nc)
 
-    # --- 3. Cross-Building Connections (Entrance Portals) ---
-    conn_data = floor_data.get("connections", {})
-    
-    if conn_data:
-        for i, (current_entrance_label, connected_entrance_label) in enumerate(conn_data.get("connectedEntrances", [])):
-            
-            entrance_coords_list = floor_data["entrances"].get(current_entrance_label.lower(), [])
-            
-            # Check if the current state's (floor, (r, c)) matches a known entrance coordinate
-            if (floor, (r, c)) in entrance_coords_list:
-                
-                dest_b_code = conn_data["connectedBuildings"][i]
-                dest_floor_str = conn_data["connectedFloors"][i]
-                
-                try:
-                    dest_floor = int(dest_floor_str[1:])
-                except ValueError: continue
-
-                # Look up the destination entrance point in the global ENTRANCES (b_code, floor, r, c)
-                dest_entrance_locs = ENTRANCES.get(connected_entrance_label.lower(), [])
-                
-                dest_point = next(((b, f, row, col) for b, f, row, col in dest_entrance_locs 
-                                    if b == dest_b_code and f == dest_floor), None)
-                
-                if dest_point:
-                    yield dest_point
+    # --- 2. Stair and Entrance Portals (see build_portal_index), minus closed hops ---
+    if CLOSED_PORTALS:
+        yield from (dest for dest in PORTALS.get(state, ()) if (state, dest) not in CLOSED_PORTALS)
+    else:
+        yield from PORTALS.get(state, ())
 
 
-def astar_multi_floor(start, goal):
-    # Implementation of A* search algorithm (Adapted for 4-tuple state)
+def astar_multi_floor(start, goal, budget=None, epsilon=None):
+    # Implementation of A* search algorithm (Adapted for 4-tuple state).
+    # With a time budget (seconds) or a suboptimality bound it runs
+    # anytime_astar() instead; see there.
+    if budget is not None or epsilon is not None:
+        return anytime_astar(start, goal, budget, epsilon)[0]
     open_heap = []
     counter = 0 
     gscore = {start: 0}
@@ -249,6 +437,1325 @@ def astar_multi_floor(start, goal):
                 counter += 1
     return None
 
+def anytime_astar(start, goal, budget=None, epsilon=None):
+    """
+    Anytime Repairing A* (ARA*). Weighted A* with inflation `epsilon`
+    (ANYTIME_EPSILON if None) returns a first route quickly; while the
+    `budget` (seconds, None = unlimited) lasts, the inflation is lowered by
+    ANYTIME_STEP and the route improved, reusing earlier search effort,
+    until it is provably optimal. Uses goal_lower_bound() so bounds are real.
+    The budget covers building that bound too. It never ends the search
+    before a first route is found, so a reachable goal always gets one.
+    Returns (path or None, bound): the path is at most `bound` times longer
+    than the shortest one (INF if the budget ran out before it was bounded);
+    None only if the goal is unreachable.
+    """
+    deadline = time.perf_counter() + budget if budget is not None else None # before the bound's Dijkstra
+    eps = max(ANYTIME_EPSILON if epsilon is None else epsilon, 1.0)
+    h = goal_lower_bound(goal)
+
+    gscore = {start: 0}
+    came_from = {}
+    open_heap = []
+    open_set = set()
+    inconsistent = set()
+    counter = 0
+
+    def push(state):
+        nonlocal counter
+        heapq.heappush(open_heap, (gscore[state] + eps * h(state), counter, state)); counter += 1
+        open_set.add(state)
+
+    def improve_path(closed):
+        # One weighted A* pass; False if the deadline cut it short once the goal was reached
+        expansions = 0
+        while open_heap:
+            f, _, current = open_heap[0]
+            if current not in open_set or f != gscore[current] + eps * h(current):
+                heapq.heappop(open_heap) # stale entry
+                continue
+            if gscore.get(goal, INF) + eps * h(goal) <= f:
+                return True
+            heapq.heappop(open_heap)
+            open_set.discard(current)
+            closed.add(current)
+            expansions += 1
+            if expansions % 256 == 0 and deadline is not None and goal in gscore \
+                    and time.perf_counter() > deadline:
+                return False
+            for neighbor in neighbors(current):
+                tentative_g = gscore[current] + 1
+                if tentative_g < gscore.get(neighbor, INF) and h(neighbor) < INF:
+                    came_from[neighbor] = current
+                    gscore[neighbor] = tentative_g
+                    if neighbor in closed:
+                        inconsistent.add(neighbor)
+                    else:
+                        push(neighbor)
+        return True
+
+    def extract():
+        current = goal
+        path = [current]
+        while current in came_from:
+            current = came_from[current]
+            path.append(current)
+        path.reverse()
+        return path
+
+    push(start)
+    best, bound = None, INF
+    while True:
+        if not improve_path(set()):
+            if best is None:
+                best = extract() # reached, but the pass ran out of time before certifying it
+            break
+        if goal not in gscore:
+            break # unreachable
+        best = extract()
+        # Suboptimality of this route: g(goal) / lowest unexpanded g + h
+        lowest = min((gscore[s] + h(s) for s in open_set | inconsistent), default=INF)
+        bound = max(1.0, min(eps, gscore[goal] / lowest)) if lowest > 0 else eps
+        if bound <= 1.0 or (deadline is not None and time.perf_counter() > deadline):
+            break
+        # Tighten: re-queue the inconsistent states under the smaller inflation
+        eps = max(1.0, eps - ANYTIME_STEP)
+        open_set.update(inconsistent)
+        inconsistent.clear()
+        open_heap = [(gscore[s] + eps * h(s), i, s) for i, s in enumerate(open_set)]
+        heapq.heapify(open_heap)
+        counter = len(open_heap)
+
+    return best, bound
+
+
+def dijkstra_multi_floor(sources, targets, first_only=False):
+    """
+    One-to-many multi-floor Dijkstra. All `sources` start at distance 0 and the
+    search stops as soon as every state in `targets` has been settled, or as
+    soon as any one of them is when first_only=True.
+    Returns: {target_state: distance or None if unreachable}
+    """
+    remaining = set(targets)
+    settled = {}
+    dist = {}
+    open_heap = []
+    counter = 0
+    for s in sources:
+        if dist.get(s, 1) > 0:
+            dist[s] = 0
+            heapq.heappush(open_heap, (0, counter, s)); counter += 1
+
+    while open_heap and remaining:
+        d, _, current = heapq.heappop(open_heap)
+        if current in settled:
+            continue
+        settled[current] = d
+        if current in remaining:
+            remaining.discard(current)
+            if first_only:
+                break
+        for neighbor in neighbors(current):
+            # Same unit cost model as astar_multi_floor
+            nd = d + 1
+            if neighbor not in settled and nd < dist.get(neighbor, float('inf')):
+                dist[neighbor] = nd
+                heapq.heappush(open_heap, (nd, counter, neighbor)); counter += 1
+
+    return {t: settled.get(t) for t in targets}
+
+# =============================================================
+# === WAVEFRONT EXPANSION (numpy) ===
+# =============================================================
+
+def free_mask(b_code, floor):
+    """
+    Boolean walkable-cell mask for a floor (closures applied), computed once per
+    process. Covers the whole floor, so a tiled grid is read in full here: the
+    engines built on it (BFS, wavefront queries, pyramid, skeleton, route
+    tables) are eager; only astar_multi_floor reads tiles lazily.
+    """
+    return _padded_free(b_code, floor)[1:-1, 1:-1]
+
+
+def _padded_free(b_code, floor):
+    # Free mask with a one-cell blocked border, so flat-index neighbours
+    # (i +- 1, i +- width) never need a bounds check.
+    key = (b_code, floor)
+    if key not in FREE_MASKS:
+        grid = ALL_BUILDING_DATA[b_code]["grids"][floor]
+        padded = np.zeros((grid.shape[0] + 2, grid.shape[1] + 2), dtype=bool)
+        padded[1:-1, 1:-1] = gridTiles.dense(grid) == 0
+        if key in CLOSED_CELLS:
+            padded[1:-1, 1:-1] &= ~CLOSED_CELLS[key]
+        FREE_MASKS[key] = padded
+    return FREE_MASKS[key]
+
+
+def _wave_step(front, dist, free, width, k, owner=None):
+    """
+    Advances one BFS wave on a floor. `front` holds the flat (padded) indices
+    of the cells at distance k; every free, unreached 4-neighbour gets k + 1
+    (and, if `owner` is given, its parent's owner). Work is proportional to
+    the frontier, not the floor. Returns the next frontier's indices.
+    """
+    offsets = np.array([-width, width, -1, 1])
+    cand = (front[:, None] + offsets).ravel()
+    keep = free[cand]
+    keep[keep] = dist[cand[keep]] == -1
+    cand = cand[keep]
+    dist[cand] = k + 1
+    if owner is not None:
+        owner[cand] = np.repeat(owner[front], 4)[keep]
+    return np.unique(cand)
+
+
+def wavefront_multi_floor(sources, max_steps=None, goal=None, buildings=None, owners=None, masks=None):
+    """
+    Breadth-first distances from `sources` computed a whole wave at a time:
+    each wave steps every frontier cell of a floor at once with numpy index
+    arithmetic, constrained by the floor's free-cell mask (every move costs 1,
+    so wave k is exactly the set of cells at distance k). Stair and entrance
+    hops from PORTALS are injected between waves.
+
+    max_steps: stop after this many waves. goal: stop once this state is reached.
+    buildings: if given, only expand into these building codes.
+    masks: optional {(b_code, floor): bool array}; expansion is then limited to
+           these floors and to the True cells of their mask.
+    owners: optional list of ints parallel to `sources`; every reached cell is
+            then labelled with the owner of the source it was reached from.
+    Returns: {(b_code, floor): int32 distance array, -1 where unreached}, or
+             (distances, owner_fields) when `owners` is given.
+    """
+    flat_dist = {}  # {(b_code, floor): padded, flattened distances}
+    flat_owner = {} if owners is not None else None
+    frontier = {}   # {(b_code, floor): [flat indices at distance k]}
+
+    def width_of(key):
+        return ALL_BUILDING_DATA[key[0]]["grids"][key[1]].shape[1] + 2
+
+    padded_masks = {}
+    for key, mask in (masks or {}).items():
+        padded = np.zeros((mask.shape[0] + 2, mask.shape[1] + 2), dtype=bool)
+        padded[1:-1, 1:-1] = mask & free_mask(*key)
+        padded_masks[key] = padded.ravel()
+
+    def free_of(key):
+        return padded_masks[key] if masks is not None else _padded_free(*key).ravel()
+
+    floor_portals = {}
+    for (b, f, r, c), dests in PORTALS.items():
+        dests = [d for d in dests if ((b, f, r, c), d) not in CLOSED_PORTALS]
+        floor_portals.setdefault((b, f), []).append((r, c, dests))
+
+    def reach(state, d, fronts, own=-1):
+        b, f, r, c = state
+        key = (b, f)
+        if buildings is not None and b not in buildings:
+            return
+        if masks is not None and key not in masks:
+            return
+        if key not in flat_dist:
+            if b not in ALL_BUILDING_DATA or f not in ALL_BUILDING_DATA[b]["grids"]:
+                return
+            flat_dist[key] = np.full(_padded_free(b, f).size, -1, dtype=np.int32)
+            if flat_owner is not None:
+                flat_owner[key] = np.full(flat_dist[key].shape, -1, dtype=np.int32)
+        i = (r + 1) * width_of(key) + c + 1
+        if flat_dist[key][i] == -1:
+            flat_dist[key][i] = d
+            if flat_owner is not None:
+                flat_owner[key][i] = own
+            fronts.setdefault(key, []).append(i)
+
+    for i, s in enumerate(sources):
+        reach(s, 0, frontier, owners[i] if owners is not None else -1)
+    frontier = {key: np.array(idx) for key, idx in frontier.items()}
+
+    k = 0
+    goal_key = (goal[0], goal[1]) if goal is not None else None
+    while frontier and (max_steps is None or k < max_steps):
+        if goal_key in flat_dist and flat_dist[goal_key][(goal[2] + 1) * width_of(goal_key) + goal[3] + 1] >= 0:
+            break
+
+        injected = {}
+        next_frontier = {}
+        for key, front in frontier.items():
+            dist, width = flat_dist[key], width_of(key)
+            owner = flat_owner[key] if flat_owner is not None else None
+
+            # Portal hops leave from cells settled in this wave
+            for r, c, dests in floor_portals.get(key, ()):
+                i = (r + 1) * width + c + 1
+                if dist[i] == k:
+                    for dest in dests:
+                        reach(dest, k + 1, injected, owner[i] if owner is not None else -1)
+
+            grown = _wave_step(front, dist, free_of(key), width, k, owner)
+            if grown.size:
+                next_frontier[key] = grown
+
+        for key, idx in injected.items():
+            next_frontier[key] = np.union1d(next_frontier.get(key, np.empty(0, dtype=np.int64)), idx)
+        frontier = next_frontier
+        k += 1
+
+    def unpad(key, flat):
+        rows, cols = ALL_BUILDING_DATA[key[0]]["grids"][key[1]].shape
+        return flat.reshape(rows + 2, cols + 2)[1:-1, 1:-1]
+
+    fields = {key: unpad(key, flat) for key, flat in flat_dist.items()}
+    if flat_owner is not None:
+        return fields, {key: unpad(key, flat) for key, flat in flat_owner.items()}
+    return fields
+
+
+def bfs_multi_floor(start, goal):
+    """
+    Breadth-first search engine: runs wavefront_multi_floor() from start until
+    the goal's wave, then walks the distance field back down from the goal
+    (each step to a neighbour or portal source one closer to the start).
+    Gives the same path length as astar_multi_floor. Returns the path or None.
+    """
+    return path_from_field(wavefront_multi_floor([start], goal=goal), goal)
+
+
+def reverse_portal_index():
+    """{dest_state: [source_state, ...]} inverse of PORTALS, without closed hops."""
+    reverse_portals = {}
+    for src, dests in PORTALS.items():
+        for dest in dests:
+            if (src, dest) in CLOSED_PORTALS:
+                continue
+            reverse_portals.setdefault(dest, []).append(src)
+    return reverse_portals
+
+
+def path_from_field(fields, goal, reverse_portals=None):
+    """
+    Recovers a shortest path to `goal` from wavefront_multi_floor() distance
+    fields by stepping to a neighbour or portal source one closer each time.
+    Returns the path (source first) or None if the goal was not reached.
+    """
+    if reverse_portals is None:
+        reverse_portals = reverse_portal_index()
+
+    def dist_of(state):
+        field = fields.get((state[0], state[1]))
+        if field is None:
+            return -1
+        return int(field[state[2], state[3]])
+
+    d = dist_of(goal)
+    if d < 0:
+        return None
+    current = goal
+    path = [current]
+    while d > 0:
+        b_code, floor, r, c = current
+        rows, cols = fields[(b_code, floor)].shape
+        candidates = [(b_code, floor, r + dr, c + dc) for dr, dc in [(-1,0),(1,0),(0,-1),(0,1)]
+                      if 0 <= r + dr < rows and 0 <= c + dc < cols]
+        candidates += reverse_portals.get(current, [])
+        # Cell moves only enter free cells, so a non-free `current` was reached by a portal
+        if not free_mask(b_code, floor)[r, c]:
+            candidates = reverse_portals.get(current, [])
+        current = next(p for p in candidates if dist_of(p) == d - 1)
+        path.append(current)
+        d -= 1
+    path.reverse()
+    return path
+
+
+# =============================================================
+# === COARSE-TO-FINE PYRAMID ===
+# =============================================================
+
+def search_pyramid(b_code, floor):
+    """
+    Downsampled free masks for a floor, {factor: bool array}, one per
+    PYRAMID_FACTORS entry. A coarse cell is free only if every fine cell in
+    its factor x factor block is free, so a coarse route never crosses a wall.
+    Built once and stored in the floor data.
+    """
+    floor_data = ALL_BUILDING_DATA[b_code][floor]
+    if "pyramid" not in floor_data:
+        free = free_mask(b_code, floor)
+        levels = {}
+        for factor in PYRAMID_FACTORS:
+            rows, cols = -(-free.shape[0] // factor), -(-free.shape[1] // factor)
+            blocks = np.zeros((rows * factor, cols * factor), dtype=bool)
+            blocks[:free.shape[0], :free.shape[1]] = free
+            levels[factor] = blocks.reshape(rows, factor, cols, factor).all(axis=(1, 3))
+        floor_data["pyramid"] = levels
+    return floor_data["pyramid"]
+
+
+def _coarse_route(start, goal, factor):
+    """
+    A* on the `factor` pyramid level. Cells holding the start, the goal or a
+    portal endpoint count as free so stairs and entrances stay usable.
+    Costs are in fine cells (a coarse step costs `factor`, a portal hop 1).
+    Returns the coarse states (b_code, floor, R, C) along the route, or None.
+    """
+    def coarse(state):
+        return (state[0], state[1], state[2] // factor, state[3] // factor)
+
+    portals = {}
+    for src, dests in PORTALS.items():
+        portals.setdefault(coarse(src), []).extend(coarse(d) for d in dests if (src, d) not in CLOSED_PORTALS)
+    forced = set(portals) | {coarse(d) for dests in portals.values() for d in dests}
+    forced |= {coarse(start), coarse(goal)}
+
+    def fine(state):
+        return (state[0], state[1], state[2] * factor, state[3] * factor)
+
+    c_start, c_goal = coarse(start), coarse(goal)
+    gscore = {c_start: 0}
+    came_from = {}
+    closed = set()
+    open_heap = [(heuristic(start, goal), 0, c_start)]
+    counter = 1
+    while open_heap:
+        _, _, current = heapq.heappop(open_heap)
+        if current in closed:
+            continue
+        if current == c_goal:
+            route = [current]
+            while current in came_from:
+                current = came_from[current]
+                route.append(current)
+            return route[::-1]
+        closed.add(current)
+
+        b_code, floor, R, C = current
+        if b_code not in ALL_BUILDING_DATA or floor not in ALL_BUILDING_DATA[b_code]["grids"]:
+            continue
+        level = search_pyramid(b_code, floor)[factor]
+        moves = [((b_code, floor, R + dr, C + dc), factor) for dr, dc in [(-1,0),(1,0),(0,-1),(0,1)]
+                 if 0 <= R + dr < level.shape[0] and 0 <= C + dc < level.shape[1]
+                 and (level[R + dr, C + dc] or (b_code, floor, R + dr, C + dc) in forced)]
+        moves += [(dest, 1) for dest in portals.get(current, ())]
+        for nxt, cost in moves:
+            g = gscore[current] + cost
+            if nxt not in closed and g < gscore.get(nxt, float('inf')):
+                gscore[nxt] = g
+                came_from[nxt] = current
+                heapq.heappush(open_heap, (g + heuristic(fine(nxt), goal), counter, nxt)); counter += 1
+    return None
+
+
+def _corridor_masks(route, factor, radius=CORRIDOR_RADIUS):
+    """Fine-grid masks of the coarse route's cells grown by `radius` coarse cells, per floor."""
+    masks = {}
+    for b_code, floor, R, C in route:
+        key = (b_code, floor)
+        if key not in masks:
+            masks[key] = np.zeros(search_pyramid(b_code, floor)[factor].shape, dtype=bool)
+        masks[key][max(R - radius, 0):R + radius + 1, max(C - radius, 0):C + radius + 1] = True
+
+    for key, coarse in masks.items():
+        rows, cols = ALL_BUILDING_DATA[key[0]]["grids"][key[1]].shape
+        masks[key] = np.repeat(np.repeat(coarse, factor, axis=0), factor, axis=1)[:rows, :cols]
+    return masks
+
+
+def _corridor_exit_bound(fields, masks, h):
+    """
+    Lower bound on any route that leaves the corridor: over every free cell
+    just outside a mask next to a reached corridor cell (and every portal hop
+    out of the corridor), the corridor distance + 1 + h() from there.
+    """
+    best = INF
+    exits = []
+    for key, mask in masks.items():
+        dist = fields.get(key)
+        if dist is None:
+            continue
+        rows, cols = dist.shape
+        outside = free_mask(*key) & ~mask
+        for dr, dc in [(-1,0),(1,0),(0,-1),(0,1)]:
+            # inner[r, c] is the corridor cell, outer[r, c] its neighbour (r + dr, c + dc)
+            inner = dist[max(-dr, 0):rows - max(dr, 0), max(-dc, 0):cols - max(dc, 0)]
+            outer = outside[max(dr, 0):rows - max(-dr, 0), max(dc, 0):cols - max(-dc, 0)]
+            rr, cc = np.nonzero(outer & (inner >= 0))
+            exits += [(int(d) + 1, (key[0], key[1], r + max(dr, 0), c + max(dc, 0)))
+                      for d, r, c in zip(inner[rr, cc].tolist(), rr.tolist(), cc.tolist())]
+    for (b, f, r, c), dests in PORTALS.items():
+        d = int(fields[(b, f)][r, c]) if (b, f) in fields else -1
+        if d >= 0:
+            exits += [(d + 1, dest) for dest in dests if ((b, f, r, c), dest) not in CLOSED_PORTALS
+                      and not ((dest[0], dest[1]) in masks and masks[(dest[0], dest[1])][dest[2], dest[3]])]
+    for d, state in sorted(exits):
+        if d >= best:
+            break
+        best = min(best, d + h(state))
+    return best
+
+
+def pyramid_multi_floor(start, goal):
+    """
+    Coarse-to-fine search engine: finds a route on the coarsest pyramid level
+    that connects start and goal, then runs the BFS wavefront on the fine grid
+    restricted to a corridor around it. The corridor's route is kept only if
+    goal_lower_bound() shows that no route leaving the corridor can be
+    shorter; otherwise the next finer level is tried, and finally a full
+    bfs_multi_floor. Paths are therefore shortest ones; the saving comes when
+    the corridor already holds one, which on floors with narrow passages
+    (closed at coarse levels) is often not the case.
+    """
+    h = goal_lower_bound(goal)
+    for factor in PYRAMID_FACTORS:
+        route = _coarse_route(start, goal, factor)
+        if route is None:
+            continue
+        masks = _corridor_masks(route, factor)
+        fields = wavefront_multi_floor([start], goal=goal, masks=masks)
+        path = path_from_field(fields, goal)
+        if path and _corridor_exit_bound(fields, masks, h) >= len(path) - 1:
+            return path
+    return bfs_multi_floor(start, goal)
+
+
+# =============================================================
+# === CORRIDOR SKELETON GRAPH ===
+# =============================================================
+
+_EIGHT = [(-1,0),(1,0),(0,-1),(0,1),(-1,-1),(-1,1),(1,-1),(1,1)]
+
+def thin_free_space(free):
+    """
+    Zhang-Suen thinning of a free-space mask down to its one-pixel medial
+    skeleton, with each sub-iteration done as whole-array numpy operations.
+    """
+    img = np.pad(free, 1).astype(np.uint8)
+    while True:
+        changed = False
+        for sub_iteration in (0, 1):
+            P2, P3, P4 = img[:-2, 1:-1], img[:-2, 2:], img[1:-1, 2:]
+            P5, P6, P7 = img[2:, 2:], img[2:, 1:-1], img[2:, :-2]
+            P8, P9 = img[1:-1, :-2], img[:-2, :-2]
+            ring = [P2, P3, P4, P5, P6, P7, P8, P9, P2]
+
+            B = sum(p.astype(np.int8) for p in ring[:-1])
+            A = sum(((ring[i] == 0) & (ring[i + 1] == 1)).astype(np.int8) for i in range(8))
+            if sub_iteration == 0:
+                side = ((P2 & P4 & P6) == 0) & ((P4 & P6 & P8) == 0)
+            else:
+                side = ((P2 & P4 & P8) == 0) & ((P2 & P6 & P8) == 0)
+
+            remove = (img[1:-1, 1:-1] == 1) & (B >= 2) & (B <= 6) & (A == 1) & side
+            if remove.any():
+                img[1:-1, 1:-1][remove] = 0
+                changed = True
+        if not changed:
+            return img[1:-1, 1:-1].astype(bool)
+
+
+def _skeleton_adjacency(skeleton, free):
+    # m-adjacency: 8-connected skeleton neighbours, but a diagonal only when no
+    # orthogonal skeleton pixel already links the two (avoids 3-pixel triangles
+    # turning every staircase into junctions), and never squeezing between two
+    # wall cells (cv2 draws walls 8-connected, so that would cross a wall).
+    rows, cols = skeleton.shape
+    adj = {}
+    for r, c in zip(*np.nonzero(skeleton)):
+        r, c = int(r), int(c)
+        nbrs = []
+        for dr, dc in _EIGHT:
+            nr, nc = r + dr, c + dc
+            if not (0 <= nr < rows and 0 <= nc < cols) or not skeleton[nr, nc]:
+                continue
+            if dr and dc and (skeleton[r + dr, c] or skeleton[r, c + dc]
+                              or not (free[r + dr, c] or free[r, c + dc])):
+                continue
+            nbrs.append((nr, nc))
+        adj[(r, c)] = nbrs
+    return adj
+
+
+def build_skeleton_graph(b_code, floor):
+    """
+    Extracts the medial-axis skeleton of a floor's free space and collapses it
+    into a sparse graph: junction and end pixels become nodes, the pixel chains
+    between them become edges (diagonal steps cost 2 grid moves, straight 1).
+    Returns: {"digest", "nodes": (k, 2), "edges": (e, 3) [u, v, length],
+              "chain_offsets": (e + 1,), "chain_pixels": (m, 2)}
+    """
+    free = free_mask(b_code, floor)
+    skeleton = thin_free_space(free)
+    adj = _skeleton_adjacency(skeleton, free)
+
+    keys = [p for p, nbrs in adj.items() if len(nbrs) != 2]
+    node_id = {p: i for i, p in enumerate(keys)}
+    seen_interior = set()
+    used = set()
+    edges, chains = [], []
+
+    def trace(start, nxt):
+        chain, prev, cur = [start, nxt], start, nxt
+        while cur not in node_id:
+            seen_interior.add(cur)
+            a, b = adj[cur]
+            prev, cur = cur, (b if a == prev else a)
+            chain.append(cur)
+        return chain
+
+    def trace_all(start):
+        for nxt in adj[start]:
+            if (start, nxt) in used:
+                continue
+            chain = trace(start, nxt)
+            used.add((start, nxt)); used.add((chain[-1], chain[-2]))
+            length = sum(2 if (p[0] != q[0] and p[1] != q[1]) else 1 for p, q in zip(chain, chain[1:]))
+            edges.append((node_id[chain[0]], node_id[chain[-1]], length))
+            chains.append(chain)
+
+    for p in keys:
+        trace_all(p)
+    # Closed loops have no junction or end pixel; promote one pixel per loop
+    for p in adj:
+        if p not in node_id and p not in seen_interior:
+            node_id[p] = len(keys); keys.append(p)
+            trace_all(p)
+
+    offsets = np.cumsum([0] + [len(chain) for chain in chains]).astype(np.int64)
+    pixels = [p for chain in chains for p in chain]
+    return {
+        "digest": hashlib.sha1(np.ascontiguousarray(free).tobytes()).hexdigest(),
+        "nodes": np.array(keys, dtype=np.int32).reshape(-1, 2),
+        "edges": np.array(edges, dtype=np.int32).reshape(-1, 3),
+        "chain_offsets": offsets,
+        "chain_pixels": np.array(pixels, dtype=np.int32).reshape(-1, 2),
+    }
+
+
+def _skeleton_path(b_code, floor, base_dir=BASE_DIR):
+    return os.path.join(base_dir, b_code[:2], b_code[2:], f"F{floor}", SKELETON_FILE)
+
+
+def save_skeleton_graph(b_code, floor, base_dir=BASE_DIR):
+    """Builds a floor's skeleton graph and stores it as <floor>/skeleton_graph.npz."""
+    graph = build_skeleton_graph(b_code, floor)
+    out_path = _skeleton_path(b_code, floor, base_dir)
+    np.savez_compressed(out_path, **{k: (np.array(v) if k == "digest" else v) for k, v in graph.items()})
+    print(f"Saved skeleton graph for {b_code} F{floor} ({len(graph['nodes'])} nodes, "
+          f"{len(graph['edges'])} edges) to {out_path}")
+    SKELETON_GRAPHS.pop((b_code, floor), None)
+    return out_path
+
+
+def load_skeleton_graph(b_code, floor, base_dir=BASE_DIR):
+    """
+    A floor's skeleton graph with its lookup indexes, read from
+    skeleton_graph.npz if it matches the current grid, else built in memory.
+    Cached in SKELETON_GRAPHS.
+    """
+    key = (b_code, floor)
+    if key in SKELETON_GRAPHS:
+        return SKELETON_GRAPHS[key]
+
+    graph = None
+    path = _skeleton_path(b_code, floor, base_dir)
+    digest = hashlib.sha1(np.ascontiguousarray(free_mask(b_code, floor)).tobytes()).hexdigest()
+    if os.path.exists(path):
+        with np.load(path) as data:
+            graph = {k: data[k] for k in data.files}
+        if str(graph["digest"]) != digest:
+            print(f"Warning: Ignoring stale skeleton graph {path}")
+            graph = None
+    if graph is None:
+        graph = build_skeleton_graph(b_code, floor)
+
+    # --- Lookup indexes ---
+    graph["node_id"] = {(int(r), int(c)): i for i, (r, c) in enumerate(graph["nodes"])}
+    graph["adj"] = {}
+    graph["on_edge"] = {} # interior pixel -> (edge, position in chain)
+    graph["chain_cost"] = []
+    offsets, pixels = graph["chain_offsets"], graph["chain_pixels"]
+    for e, (u, v, length) in enumerate(graph["edges"].tolist()):
+        graph["adj"].setdefault(u, []).append((v, e, length))
+        graph["adj"].setdefault(v, []).append((u, e, length))
+        chain = pixels[offsets[e]:offsets[e + 1]]
+        steps = np.where((np.diff(chain, axis=0) != 0).all(axis=1), 2, 1)
+        graph["chain_cost"].append(np.concatenate([[0], np.cumsum(steps)]))
+        for pos in range(1, len(chain) - 1):
+            graph["on_edge"].setdefault((int(chain[pos][0]), int(chain[pos][1])), (e, pos))
+    graph["attach"] = {}
+
+    SKELETON_GRAPHS[key] = graph
+    return graph
+
+
+def _chain(graph, e, i, j):
+    # Pixels of edge e from chain position i to j (inclusive, either direction)
+    pixels = graph["chain_pixels"][graph["chain_offsets"][e]:graph["chain_offsets"][e + 1]]
+    step = 1 if j >= i else -1
+    return [(int(r), int(c)) for r, c in pixels[i:j + step if j + step >= 0 else None:step]]
+
+
+def _attach_to_skeleton(graph, state):
+    """
+    Links a grid state to the skeleton: BFS over free cells to the nearest
+    skeleton pixel. Returns (pixel, cells from state to pixel, cost) or None.
+    Memoised per graph.
+    """
+    if state in graph["attach"]:
+        return graph["attach"][state]
+
+    b_code, floor, r, c = state
+    free = free_mask(b_code, floor)
+    rows, cols = free.shape
+    came_from = {(r, c): None}
+    q = deque([(r, c)])
+    found = None
+    while q:
+        cell = q.popleft()
+        if cell in graph["node_id"] or cell in graph["on_edge"]:
+            found = cell
+            break
+        for dr, dc in [(-1,0),(1,0),(0,-1),(0,1)]:
+            nxt = (cell[0] + dr, cell[1] + dc)
+            if 0 <= nxt[0] < rows and 0 <= nxt[1] < cols and free[nxt] and nxt not in came_from:
+                came_from[nxt] = cell
+                q.append(nxt)
+
+    result = None
+    if found:
+        cells = [found]
+        while came_from[cells[-1]] is not None:
+            cells.append(came_from[cells[-1]])
+        cells.reverse()
+        result = (found, cells, len(cells) - 1)
+    graph["attach"][state] = result
+    return result
+
+
+def skeleton_multi_floor(start, goal):
+    """
+    Skeleton-graph search engine: routes along corridor centre lines.
+    start, goal and every portal endpoint are attached to their floor's
+    skeleton; Dijkstra then runs over skeleton nodes plus those terminals and
+    the chosen links are expanded back into grid cells. Returns the path or None.
+    """
+    terminals = {start, goal}
+    for src, dests in PORTALS.items():
+        terminals.add(src)
+        terminals.update(dests)
+
+    # Per floor: terminals sitting on each skeleton node / edge
+    at_node, on_edge = {}, {}
+    attach = {}
+    for t in terminals:
+        if t[0] not in ALL_BUILDING_DATA or t[1] not in ALL_BUILDING_DATA[t[0]]["grids"]:
+            continue
+        graph = load_skeleton_graph(t[0], t[1])
+        a = _attach_to_skeleton(graph, t)
+        if a is None:
+            continue
+        attach[t] = a
+        pixel = a[0]
+        if pixel in graph["node_id"]:
+            at_node.setdefault((t[0], t[1], graph["node_id"][pixel]), []).append(t)
+        else:
+            e, pos = graph["on_edge"][pixel]
+            on_edge.setdefault((t[0], t[1], e), []).append((t, pos))
+
+    def cells(b_code, floor, pixels):
+        return [(b_code, floor, r, c) for r, c in pixels]
+
+    def terminal_links(t):
+        # (neighbour, cost, cells after t up to and including the neighbour)
+        b_code, floor = t[0], t[1]
+        graph = load_skeleton_graph(b_code, floor)
+        pixel, lead, cost = attach[t]
+        lead = cells(b_code, floor, lead[1:])
+        if pixel in graph["node_id"]:
+            u = graph["node_id"][pixel]
+            yield ("node", b_code, floor, u), cost, lead
+            for other in at_node.get((b_code, floor, u), []):
+                if other != t:
+                    o_pixel, o_lead, o_cost = attach[other]
+                    yield other, cost + o_cost, lead + cells(b_code, floor, o_lead[::-1][1:])
+        else:
+            e, pos = graph["on_edge"][pixel]
+            u, v, _ = graph["edges"][e].tolist()
+            cum = graph["chain_cost"][e]
+            last = len(cum) - 1
+            yield ("node", b_code, floor, u), cost + int(cum[pos]), lead + cells(b_code, floor, _chain(graph, e, pos, 0)[1:])
+            yield ("node", b_code, floor, v), cost + int(cum[last] - cum[pos]), lead + cells(b_code, floor, _chain(graph, e, pos, last)[1:])
+            for other, o_pos in on_edge.get((b_code, floor, e), []):
+                if other != t:
+                    o_pixel, o_lead, o_cost = attach[other]
+                    yield other, cost + abs(int(cum[o_pos] - cum[pos])) + o_cost, \
+                        lead + cells(b_code, floor, _chain(graph, e, pos, o_pos)[1:] + o_lead[::-1][1:])
+        for dest in PORTALS.get(t, ()):
+            if dest in attach:
+                yield dest, 1, [dest]
+
+    def node_links(node):
+        _, b_code, floor, u = node
+        graph = load_skeleton_graph(b_code, floor)
+        for v, e, length in graph["adj"].get(u, []):
+            chain_len = len(graph["chain_cost"][e]) - 1
+            forward = graph["edges"][e][0] == u
+            pixels = _chain(graph, e, 0, chain_len) if forward else _chain(graph, e, chain_len, 0)
+            yield ("node", b_code, floor, v), length, cells(b_code, floor, pixels[1:])
+            for t, pos in on_edge.get((b_code, floor, e), []):
+                cum = graph["chain_cost"][e]
+                t_pixel, t_lead, t_cost = attach[t]
+                if forward:
+                    yield t, int(cum[pos]) + t_cost, cells(b_code, floor, _chain(graph, e, 0, pos)[1:] + t_lead[::-1][1:])
+                else:
+                    yield t, int(cum[chain_len] - cum[pos]) + t_cost, cells(b_code, floor, _chain(graph, e, chain_len, pos)[1:] + t_lead[::-1][1:])
+        for t in at_node.get((b_code, floor, u), []):
+            t_pixel, t_lead, t_cost = attach[t]
+            yield t, t_cost, cells(b_code, floor, t_lead[::-1][1:])
+
+    if start not in attach or goal not in attach:
+        return None
+
+    dist = {start: 0}
+    came_from = {}
+    settled = set()
+    open_heap = [(0, 0, start)]
+    counter = 1
+    while open_heap:
+        d, _, current = heapq.heappop(open_heap)
+        if current in settled:
+            continue
+        if current == goal:
+            path = [goal]
+            node = goal
+            segments = []
+            while node in came_from:
+                prev, segment = came_from[node]
+                segments.append(segment)
+                node = prev
+            path = [start]
+            for segment in reversed(segments):
+                for state in segment:
+                    last = path[-1]
+                    # A diagonal chain step costs 2: walk it through its free corner
+                    # (_skeleton_adjacency only links diagonals that have one)
+                    if last[:2] == state[:2] and last[2] != state[2] and last[3] != state[3]:
+                        corner = (last[0], last[1], state[2], last[3])
+                        if not free_mask(state[0], state[1])[state[2], last[3]]:
+                            corner = (last[0], last[1], last[2], state[3])
+                        path.append(corner)
+                    path.append(state)
+            return path
+        settled.add(current)
+        links = node_links(current) if current[0] == "node" else terminal_links(current)
+        for nxt, cost, segment in links:
+            nd = d + cost
+            if nxt not in settled and nd < dist.get(nxt, float('inf')):
+                dist[nxt] = nd
+                came_from[nxt] = (current, segment)
+                heapq.heappush(open_heap, (nd, counter, nxt)); counter += 1
+    return None
+
+
+# =============================================================
+# === DXF VISIBILITY GRAPH ===
+# =============================================================
+
+def _floor_dir(b_code, floor, base_dir=BASE_DIR):
+    return os.path.join(base_dir, b_code[:2], b_code[2:], f"F{floor}")
+
+
+def save_visibility_graph(b_code, floor, base_dir=BASE_DIR):
+    """
+    Builds a floor's visibility graph from its cleaned.dxf, anchored at the
+    floor's label points, and stores it, with the wall segments, as
+    <floor>/visibility_graph.npz.
+    """
+    dxf_path = os.path.join(_floor_dir(b_code, floor, base_dir), "cleaned.dxf")
+    segments = visibilityGraph.load_wall_segments(dxf_path)
+    graph = visibilityGraph.build_visibility_graph(segments, _visibility_anchors(b_code, floor))
+    out_path = os.path.join(_floor_dir(b_code, floor, base_dir), VISIBILITY_FILE)
+    np.savez_compressed(out_path, digest=np.array(_visibility_digest(b_code, floor, dxf_path)),
+                        segments=segments, **graph)
+    print(f"Saved visibility graph for {b_code} F{floor} ({len(graph['nodes'])} nodes, "
+          f"{len(graph['edges'])} edges) to {out_path}")
+    VISIBILITY_GRAPHS.pop((b_code, floor), None)
+    return out_path
+
+
+def _visibility_anchors(b_code, floor):
+    # Label points: where routes start and end
+    return sorted(ALL_BUILDING_DATA[b_code][floor].get("dxf_points", {}).values())
+
+
+def _visibility_digest(b_code, floor, path):
+    # Changes with the DXF, the floor's labels or the graph parameters
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(repr((visibilityGraph.CLEARANCE, visibilityGraph.MAX_EDGE, visibilityGraph.WALL_SPACING,
+                        visibilityGraph.MIN_TURN_DEG, _visibility_anchors(b_code, floor))).encode())
+    return digest.hexdigest()
+
+
+def load_visibility_graph(b_code, floor, base_dir=BASE_DIR):
+    """
+    A floor's visibility graph (nodes, edges, wall index) from
+    visibility_graph.npz. Building one takes tens of seconds, so it is never
+    done here: returns None, with a warning, if the file is missing or stale
+    (run --build-visibility-graphs). Cached.
+    """
+    key = (b_code, floor)
+    if key in VISIBILITY_GRAPHS:
+        return VISIBILITY_GRAPHS[key]
+
+    dxf_path = os.path.join(_floor_dir(b_code, floor, base_dir), "cleaned.dxf")
+    npz_path = os.path.join(_floor_dir(b_code, floor, base_dir), VISIBILITY_FILE)
+    graph = None
+    if os.path.exists(npz_path):
+        with np.load(npz_path) as data:
+            graph = {k: data[k] for k in data.files}
+        if os.path.exists(dxf_path) and str(graph["digest"]) != _visibility_digest(b_code, floor, dxf_path):
+            print(f"Warning: Ignoring stale visibility graph {npz_path}; rebuild it with --build-visibility-graphs")
+            graph = None
+    elif os.path.exists(dxf_path):
+        print(f"Warning: No visibility graph for {b_code} F{floor}; build it with --build-visibility-graphs")
+    if graph is None:
+        VISIBILITY_GRAPHS[key] = None
+        return None
+
+    graph["index"] = visibilityGraph.SegmentIndex(graph["segments"])
+    graph["adj"] = {}
+    for i, j, length in graph["edges"].tolist():
+        graph["adj"].setdefault(int(i), []).append((int(j), length))
+        graph["adj"].setdefault(int(j), []).append((int(i), length))
+    graph["attach"] = {}
+    VISIBILITY_GRAPHS[key] = graph
+    return graph
+
+
+def state_to_dxf(state):
+    """DXF (x, y) of a grid state: the exact label point if it is one, else the cell centre."""
+    b_code, floor, r, c = state
+    floor_data = ALL_BUILDING_DATA[b_code][floor]
+    if (r, c) in floor_data.get("dxf_points", {}):
+        return floor_data["dxf_points"][(r, c)]
+    meta = floor_data["meta"]
+    return (meta["min_x"] + (c + 0.5) * meta["cell_size"], meta["max_y"] - (r + 0.5) * meta["cell_size"])
+
+
+def dxf_to_state(b_code, floor, x, y):
+    """Grid state containing DXF point (x, y), clamped to the grid."""
+    meta = ALL_BUILDING_DATA[b_code][floor]["meta"]
+    rows, cols = ALL_BUILDING_DATA[b_code]["grids"][floor].shape
+    r = min(max(int((meta["max_y"] - y) / meta["cell_size"]), 0), rows - 1)
+    c = min(max(int((x - meta["min_x"]) / meta["cell_size"]), 0), cols - 1)
+    return (b_code, floor, r, c)
+
+
+def visibility_route_dxf(start, goal):
+    """
+    Routes in DXF coordinates over the floors' visibility graphs. start, goal
+    and every portal endpoint are linked to the graph nodes they can see;
+    stair/entrance hops cost one cell. Dijkstra picks the shortest polyline.
+    Returns ([(b_code, floor, x, y), ...], length) or None.
+    """
+    terminals = {start, goal}
+    for src, dests in PORTALS.items():
+        terminals.add(src)
+        terminals.update(dests)
+
+    points = {}   # terminal -> DXF point
+    links = {}    # terminal -> [(node index, distance)]
+    seen_by = {}  # (b_code, floor, node) -> [(terminal, distance)]
+    for t in terminals:
+        if t[0] not in ALL_BUILDING_DATA or t[1] not in ALL_BUILDING_DATA[t[0]]["grids"]:
+            continue
+        graph = load_visibility_graph(t[0], t[1])
+        if graph is None:
+            continue
+        points[t] = state_to_dxf(t)
+        if t not in graph["attach"]:
+            idx, dists = visibilityGraph.visible_nodes(graph["index"], graph["nodes"], points[t])
+            graph["attach"][t] = list(zip(idx.tolist(), dists.tolist()))
+        links[t] = graph["attach"][t]
+        for i, d in links[t]:
+            seen_by.setdefault((t[0], t[1], i), []).append((t, d))
+
+    if start not in points or goal not in points:
+        return None
+
+    def point_of(key):
+        if key[0] == "vnode":
+            x, y = VISIBILITY_GRAPHS[(key[1], key[2])]["nodes"][key[3]]
+            return (key[1], key[2], float(x), float(y))
+        return (key[0], key[1]) + tuple(points[key])
+
+    def expand(key):
+        if key[0] == "vnode":
+            _, b_code, floor, i = key
+            for j, length in VISIBILITY_GRAPHS[(b_code, floor)]["adj"].get(i, []):
+                yield ("vnode", b_code, floor, j), length
+            for t, d in seen_by.get((b_code, floor, i), []):
+                yield t, d
+            return
+        b_code, floor = key[0], key[1]
+        for i, d in links[key]:
+            yield ("vnode", b_code, floor, i), d
+        # Direct sight line to another terminal on the same floor
+        same_floor = [t for t in points if t != key and t[0] == b_code and t[1] == floor]
+        if same_floor:
+            here = np.array(points[key])
+            targets = np.array([points[t] for t in same_floor])
+            blocked = VISIBILITY_GRAPHS[(b_code, floor)]["index"].blocked(here, targets, visibilityGraph.CLEARANCE)
+            for t, target, b in zip(same_floor, targets, blocked):
+                if not b:
+                    yield t, float(np.hypot(*(target - here)))
+        cell = ALL_BUILDING_DATA[b_code][floor]["meta"]["cell_size"]
+        for dest in PORTALS.get(key, ()):
+            if dest in points:
+                yield dest, cell
+
+    dist = {start: 0.0}
+    came_from = {}
+    settled = set()
+    open_heap = [(0.0, 0, start)]
+    counter = 1
+    while open_heap:
+        d, _, current = heapq.heappop(open_heap)
+        if current in settled:
+            continue
+        if current == goal:
+            route = [point_of(current)]
+            while current in came_from:
+                current = came_from[current]
+                route.append(point_of(current))
+            return route[::-1], d
+        settled.add(current)
+        for nxt, cost in expand(current):
+            nd = d + cost
+            if nxt not in settled and nd < dist.get(nxt, float('inf')):
+                dist[nxt] = nd
+                came_from[nxt] = current
+                heapq.heappush(open_heap, (nd, counter, nxt)); counter += 1
+    return None
+
+
+def visibility_multi_floor(start, goal):
+    """
+    Visibility-graph search engine: visibility_route_dxf() with its DXF
+    polyline mapped back onto grid states for saving and drawing.
+    """
+    for b_code, floor, _, _ in (start, goal):
+        if load_visibility_graph(b_code, floor) is None:
+            raise LookupError(f"Error: No visibility graph for {b_code} F{floor} "
+                              "(build it with --build-visibility-graphs).")
+    found = visibility_route_dxf(start, goal)
+    if not found:
+        return None
+    route = found[0]
+    path = [start]
+    for (b1, f1, x1, y1), (b2, f2, x2, y2) in zip(route, route[1:]):
+        if (b1, f1) != (b2, f2):
+            path.append(dxf_to_state(b2, f2, x2, y2) if (x2, y2) != tuple(state_to_dxf(goal)) else goal)
+            continue
+        # Walk the straight leg cell by cell (4-connected) so steps stay unit moves
+        cell = ALL_BUILDING_DATA[b1][f1]["meta"]["cell_size"]
+        samples = max(2, int(np.hypot(x2 - x1, y2 - y1) / cell * 4) + 2)
+        for t in np.linspace(0.0, 1.0, samples)[1:]:
+            state = dxf_to_state(b1, f1, x1 + (x2 - x1) * t, y1 + (y2 - y1) * t)
+            last = path[-1]
+            if state == last:
+                continue
+            if last[0:2] == state[0:2] and last[2] != state[2] and last[3] != state[3]:
+                path.append((last[0], last[1], state[2], last[3]))
+            path.append(state)
+    if path[-1] != goal:
+        path.append(goal)
+    return path
+
+
+# =============================================================
+# === CLOSURES AND INCREMENTAL REPLANNING ===
+# =============================================================
+
+def close_area(b_code, floor, r0, c0, r1, c1, closure_id=None):
+    """
+    Closes the grid rectangle rows r0..r1, cols c0..c1 (inclusive) on a floor
+    until reopen(closure_id). The grid itself is untouched: the closure lives
+    in an overlay mask that neighbors(), the wavefront, line-of-sight checks
+    and route-table lookups all consult. (The skeleton and visibility engines
+    route over prebuilt graphs and only see portal closures.)
+    Returns the closure id; an explicit closure_id already in use raises ValueError.
+    """
+    _check_closure_id(closure_id)
+    if b_code not in ALL_BUILDING_DATA or floor not in ALL_BUILDING_DATA[b_code]["grids"]:
+        raise LookupError(f"Error: Unknown floor {b_code} F{floor}.")
+    rows, cols = ALL_BUILDING_DATA[b_code]["grids"][floor].shape
+    r0, r1 = sorted((min(max(r0, 0), rows - 1), min(max(r1, 0), rows - 1)))
+    c0, c1 = sorted((min(max(c0, 0), cols - 1), min(max(c1, 0), cols - 1)))
+
+    closure_id = closure_id or _new_closure_id("area")
+    CLOSURES[closure_id] = {"kind": "area", "building": b_code, "floor": floor, "rect": (r0, c0, r1, c1)}
+    _closures_changed(closure_id)
+    return closure_id
+
+
+def close_portal(state, dest=None, closure_id=None):
+    """
+    Closes the stair/entrance hop state -> dest (every hop from `state` if dest
+    is None), in both directions. Returns the closure id; an explicit
+    closure_id already in use raises ValueError.
+    """
+    _check_closure_id(closure_id)
+    pairs = [(state, d) for d in PORTALS.get(state, ()) if dest is None or d == dest]
+    if not pairs:
+        raise LookupError(f"Error: No stair or entrance connection leaves {state}.")
+    pairs += [(d, s) for s, d in pairs if s in PORTALS.get(d, ())]
+
+    closure_id = closure_id or _new_closure_id("portal")
+    CLOSURES[closure_id] = {"kind": "portal", "pairs": pairs}
+    _closures_changed(closure_id)
+    return closure_id
+
+
+def _check_closure_id(closure_id):
+    # Replacing a live closure would reopen its cells without telling the cached planners
+    if closure_id is not None and closure_id in CLOSURES:
+        raise ValueError(f"Error: Closure '{closure_id}' is already active.")
+
+
+def _new_closure_id(kind):
+    closure_id = f"{kind}-{next(CLOSURE_IDS)}"
+    while closure_id in CLOSURES: # taken by an explicit id
+        closure_id = f"{kind}-{next(CLOSURE_IDS)}"
+    return closure_id
+
+
+def reopen(closure_id):
+    """Lifts a closure made by close_area() or close_portal()."""
+    if closure_id not in CLOSURES:
+        raise LookupError(f"Error: Unknown closure '{closure_id}'.")
+    _closures_changed(closure_id, removed=CLOSURES.pop(closure_id))
+
+
+def _rebuild_closure_overlays():
+    # Recomputes CLOSED_CELLS / CLOSED_PORTALS from every active closure
+    CLOSED_CELLS.clear()
+    CLOSED_PORTALS.clear()
+    for closure in CLOSURES.values():
+        if closure["kind"] == "area":
+            key = (closure["building"], closure["floor"])
+            if key not in CLOSED_CELLS:
+                CLOSED_CELLS[key] = np.zeros(ALL_BUILDING_DATA[key[0]]["grids"][key[1]].shape, dtype=bool)
+            r0, c0, r1, c1 = closure["rect"]
+            CLOSED_CELLS[key][r0:r1 + 1, c0:c1 + 1] = True
+        else:
+            CLOSED_PORTALS.update(tuple(map(tuple, pair)) for pair in closure["pairs"])
+
+
+def _closures_changed(closure_id, removed=None):
+    """
+    Refreshes the overlays and invalidates only what the closure touches: the
+    floor's free mask and pyramid, the building's facility maps, and the
+    cached planners whose search reached the changed cells or hops.
+    """
+    closure = removed or CLOSURES[closure_id]
+    _rebuild_closure_overlays()
+
+    if closure["kind"] == "area":
+        b_code, floor = closure["building"], closure["floor"]
+        r0, c0, r1, c1 = closure["rect"]
+        changed = [(b_code, floor, r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)]
+        touched = {(b_code, floor)}
+    else:
+        pairs = [tuple(map(tuple, pair)) for pair in closure["pairs"]]
+        changed = [dest for _, dest in pairs]
+        touched = {(s[0], s[1]) for pair in pairs for s in pair}
+
+    for b_code, floor in touched:
+        FREE_MASKS.pop((b_code, floor), None)
+        ALL_BUILDING_DATA[b_code][floor].pop("pyramid", None)
+    for key in [k for k in FACILITY_MAPS if k[0] in {b for b, _ in touched}]:
+        del FACILITY_MAPS[key]
+    for planner in ROUTE_CACHE.values():
+        planner.cells_changed(changed)
+
+
+def route_is_open(route):
+    """
+    True if a (smoothed) route avoids every closure: same-floor legs need a
+    clear line of sight, floor/building changes an open portal hop.
+    """
+    if not CLOSURES:
+        return True
+    for a, b in zip(route, route[1:]):
+        if (a[0], a[1]) == (b[0], b[1]):
+            if not is_line_of_sight(a, b):
+                return False
+        elif (a, b) in CLOSED_PORTALS:
+            return False
+    return True
+
+
+class RoutePlanner:
+    """
+    Lifelong Planning A* (LPA*) between a fixed start and goal. The planner
+    keeps its g / rhs values between calls, so after a closure opens or
+    closes cells only the part of the search those cells affect is redone
+    instead of the whole route.
+    """
+
+    def __init__(self, start, goal):
+        self.start, self.goal = start, goal
+        self.g = {}
+        self.rhs = {start: 0}
+        self.queue = []
+        self.queued = {} # state -> key of its live queue entry
+        self.counter = 0
+        self.reverse_portals = {}
+        for src, dests in PORTALS.items():
+            for dest in dests:
+                self.reverse_portals.setdefault(dest, []).append(src)
+        self.h = goal_lower_bound(goal)
+        self._queue_state(start)
+
+    def _key(self, state):
+        m = min(self.g.get(state, INF), self.rhs.get(state, INF))
+        return (m + self.h(state), m)
+
+    def _queue_state(self, state):
+        key = self._key(state)
+        self.queued[state] = key
+        heapq.heappush(self.queue, (key, self.counter, state)); self.counter += 1
+
+    def _predecessors(self, state):
+        b_code, floor, r, c = state
+        grid = ALL_BUILDING_DATA[b_code]["grids"][floor]
+        closed = CLOSED_CELLS.get((b_code, floor))
+        # Cell moves only enter free, open cells
+        if grid[r, c] == 0 and (closed is None or not closed[r, c]):
+            rows, cols = grid.shape
+            for dr, dc in [(-1,0),(1,0),(0,-1),(0,1)]:
+                if 0 <= r + dr < rows and 0 <= c + dc < cols:
+                    yield (b_code, floor, r + dr, c + dc)
+        for src in self.reverse_portals.get(state, ()):
+            if (src, state) not in CLOSED_PORTALS:
+                yield src
+
+    def _update(self, state):
+        if state != self.start:
+            self.rhs[state] = min((self.g.get(p, INF) + 1 for p in self._predecessors(state)), default=INF)
+        if self.g.get(state, INF) != self.rhs.get(state, INF):
+            self._queue_state(state)
+        else:
+            self.queued.pop(state, None)
+
+    def cells_changed(self, states):
+        """Re-evaluates states whose incoming moves were opened or closed."""
+        for state in states:
+            if state in self.rhs or any(p in self.g for p in self._predecessors(state)):
+                self._update(state)
+
+    def compute(self):
+        """Brings the search up to date and returns the shortest path, or None."""
+        goal = self.goal
+        while self.queue:
+            key, _, u = self.queue[0]
+            if self.queued.get(u) != key:
+                heapq.heappop(self.queue) # stale entry
+                continue
+            if key >= self._key(goal) and self.rhs.get(goal, INF) == self.g.get(goal, INF):
+                break
+            heapq.heappop(self.queue)
+            del self.queued[u]
+            if self.g.get(u, INF) > self.rhs.get(u, INF):
+                self.g[u] = self.rhs[u]
+            else:
+                self.g[u] = INF
+                self._update(u)
+            for s in neighbors(u):
+                self._update(s)
+        return self.path()
+
+    def path(self):
+        if self.g.get(self.goal, INF) == INF:
+            return None
+        current = self.goal
+        path = [current]
+        while current != self.start:
+            d = self.g[current]
+            current = next(p for p in self._predecessors(current) if self.g.get(p, INF) == d - 1)
+            path.append(current)
+        path.reverse()
+        return path
+
+
+def lpa_multi_floor(start, goal):
+    """
+    Incremental search engine: reuses the cached RoutePlanner for this start
+    and goal, so repeated requests after closures only repair the route.
+    """
+    planner = ROUTE_CACHE.pop((start, goal), None) or RoutePlanner(start, goal)
+    ROUTE_CACHE[(start, goal)] = planner # most recently used last
+    if len(ROUTE_CACHE) > ROUTE_CACHE_SIZE:
+        del ROUTE_CACHE[next(iter(ROUTE_CACHE))]
+    return planner.compute()
+
+
+# Search engines selectable by find_route(engine=...) and the batch "engine" field
+SEARCH_ENGINES = {
+    "astar": astar_multi_floor,
+    "bfs": bfs_multi_floor,
+    "pyramid": pyramid_multi_floor,
+    "skeleton": skeleton_multi_floor,
+    "visibility": visibility_multi_floor,
+    "lpa": lpa_multi_floor,
+}
+
+
+def reachable_within(sources, max_steps):
+    """
+    Everything reachable from one or more states within `max_steps` moves,
+    across floors via stairs and across buildings via connected entrances.
+    Returns: {"masks": {(b_code, floor): bool array},
+              "distances": {(b_code, floor): int32 array},
+              "summary": {"cells": n, "rooms": [...], "stairs": [...],
+                          "entrances": [...], "portals": [...]}}
+    Labelled entries in the summary are (label, state, distance), nearest first.
+    """
+    fields = wavefront_multi_floor([snap_to_free(s) for s in sources], max_steps=max_steps)
+
+    def dist_of(state):
+        field = fields.get((state[0], state[1]))
+        if field is None:
+            return -1
+        return int(field[state[2], state[3]])
+
+    def collect(items):
+        found = []
+        for label, state in items:
+            d = dist_of(snap_to_free(state))
+            if d >= 0:
+                found.append((label, state, d))
+        return sorted(found, key=lambda x: x[2])
+
+    summary = {
+        "cells": int(sum((field >= 0).sum() for field in fields.values())),
+        "rooms": collect((str(room_id), loc) for room_id, locs in ROOM_COORDS.items() for loc in locs),
+        "stairs": collect((f"stairs {name}", (b, f, r, c))
+                          for name, floor_map in STAIRS.items() for (b, f), (r, c) in floor_map.items()),
+        "entrances": collect((label, loc) for label, locs in ENTRANCES.items() for loc in locs),
+        "portals": sorted(((src, dist_of(src)) for src in PORTALS if dist_of(src) >= 0), key=lambda x: x[1]),
+    }
+
+    return {
+        "masks": {key: field >= 0 for key, field in fields.items()},
+        "distances": fields,
+        "summary": summary,
+    }
+
+
 def snap_to_free(state):
     # Flood-fills outwards from a coordinate until it finds a free (0) cell
     b_code, floor, r, c = state
@@ -406,7 +1913,7 @@ def visualize_path(path, start, goal):
         rows, cols = grid_dimensions[0], grid_dimensions[1]
 
         # Start with the grid, but we will modify the colormap later to make the background transparent
-        vis = ALL_BUILDING_DATA[b_code]["grids"][floor].copy().astype(int)
+        vis = np.array(ALL_BUILDING_DATA[b_code]["grids"][floor], dtype=int)
         
         # --- Draw Path ---
         for r, c in path_by_map[(b_code, floor)]:
@@ -492,6 +1999,7 @@ def is_line_of_sight(p1, p2):
     if b_code not in ALL_BUILDING_DATA or "grids" not in ALL_BUILDING_DATA[b_code] or f1 not in ALL_BUILDING_DATA[b_code]["grids"]:
         return False
     grid = ALL_BUILDING_DATA[b_code]["grids"][f1]
+    closed = CLOSED_CELLS.get((b_code, f1))
     
     # Handle adjacent points quickly
     if abs(r1 - r2) + abs(c1 - c2) <= 1:
@@ -513,7 +2021,7 @@ def is_line_of_sight(p1, p2):
                 c += s_c
                 err += dr
             
-            if grid[r, c] != 0:
+            if grid[r, c] != 0 or (closed is not None and closed[r, c]):
                 return False
     else:
         err = dc / 2.0
@@ -524,7 +2032,7 @@ def is_line_of_sight(p1, p2):
                 r += s_r
                 err += dc
                 
-            if grid[r, c] != 0:
+            if grid[r, c] != 0 or (closed is not None and closed[r, c]):
                 return False
     
     return True
@@ -585,10 +2093,984 @@ def resolve_location(loc_str, b_code, room_coords, entrances):
     return [] # Return empty list if resolution failed
 
 
+def select_closest_pair(start_locations, goal_locations):
+    """
+    Picks the (start, goal) label pair with the lowest heuristic cost.
+    Returns (None, None) if either list is empty.
+    """
+    best_start_flat = None
+    best_goal_flat = None
+    min_cost = float('inf')
+
+    for s_flat in start_locations:
+        for g_flat in goal_locations:
+            cost = heuristic(s_flat, g_flat)
+
+            if cost < min_cost:
+                min_cost = cost
+                best_start_flat = s_flat
+                best_goal_flat = g_flat
+
+    return best_start_flat, best_goal_flat
+
+
+def find_route(start_building_code, start_loc_str, goal_building_code, goal_loc_str, engine="astar",
+               use_tables=None, budget=None, epsilon=None):
+    """
+    Resolves both locations against the loaded buildings, runs the search with
+    the chosen engine (see SEARCH_ENGINES) and smooths the result. Routes
+    within one building come from its route table instead, if one was built,
+    when use_tables is True, or when it is None and the engine is the default
+    "astar" (so asking for another engine really runs that engine).
+    With engine "astar", a time budget (seconds) and/or suboptimality bound
+    `epsilon` switch to anytime_astar() and the result reports the "bound"
+    it achieved: 1.0 for table routes, INF if the budget ran out before the
+    first route could be bounded (a route is still returned). Buildings must
+    already be loaded with load_buildings().
+    Returns: {"start": state, "goal": state, "path": [...] or None for table
+              routes, "steps": n, "smoothed": [...]} (+ "bound")
+    Raises LookupError if a location cannot be resolved or no path exists.
+    """
+    start_locations = resolve_location(start_loc_str, start_building_code, ROOM_COORDS, ENTRANCES)
+    goal_locations = resolve_location(goal_loc_str, goal_building_code, ROOM_COORDS, ENTRANCES)
+
+    if not start_locations:
+        raise LookupError(
+            f"Error: Could not find location '{start_loc_str}' in building {start_building_code}.\n"
+            "Please use a valid Room ID (e.g., 101) or Entrance Label (e.g., entranceNorth)."
+        )
+
+    if not goal_locations:
+        raise LookupError(
+            f"Error: Could not find location '{goal_loc_str}' in building {goal_building_code}.\n"
+            "Please use a valid Room ID (e.g., 101) or Entrance Label (e.g., entranceNorth)."
+        )
+
+    # Intra-building routes are served from the precomputed table when there is one
+    if use_tables is None:
+        use_tables = engine == "astar"
+    if use_tables and start_building_code == goal_building_code:
+        route = lookup_table_route(start_building_code, start_locations, goal_locations)
+        if route:
+            if engine == "astar" and (budget is not None or epsilon is not None):
+                route["bound"] = 1.0 # table distances are exact
+            return route
+
+    best_start_flat, best_goal_flat = select_closest_pair(start_locations, goal_locations)
+    if not best_start_flat or not best_goal_flat:
+        raise LookupError("Error: Could not determine start/goal points from labels.")
+
+    start = snap_to_free(best_start_flat)
+    goal = snap_to_free(best_goal_flat)
+
+    if engine not in SEARCH_ENGINES:
+        raise LookupError(f"Error: Unknown search engine '{engine}' (expected one of {sorted(SEARCH_ENGINES)}).")
+    bound = None
+    if engine == "astar" and (budget is not None or epsilon is not None):
+        path, bound = anytime_astar(start, goal, budget, epsilon)
+    else:
+        path = SEARCH_ENGINES[engine](start, goal)
+    if not path:
+        raise LookupError("No path found!")
+
+    route = {
+        "start": start,
+        "goal": goal,
+        "path": path,
+        "steps": len(path),
+        "smoothed": smooth_path(path),
+    }
+    if bound is not None:
+        route["bound"] = bound
+    return route
+
+
+def building_locations(b_code, kind="rooms"):
+    """
+    Lists the location strings of one kind ("rooms" or "entrances") labelled in
+    a loaded building, in a form resolve_location() accepts.
+    """
+    if kind == "rooms":
+        return [str(room_id) for room_id, locs in sorted(ROOM_COORDS.items())
+                if any(loc[0] == b_code for loc in locs)]
+    if kind == "entrances":
+        return [label for label, locs in sorted(ENTRANCES.items())
+                if any(loc[0] == b_code for loc in locs)]
+    raise ValueError(f"Unknown location kind '{kind}' (expected 'rooms' or 'entrances')")
+
+
+def location_distance_matrix(sources, targets):
+    """
+    Walking distances (in grid steps) from every source to every target.
+    sources/targets: [(b_code, loc_str), ...]. Each row is ONE multi-floor
+    Dijkstra from all of the source's labelled points to all of the targets'
+    points, instead of len(targets) separate A* runs. A room labelled at
+    several points takes its closest point.
+    Returns: {"sources": [...], "targets": [...], "distances": [[d or None, ...], ...]}
+    """
+    def states_for(b_code, loc_str):
+        return [snap_to_free(s) for s in resolve_location(loc_str, b_code, ROOM_COORDS, ENTRANCES)]
+
+    target_states = [states_for(b, loc) for b, loc in targets]
+    all_target_states = {s for states in target_states for s in states}
+
+    distances = []
+    for b_code, loc_str in sources:
+        source_states = states_for(b_code, loc_str)
+        if not source_states:
+            distances.append([None] * len(targets))
+            continue
+
+        settled = dijkstra_multi_floor(source_states, all_target_states)
+        row = []
+        for states in target_states:
+            reached = [settled[s] for s in states if settled[s] is not None]
+            row.append(min(reached) if reached else None)
+        distances.append(row)
+
+    return {
+        "sources": [list(s) for s in sources],
+        "targets": [list(t) for t in targets],
+        "distances": distances,
+    }
+
+
+# =============================================================
+# === NEAREST FACILITY ===
+# =============================================================
+
+FACILITY_KINDS = ("stairs", "entrance", "room")
+MAPPED_FACILITY_KINDS = ("stairs", "entrance") # answered from a facility map; rooms search instead
+
+def facility_states(b_code, kind, room_range=None):
+    """
+    Labelled facilities of one kind in a building, snapped to free cells.
+    kind: "stairs", "entrance" or "room" (optionally room_range=(lo, hi), inclusive).
+    Returns: {state: label}
+    """
+    found = {}
+    if kind == "stairs":
+        for stair_name, floor_map in STAIRS.items():
+            for (b, floor), (r, c) in floor_map.items():
+                if b == b_code:
+                    found[snap_to_free((b, floor, r, c))] = f"stairs {stair_name}"
+    elif kind == "entrance":
+        for label, locs in ENTRANCES.items():
+            for loc in locs:
+                if loc[0] == b_code:
+                    found[snap_to_free(loc)] = label
+    elif kind == "room":
+        lo, hi = room_range if room_range else (float('-inf'), float('inf'))
+        for room_id, locs in ROOM_COORDS.items():
+            if lo <= room_id <= hi:
+                for loc in locs:
+                    if loc[0] == b_code:
+                        found[snap_to_free(loc)] = str(room_id)
+    else:
+        raise ValueError(f"Unknown facility kind '{kind}' (expected one of {FACILITY_KINDS})")
+    return found
+
+
+def build_facility_map(b_code, kind):
+    """
+    Precomputes a nearest-facility (Voronoi) map for a building: one
+    multi-source wavefront from every facility of `kind`, through the building's
+    stairs, recording for every free cell on every floor the distance to and
+    index of its nearest facility. Cached in FACILITY_MAPS.
+    Returns: {"labels": [...], "states": [...], "floors": {floor: (dist, owner)}, "digest": ...}
+    """
+    facilities = facility_states(b_code, kind)
+    states = list(facilities)
+    dist_fields, owner_fields = wavefront_multi_floor(
+        states, buildings={b_code}, owners=list(range(len(states))))
+
+    floors = {}
+    for floor, grid in ALL_BUILDING_DATA[b_code]["grids"].items():
+        if (b_code, floor) in dist_fields:
+            floors[floor] = (dist_fields[(b_code, floor)], owner_fields[(b_code, floor)])
+        else:
+            floors[floor] = (np.full(grid.shape, -1, dtype=np.int32),
+                             np.full(grid.shape, -1, dtype=np.int32))
+
+    facility_map = {"labels": [facilities[s] for s in states], "states": states, "floors": floors,
+                    "digest": _facility_map_digest(b_code, kind, facilities)}
+    FACILITY_MAPS[(b_code, kind)] = facility_map
+    return facility_map
+
+
+def _facility_map_digest(b_code, kind, facilities):
+    # Changes whenever the building's wavefront would: grids, facilities,
+    # stair hops and active closures
+    digest = hashlib.sha1()
+    for floor, grid in sorted(ALL_BUILDING_DATA[b_code]["grids"].items()):
+        digest.update(str((floor, grid.shape)).encode())
+        digest.update(gridTiles.grid_digest(grid).encode())
+        if (b_code, floor) in CLOSED_CELLS:
+            digest.update(np.packbits(CLOSED_CELLS[(b_code, floor)]).tobytes())
+    hops = sorted((s, d) for s, dests in PORTALS.items() if s[0] == b_code
+                  for d in dests if d[0] == b_code and (s, d) not in CLOSED_PORTALS)
+    digest.update(repr((kind, sorted(facilities.items()), hops)).encode())
+    return digest.hexdigest()
+
+
+def _facility_maps_path(b_code):
+    floor = min(ALL_BUILDING_DATA[b_code]["grids"])
+    return ALL_BUILDING_DATA[b_code][floor].get("facility_maps")
+
+
+def save_facility_maps(b_code):
+    """
+    Builds the stairs and entrance facility maps of a building and stores them
+    next to its route table (<building>/facility_maps.npz), so a fresh process
+    answers nearest-facility lookups without running the wavefront:
+      {kind}_digest, {kind}_labels, {kind}_states (floor, r, c),
+      {kind}_dist_F{floor} / {kind}_owner_F{floor} (int32, -1 unreached).
+    """
+    arrays = {}
+    for kind in MAPPED_FACILITY_KINDS:
+        facility_map = build_facility_map(b_code, kind)
+        arrays[f"{kind}_digest"] = np.array(facility_map["digest"])
+        arrays[f"{kind}_labels"] = np.array(facility_map["labels"], dtype=str)
+        arrays[f"{kind}_states"] = np.array([s[1:] for s in facility_map["states"]], dtype=np.int32).reshape(-1, 3)
+        for floor, (dist, owner) in facility_map["floors"].items():
+            arrays[f"{kind}_dist_F{floor}"] = dist
+            arrays[f"{kind}_owner_F{floor}"] = owner
+
+    out_path = _facility_maps_path(b_code)
+    np.savez_compressed(out_path, **arrays)
+    print(f"Saved facility maps for {b_code} ({', '.join(MAPPED_FACILITY_KINDS)}) to {out_path}")
+    return out_path
+
+
+def load_facility_map(b_code, kind):
+    """
+    Loads the facility map of `kind` saved by save_facility_maps(), or returns
+    None if there is none or it was built from different grids, facilities or
+    closures than the current ones. Cached in FACILITY_MAPS.
+    """
+    path = _facility_maps_path(b_code)
+    if not path or not os.path.exists(path):
+        return None
+    facilities = facility_states(b_code, kind)
+    with np.load(path) as data:
+        if f"{kind}_digest" not in data.files:
+            return None
+        if str(data[f"{kind}_digest"]) != _facility_map_digest(b_code, kind, facilities):
+            print(f"Warning: Ignoring stale {kind} facility map in {path}")
+            return None
+        facility_map = {
+            "labels": data[f"{kind}_labels"].tolist(),
+            "states": [(b_code, f, r, c) for f, r, c in data[f"{kind}_states"].tolist()],
+            "floors": {floor: (data[f"{kind}_dist_F{floor}"], data[f"{kind}_owner_F{floor}"])
+                       for floor in ALL_BUILDING_DATA[b_code]["grids"]},
+            "digest": str(data[f"{kind}_digest"]),
+        }
+    FACILITY_MAPS[(b_code, kind)] = facility_map
+    return facility_map
+
+
+def nearest_facility(state, kind, room_range=None):
+    """
+    Nearest facility of `kind` to a grid state, within the state's building.
+    Stairs and entrances are answered from the facility map saved by
+    --build-facility-maps (built in-process if it is missing or stale); room
+    ranges run one first-hit multi-target Dijkstra.
+    Returns: {"label": ..., "state": ..., "distance": ...} or None if none is reachable.
+    """
+    state = snap_to_free(state)
+    b_code, floor, r, c = state
+
+    if room_range is None and kind in MAPPED_FACILITY_KINDS:
+        facility_map = (FACILITY_MAPS.get((b_code, kind)) or load_facility_map(b_code, kind)
+                        or build_facility_map(b_code, kind))
+        dist, owner = facility_map["floors"][floor]
+        if dist[r, c] < 0:
+            return None
+        idx = int(owner[r, c])
+        return {"label": facility_map["labels"][idx], "state": facility_map["states"][idx],
+                "distance": int(dist[r, c])}
+
+    facilities = facility_states(b_code, kind, room_range)
+    settled = dijkstra_multi_floor([state], facilities, first_only=True)
+    hits = [(d, s) for s, d in settled.items() if d is not None]
+    if not hits:
+        return None
+    d, s = min(hits)
+    return {"label": facilities[s], "state": s, "distance": d}
+
+
+def nearest_facility_from(b_code, loc_str, kind, room_range=None):
+    """nearest_facility() for a room ID / entrance label instead of a grid state."""
+    locations = resolve_location(loc_str, b_code, ROOM_COORDS, ENTRANCES)
+    if not locations:
+        raise LookupError(f"Error: Could not find location '{loc_str}' in building {b_code}.")
+    results = [n for n in (nearest_facility(loc, kind, room_range) for loc in locations) if n]
+    return min(results, key=lambda n: n["distance"]) if results else None
+
+
+# =============================================================
+# === PRECOMPUTED ROUTE TABLES ===
+# =============================================================
+
+def _building_nodes(b_code):
+    """Every labelled point (rooms, stairs, entrances) of a building as (label, snapped_state)."""
+    nodes = []
+    for room_id, locs in sorted(ROOM_COORDS.items()):
+        nodes += [(str(room_id), snap_to_free(loc)) for loc in locs if loc[0] == b_code]
+    for stair_name, floor_map in sorted(STAIRS.items()):
+        nodes += [(f"stairs {stair_name.lower()}", snap_to_free((b, f, r, c)))
+                  for (b, f), (r, c) in sorted(floor_map.items()) if b == b_code]
+    for label, locs in sorted(ENTRANCES.items()):
+        nodes += [(label, snap_to_free(loc)) for loc in locs if loc[0] == b_code]
+    return nodes
+
+
+def _route_table_digest(b_code, nodes):
+    # Changes whenever the building's grids or labelled points change
+    digest = hashlib.sha1()
+    for floor, grid in sorted(ALL_BUILDING_DATA[b_code]["grids"].items()):
+        digest.update(str((floor, grid.shape)).encode())
+        digest.update(gridTiles.grid_digest(grid).encode()) # recorded in a tile store, not recomputed
+    digest.update(repr(nodes).encode())
+    digest.update(b"starts+int16 deltas") # table layout, see build_route_table
+    return digest.hexdigest()
+
+
+def _route_table_path(b_code, base_dir=BASE_DIR):
+    return os.path.join(base_dir, b_code[:2], b_code[2:], ROUTE_TABLE_FILE)
+
+
+def build_route_table(b_code, base_dir=BASE_DIR):
+    """
+    Precomputes smoothed routes and distances between every pair of labelled
+    points in a building (one wavefront per point, staying inside the
+    building) and stores them in <building>/route_table.npz:
+      labels, states (floor, r, c), dist (n x n, -1 unreachable),
+      starts + offsets + waypoints: smoothed route for pair i < j, its first
+      (floor, r, c) in starts (int32) and every later waypoint in waypoints
+      as an int16 delta from the previous one.
+    Raises ValueError if a delta does not fit in int16.
+    """
+    nodes = _building_nodes(b_code)
+    n = len(nodes)
+    dist = np.full((n, n), -1, dtype=np.int32)
+    starts = []
+    offsets = [0]
+    waypoints = []
+    reverse_portals = reverse_portal_index()
+
+    for i, (_, source) in enumerate(nodes):
+        fields = wavefront_multi_floor([source], buildings={b_code})
+        for j in range(n):
+            target = nodes[j][1]
+            field = fields.get((target[0], target[1]))
+            if field is not None and field[target[2], target[3]] >= 0:
+                dist[i, j] = field[target[2], target[3]]
+            if j <= i:
+                continue
+            route = smooth_path(path_from_field(fields, target, reverse_portals)) if dist[i, j] >= 0 else []
+            route = [s[1:] for s in route]
+            starts.append(route[0] if route else (0, 0, 0))
+            waypoints += [(f1 - f0, r1 - r0, c1 - c0) for (f0, r0, c0), (f1, r1, c1) in zip(route, route[1:])]
+            offsets.append(len(waypoints))
+
+    waypoints = np.array(waypoints, dtype=np.int64).reshape(-1, 3)
+    if waypoints.size and np.abs(waypoints).max() > np.iinfo(np.int16).max:
+        raise ValueError(f"Route table for {b_code}: a waypoint step does not fit in int16.")
+
+    out_path = _route_table_path(b_code, base_dir)
+    np.savez_compressed(
+        out_path,
+        digest=np.array(_route_table_digest(b_code, nodes)),
+        labels=np.array([label for label, _ in nodes]),
+        states=np.array([s[1:] for _, s in nodes], dtype=np.int32).reshape(-1, 3),
+        dist=dist,
+        starts=np.array(starts, dtype=np.int32).reshape(-1, 3),
+        offsets=np.array(offsets, dtype=np.int64),
+        waypoints=waypoints.astype(np.int16),
+    )
+    ROUTE_TABLES.pop(b_code, None)
+    print(f"Saved route table for {b_code} ({n} points, {n * (n - 1) // 2} pairs) to {out_path}")
+    return out_path
+
+
+def load_route_table(b_code, base_dir=BASE_DIR):
+    """
+    Loads a building's route table, or returns None if there is none or it was
+    built from different grids/labels than the ones loaded now. Cached.
+    """
+    if b_code in ROUTE_TABLES:
+        return ROUTE_TABLES[b_code]
+
+    table = None
+    path = _route_table_path(b_code, base_dir)
+    if os.path.exists(path):
+        with np.load(path) as data:
+            table = {k: data[k] for k in data.files}
+        nodes = _building_nodes(b_code)
+        if str(table["digest"]) != _route_table_digest(b_code, nodes):
+            print(f"Warning: Ignoring stale route table {path}")
+            table = None
+        else:
+            table["nodes"] = nodes
+    ROUTE_TABLES[b_code] = table
+    return table
+
+
+def _table_route(table, i, j):
+    # Decodes the stored route between points i and j (either order)
+    if i == j:
+        return [table["nodes"][i][1]]
+    n = len(table["labels"])
+    a, b = min(i, j), max(i, j)
+    pair = a * n - a * (a + 1) // 2 + (b - a - 1)
+    deltas = table["waypoints"][table["offsets"][pair]:table["offsets"][pair + 1]].astype(np.int64)
+    absolute = np.cumsum(np.vstack([table["starts"][pair:pair + 1].astype(np.int64), deltas]), axis=0).tolist()
+    b_code = table["nodes"][0][1][0]
+    route = [(b_code, f, r, c) for f, r, c in absolute]
+    return route if i <= j else route[::-1]
+
+
+def lookup_table_route(b_code, start_locations, goal_locations):
+    """
+    Serves an intra-building route from the building's route table: picks the
+    closest pair among the candidate label points. Returns a find_route()-style
+    dict, or None if there is no (fresh) table or the points are not in it.
+    """
+    table = load_route_table(b_code)
+    if table is None:
+        return None
+
+    index = {state: i for i, (_, state) in enumerate(table["nodes"])}
+    starts = [index.get(snap_to_free(loc)) for loc in start_locations]
+    goals = [index.get(snap_to_free(loc)) for loc in goal_locations]
+    pairs = [(int(table["dist"][i, j]), i, j) for i in starts for j in goals
+             if i is not None and j is not None and table["dist"][i, j] >= 0]
+    if not pairs:
+        return None
+
+    d, i, j = min(pairs)
+    smoothed = _table_route(table, i, j)
+    if not route_is_open(smoothed):
+        return None # crosses a closure; search instead
+    return {
+        "start": table["nodes"][i][1],
+        "goal": table["nodes"][j][1],
+        "path": None, # only the smoothed route is stored
+        "steps": d + 1,
+        "smoothed": smoothed,
+    }
+
+
+# =============================================================
+# === SHARED-MEMORY WORKER POOL ===
+# =============================================================
+
+def share_building_data(new_b_codes=None):
+    """
+    Copies the floor grids of `new_b_codes` (every loaded building if None)
+    and the portal table into shared memory.
+    Returns (handles, descriptor): the SharedMemory blocks owned by the caller
+    and a picklable descriptor that workers pass to attach_building_data().
+    Label tables are small and travel inside the descriptor itself, whole.
+    """
+    handles = []
+    b_codes = sorted(ALL_BUILDING_DATA)
+    descriptor = {"b_codes": b_codes, "grids": {}, "floors": {},
+                  "room_coords": ROOM_COORDS, "entrances": ENTRANCES, "stairs": STAIRS,
+                  "closures": CLOSURES}
+
+    for b_code in (b_codes if new_b_codes is None else sorted(new_b_codes)):
+        for floor, grid in ALL_BUILDING_DATA[b_code]["grids"].items():
+            grid = gridTiles.dense(grid) # workers run every engine, so tiled grids are shared in full
+            shm = shared_memory.SharedMemory(create=True, size=max(grid.nbytes, 1))
+            np.ndarray(grid.shape, dtype=grid.dtype, buffer=shm.buf)[:] = grid
+            handles.append(shm)
+            descriptor["grids"][(b_code, floor)] = (shm.name, grid.shape, grid.dtype.str)
+
+            # Everything except the grid, the (unpicklable) image converter and the
+            # per-process search pyramid
+            descriptor["floors"][(b_code, floor)] = {
+                k: v for k, v in ALL_BUILDING_DATA[b_code][floor].items()
+                if k not in ("grid", "to_image_coords", "pyramid")
+            }
+
+    # Portal table rows: (src_b, src_floor, src_r, src_c, dst_b, dst_floor, dst_r, dst_c)
+    b_index = {b: i for i, b in enumerate(b_codes)}
+    rows = [(b_index[s[0]], s[1], s[2], s[3], b_index[d[0]], d[1], d[2], d[3])
+            for s, dests in PORTALS.items() for d in dests]
+    portals = np.array(rows, dtype=np.int32).reshape(-1, 8)
+    shm = shared_memory.SharedMemory(create=True, size=max(portals.nbytes, 1))
+    np.ndarray(portals.shape, dtype=portals.dtype, buffer=shm.buf)[:] = portals
+    handles.append(shm)
+    descriptor["portals"] = (shm.name, portals.shape, portals.dtype.str)
+
+    return handles, descriptor
+
+
+def _attach(name, shape, dtype):
+    # Spawned workers share the pool's resource tracker, so attaching here does
+    # not hand ownership of the block to the worker; the pool unlinks it.
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def attach_building_data(descriptor):
+    """
+    Rebuilds the global lookup tables in a worker process from a descriptor
+    produced by share_building_data(). Grids are zero-copy views onto shared
+    memory; buildings attached by earlier descriptors are kept, so a pool can
+    add buildings while it runs. Returns the SharedMemory handles, which must
+    stay referenced.
+    """
+    handles = []
+    for (b_code, floor), (name, shape, dtype) in descriptor["grids"].items():
+        shm, grid = _attach(name, shape, dtype)
+        handles.append(shm)
+        b_data = ALL_BUILDING_DATA.setdefault(b_code, {"grids": {}})
+        b_data["grids"][floor] = grid
+        b_data[floor] = dict(descriptor["floors"][(b_code, floor)], grid=grid)
+
+    ROOM_COORDS.clear(); ROOM_COORDS.update(descriptor["room_coords"])
+    ENTRANCES.clear(); ENTRANCES.update(descriptor["entrances"])
+    STAIRS.clear(); STAIRS.update(descriptor["stairs"])
+
+    shm, portals = _attach(*descriptor["portals"])
+    handles.append(shm)
+    b_codes = descriptor["b_codes"]
+    PORTALS.clear()
+    ROUTE_CACHE.clear() # planners keep portal-dependent search state
+    for sb, sf, sr, sc, db, df, dr, dc in portals.tolist():
+        PORTALS.setdefault((b_codes[sb], sf, sr, sc), []).append((b_codes[db], df, dr, dc))
+
+    # Closures active when the pool started
+    CLOSURES.clear(); CLOSURES.update(descriptor["closures"])
+    _rebuild_closure_overlays()
+
+    return handles
+
+
+def route_result(route):
+    """JSON-friendly summary of a find_route() result."""
+    return {
+        "success": True,
+        "start": list(route["start"]),
+        "goal": list(route["goal"]),
+        "steps": route["steps"],
+        "path": [list(step) for step in route["smoothed"]],
+        **({"bound": route["bound"]} if "bound" in route else {}), # inf is written as Infinity
+    }
+
+
+def _location_list(items):
+    return [(str(b).lower(), str(loc)) for b, loc in items]
+
+
+def _op_route(args):
+    start_b, start_loc, goal_b, goal_loc, engine, budget, epsilon = args
+    return route_result(find_route(start_b, start_loc, goal_b, goal_loc, engine, budget=budget, epsilon=epsilon))
+
+
+def _op_matrix(req):
+    # targets: [[building, location], ...] or {"building": ..., "kind": "rooms" | "entrances"}
+    targets = req["targets"]
+    if isinstance(targets, dict):
+        b_code = str(targets["building"]).lower()
+        targets = [(b_code, loc) for loc in building_locations(b_code, targets.get("kind", "rooms"))]
+    else:
+        targets = _location_list(targets)
+    return dict(location_distance_matrix(_location_list(req["sources"]), targets), success=True)
+
+
+def _op_nearest(req):
+    room_range = tuple(req["range"]) if req.get("range") else None
+    found = nearest_facility_from(str(req["building"]).lower(), str(req["location"]),
+                                  req.get("kind", "entrance"), room_range)
+    if not found:
+        return {"success": False, "error": "No reachable facility found."}
+    return {"success": True, "label": found["label"], "state": list(found["state"]),
+            "distance": found["distance"]}
+
+
+def _op_reach(req):
+    b_code = str(req["building"]).lower()
+    locations = resolve_location(str(req["location"]), b_code, ROOM_COORDS, ENTRANCES)
+    if not locations:
+        raise LookupError(f"Error: Could not find location '{req['location']}' in building {b_code}.")
+    reach = reachable_within(locations, int(req["steps"]))
+    summary = reach["summary"]
+    return {
+        "success": True,
+        "cells": summary["cells"],
+        "floors": {f"{b}F{f}": int(mask.sum()) for (b, f), mask in reach["masks"].items()},
+        "rooms": [[label, list(state), d] for label, state, d in summary["rooms"]],
+        "stairs": [[label, list(state), d] for label, state, d in summary["stairs"]],
+        "entrances": [[label, list(state), d] for label, state, d in summary["entrances"]],
+        "portals": [[list(state), d] for state, d in summary["portals"]],
+    }
+
+
+# Task types a pool worker (and so a batch line's "op" field) understands
+POOL_OPS = {
+    "route": _op_route,
+    "matrix": _op_matrix,
+    "nearest": _op_nearest,
+    "reach": _op_reach,
+}
+
+
+def _route_worker(worker_id, descriptor, tasks, results, busy, done, updates):
+    # Diagnostics go to stderr so a worker never writes into the parent's stdout
+    sys.stdout = sys.stderr
+    handles = attach_building_data(descriptor)
+    version = 0
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, op, args, needed = task
+            # Buildings added after this worker started, see RouteWorkerPool.add_buildings
+            while version < needed:
+                version, update = updates.get()
+                handles += attach_building_data(update)
+            t0 = time.perf_counter()
+            try:
+                result = POOL_OPS[op](args)
+            except LookupError as e:
+                result = {"success": False, "error": str(e)}
+            except Exception as e:
+                result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+            busy[worker_id] += time.perf_counter() - t0
+            done[worker_id] += 1
+            results.put((task_id, result))
+    finally:
+        for shm in handles:
+            shm.close()
+
+
+class RouteWorkerPool:
+    """
+    Runs route queries on N worker processes. The loaded floor grids and the
+    portal table are placed in shared memory once; workers attach to them and
+    pull (start_b, start_loc, goal_b, goal_loc) tasks from a queue.
+
+    The buildings loaded with load_buildings() when the pool is created are
+    shared at once; add_buildings() loads and shares more while it runs.
+    results() raises RuntimeError if a worker process dies.
+
+        with RouteWorkerPool(4) as pool:
+            pool.submit(0, "sw03", "1750", "sw03", "2605")
+            for task_id, result in pool.results():
+                ...
+    """
+
+    def __init__(self, num_workers=None):
+        ctx = mp.get_context("spawn")
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self._handles, descriptor = share_building_data()
+        self._shared = set(ALL_BUILDING_DATA) # buildings the workers can see
+        self._version = 0                     # add_buildings() calls so far
+        self._updates = [ctx.Queue() for _ in range(self.num_workers)]
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._busy = ctx.RawArray("d", self.num_workers)
+        self._done = ctx.RawArray("l", self.num_workers)
+        self._pending = 0
+        self._started_at = time.perf_counter()
+        self._workers = [
+            ctx.Process(target=_route_worker, daemon=True,
+                        args=(i, descriptor, self._tasks, self._results, self._busy, self._done,
+                              self._updates[i]))
+            for i in range(self.num_workers)
+        ]
+        for w in self._workers:
+            w.start()
+
+    def add_buildings(self, building_codes):
+        """
+        Loads the buildings the workers do not have yet and shares them. Every
+        task submitted afterwards waits, in its worker, until they are attached.
+        Unknown buildings are skipped; requests naming them fail in the worker.
+        """
+        new = []
+        for b_code in sorted(set(building_codes) - self._shared):
+            self._shared.add(b_code) # tried once
+            try:
+                load_buildings([b_code])
+            except FileNotFoundError as e:
+                print(f"Warning: {e}", file=sys.stderr)
+                continue
+            new.append(b_code)
+        if not new:
+            return
+        handles, descriptor = share_building_data(new)
+        self._handles += handles
+        self._version += 1
+        for updates in self._updates:
+            updates.put((self._version, descriptor))
+
+    def submit(self, task_id, start_building_code, start_loc_str, goal_building_code, goal_loc_str, engine="astar",
+               budget=None, epsilon=None):
+        """Queues one route; its result is yielded by results() under task_id."""
+        self.submit_op(task_id, "route", (start_building_code, start_loc_str, goal_building_code, goal_loc_str, engine,
+                                          budget, epsilon))
+
+    def submit_op(self, task_id, op, args):
+        """Queues any task type from POOL_OPS (e.g. "matrix" with its request dict)."""
+        self._tasks.put((task_id, op, args, self._version))
+        self._pending += 1
+
+    @property
+    def pending(self):
+        """Submitted tasks whose results have not been taken yet."""
+        return self._pending
+
+    def results(self, block=True):
+        """
+        Yields (task_id, result) in completion order until nothing is pending.
+        With block=False it stops at the first result that is not ready yet,
+        so callers can drain between submits. While blocked it checks on the
+        workers and raises RuntimeError if one has died, instead of waiting
+        for results that will never come.
+        """
+        while self._pending:
+            try:
+                task_id, result = self._results.get(block, POOL_POLL_S if block else None)
+            except queue.Empty:
+                if not block:
+                    return
+                dead = [w for w in self._workers if not w.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Route worker {dead[0].name} died (exit code {dead[0].exitcode}) "
+                                       f"with {self._pending} task(s) pending.")
+                continue
+            self._pending -= 1
+            yield task_id, result
+
+    def stats(self):
+        """Queue depth plus per-worker route counts and utilisation (busy / wall time)."""
+        elapsed = max(time.perf_counter() - self._started_at, 1e-9)
+        try:
+            queue_depth = self._tasks.qsize()
+        except NotImplementedError: # macOS has no sem_getvalue
+            queue_depth = None
+        return {
+            "queue_depth": queue_depth,
+            "pending": self._pending,
+            "workers": [
+                {"worker": i, "routes": self._done[i], "busy_s": round(self._busy[i], 3),
+                 "utilisation": round(min(self._busy[i] / elapsed, 1.0), 3)}
+                for i in range(self.num_workers)
+            ],
+        }
+
+    def close(self, terminate=False):
+        """Stops the workers (at once if terminate, else after the queued tasks) and releases the shared memory."""
+        if terminate:
+            for w in self._workers:
+                w.terminate()
+        else:
+            for _ in self._workers:
+                self._tasks.put(None)
+        for w in self._workers:
+            w.join()
+        for shm in self._handles:
+            shm.close()
+            shm.unlink()
+        self._handles = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(terminate=exc_type is not None)
+
+
+# =============================================================
+# === BATCH MODE (NDJSON) ===
+# =============================================================
+
+def parse_batch_request(line):
+    """
+    Parses one NDJSON request line. Route requests use the /find-path body
+    fields: startBuildingCode, startRoom, goalBuildingCode, goalRoom (+ optional
+    id, engine, budgetMs and epsilon for anytime A*). Other task types set
+    "op" (see POOL_OPS) and are passed through whole.
+    Returns (id, op, args); raises ValueError.
+    """
+    try:
+        req = json.loads(line)
+        op = req.get("op", "route")
+        if op not in POOL_OPS:
+            raise ValueError(f"unknown op '{op}'")
+        if op == "route":
+            budget_ms, epsilon = req.get("budgetMs"), req.get("epsilon")
+            args = (str(req["startBuildingCode"]).lower(), str(req["startRoom"]),
+                    str(req["goalBuildingCode"]).lower(), str(req["goalRoom"]),
+                    str(req.get("engine", "astar")),
+                    float(budget_ms) / 1000.0 if budget_ms is not None else None,
+                    float(epsilon) if epsilon is not None else None)
+        else:
+            args = req
+    except (json.JSONDecodeError, KeyError, TypeError, AttributeError, ValueError) as e:
+        raise ValueError(f"Invalid batch request: {e}")
+    return req.get("id"), op, args
+
+
+def request_buildings(op, args):
+    """Building codes a parsed batch request names (see parse_batch_request)."""
+    if op == "route":
+        return {args[0], args[2]}
+    if op == "matrix":
+        targets = args.get("targets") or []
+        named = [targets] if isinstance(targets, dict) else targets
+        named = list(named) + list(args.get("sources") or [])
+        return {str(t["building"] if isinstance(t, dict) else t[0]).lower() for t in named}
+    return {str(args["building"]).lower()} if "building" in args else set()
+
+
+def _read_lines(lines, inbox):
+    # Reader thread of run_batch: feeds the lines, then None at end of input
+    try:
+        for line in lines:
+            inbox.put(line)
+    finally:
+        inbox.put(None)
+
+
+def run_batch(lines, out, num_workers=None, max_in_flight=None):
+    """
+    Routes every request in `lines` on a RouteWorkerPool and writes one NDJSON
+    result per request to `out` as soon as it completes (completion order, not
+    input order; use "id" to match them up). A building is loaded and shared
+    with the workers the first time a request names it, so a batch only pays
+    for the buildings it uses; as in the single-route CLI, searches only see
+    entrance links between loaded buildings. Lines are read on a background
+    thread so results stream out while input is still arriving; at most
+    `max_in_flight` requests (BATCH_IN_FLIGHT per worker if None) are queued
+    at once, reading pauses until one finishes.
+    """
+    def emit(task_id, result):
+        out.write(json.dumps(dict(result, id=task_id)) + "\n")
+        out.flush()
+
+    def submit(line_no, line):
+        if not line.strip():
+            return
+        try:
+            req_id, op, args = parse_batch_request(line)
+        except ValueError as e:
+            emit(line_no, {"success": False, "error": str(e)})
+            return
+        try:
+            b_codes = request_buildings(op, args)
+        except (KeyError, TypeError, IndexError, AttributeError):
+            b_codes = set() # malformed; the worker reports what is missing
+        # Loading chatter must not end up in the NDJSON stream
+        with contextlib.redirect_stdout(sys.stderr):
+            pool.add_buildings(b_codes)
+        pool.submit_op(line_no if req_id is None else req_id, op, args)
+
+    with RouteWorkerPool(num_workers) as pool:
+        limit = max(max_in_flight or BATCH_IN_FLIGHT * pool.num_workers, 1)
+        inbox = queue.Queue(maxsize=limit)
+        threading.Thread(target=_read_lines, args=(lines, inbox), daemon=True).start()
+
+        line_no, reading = 0, True
+        while reading or pool.pending:
+            if reading and pool.pending < limit:
+                try:
+                    line = inbox.get(timeout=BATCH_POLL_S if pool.pending else None)
+                except queue.Empty:
+                    pass # input idle: drain below
+                else:
+                    if line is None:
+                        reading = False
+                    else:
+                        line_no += 1
+                        submit(line_no, line)
+            else:
+                emit(*next(pool.results())) # full or input done: wait for one
+
+            for task_id, result in pool.results(block=False):
+                emit(task_id, result)
+
+        print(f"Batch done: {json.dumps(pool.stats())}", file=sys.stderr)
+
+
 def main():
+    # Batch mode: --batch <requests.ndjson | -> [--workers N]
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        args = sys.argv[2:]
+        num_workers = None
+        if "--workers" in args:
+            idx = args.index("--workers")
+            num_workers = int(args[idx + 1])
+            del args[idx:idx + 2]
+        source = args[0] if args else "-"
+        if source == "-":
+            run_batch(sys.stdin, sys.stdout, num_workers)
+        else:
+            with open(source, "r") as f:
+                run_batch(f, sys.stdout, num_workers)
+        return
+
+    # Offline build: --build-route-tables [building_code ...]
+    if len(sys.argv) > 1 and sys.argv[1] == "--build-route-tables":
+        b_codes = [b.lower() for b in sys.argv[2:]] or discover_buildings()
+        load_buildings(discover_buildings())
+        for b_code in b_codes:
+            build_route_table(b_code)
+        return
+
+    # Offline build: --build-facility-maps [building_code ...]
+    if len(sys.argv) > 1 and sys.argv[1] == "--build-facility-maps":
+        b_codes = [b.lower() for b in sys.argv[2:]] or discover_buildings()
+        load_buildings(b_codes)
+        for b_code in b_codes:
+            save_facility_maps(b_code)
+        return
+
+    # Offline build: --build-grid-tiles [building_code ...]
+    if len(sys.argv) > 1 and sys.argv[1] == "--build-grid-tiles":
+        b_codes = [b.lower() for b in sys.argv[2:]] or discover_buildings()
+        load_buildings(b_codes)
+        for b_code in b_codes:
+            for floor, grid in sorted(ALL_BUILDING_DATA[b_code]["grids"].items()):
+                out_path = os.path.join(_floor_dir(b_code, floor), GRID_TILES_FILE)
+                mixed, total = gridTiles.save_grid_tiles(grid, out_path)
+                print(f"Saved grid tiles for {b_code} F{floor} ({mixed} of {total} tiles stored) to {out_path}")
+        return
+
+    # Offline build: --build-skeletons [building_code ...]
+    if len(sys.argv) > 1 and sys.argv[1] == "--build-skeletons":
+        b_codes = [b.lower() for b in sys.argv[2:]] or discover_buildings()
+        load_buildings(b_codes)
+        for b_code in b_codes:
+            for floor in sorted(ALL_BUILDING_DATA[b_code]["grids"]):
+                save_skeleton_graph(b_code, floor)
+        return
+
+    # Offline build: --build-visibility-graphs [building_code ...]
+    if len(sys.argv) > 1 and sys.argv[1] == "--build-visibility-graphs":
+        b_codes = [b.lower() for b in sys.argv[2:]] or discover_buildings()
+        load_buildings(b_codes)
+        for b_code in b_codes:
+            for floor in sorted(ALL_BUILDING_DATA[b_code]["grids"]):
+                if os.path.exists(os.path.join(_floor_dir(b_code, floor), "cleaned.dxf")):
+                    save_visibility_graph(b_code, floor)
+        return
+
     # Expect 6 arguments: 
     if len(sys.argv) != 7:
         print("Usage: python pathfinder.py <start_dir> <start_num> <start_loc> <goal_dir> <goal_num> <goal_loc>")
+        print("       python pathfinder.py --batch <requests.ndjson | -> [--workers N]")
+        print("       python pathfinder.py --build-route-tables [building_code ...]")
+        print("       python pathfinder.py --build-facility-maps [building_code ...]")
+        print("       python pathfinder.py --build-grid-tiles [building_code ...]")
+        print("       python pathfinder.py --build-skeletons [building_code ...]")
+        print("       python pathfinder.py --build-visibility-graphs [building_code ...]")
         print("Locations (<start_loc>, <goal_loc>) can be a Room ID (e.g., 101) or an Entrance Label (e.g., entranceNorth).")
         sys.exit(1)
 
@@ -606,115 +3088,41 @@ def main():
     # --- 2. Load Data for ALL required buildings ---
     print(f"\n--- 1. Data Loading ---")
 
-    global ALL_BUILDING_DATA, ROOM_COORDS, STAIRS, ENTRANCES
-    
     required_buildings = set([start_building_code, goal_building_code])
 
-    for b_code in required_buildings:
-        print(f"Loading data for building {b_code}...")
-        try:
-            building_data = load_floor_data(BASE_DIR, b_code)
-            
-            building_stairs_merged = {}
-            
-            ALL_BUILDING_DATA[b_code] = {}
-            ALL_BUILDING_DATA[b_code]["grids"] = {}
-            
-            for floor_num, data in building_data.items():
-                
-                # Store data by floor
-                ALL_BUILDING_DATA[b_code][floor_num] = data
-                ALL_BUILDING_DATA[b_code]["grids"][floor_num] = data["grid"]
-                
-                # Consolidate stairs into the temporary structure
-                for stair_name, floor_map in data["stairs"].items():
-                    building_stairs_merged.setdefault(stair_name, {}).update(floor_map)
-                
-                # Consolidate global ROOM_COORDS
-                for room_id, locations in data["rooms"].items():
-                    ROOM_COORDS.setdefault(room_id, []).extend(
-                        [(b_code, f, r_coord, c_coord) for f, (r_coord, c_coord) in locations]
-                    )
-
-                # Consolidate global ENTRANCES
-                for entrance_label, locations in data["entrances"].items():
-                    ENTRANCES.setdefault(entrance_label, []).extend(
-                        [(b_code, f, r_coord, c_coord) for f, (r_coord, c_coord) in locations]
-                    )
-            
-            # --- Consolidate Merged Stairs into the GLOBAL STAIRS dictionary ---
-            for stair_name, floor_map in building_stairs_merged.items():
-                for floor, (r, c) in floor_map.items():
-                    STAIRS.setdefault(stair_name, {})[(b_code, floor)] = (r, c)
-
-        except FileNotFoundError as e:
-            print(f"Data loading failed for {b_code}: {e}")
-            sys.exit(1)
+    try:
+        load_buildings(required_buildings)
+    except FileNotFoundError as e:
+        print(f"Data loading failed: {e}")
+        sys.exit(1)
             
     if not any(ALL_BUILDING_DATA[b]["grids"] for b in ALL_BUILDING_DATA):
         print(f"Could not load any floor data for the required buildings.")
         sys.exit(1)
 
-    # --- 3. Resolve and locate Start & Goal Locations ---
-    start_locations = resolve_location(start_loc_str, start_building_code, ROOM_COORDS, ENTRANCES)
-    goal_locations = resolve_location(goal_loc_str, goal_building_code, ROOM_COORDS, ENTRANCES)
-
-    if not start_locations:
-        print(f"Error: Could not find location '{start_loc_str}' in building {start_building_code}.")
-        print("Please use a valid Room ID (e.g., 101) or Entrance Label (e.g., entranceNorth).")
-        sys.exit(1)
-        
-    if not goal_locations:
-        print(f"Error: Could not find location '{goal_loc_str}' in building {goal_building_code}.")
-        print("Please use a valid Room ID (e.g., 101) or Entrance Label (e.g., entranceNorth).")
-        sys.exit(1)
-
-
-    # --- 4. Select Closest Label Pair and Prepare States ---
-    print(f"\n--- 2. Pair Selection Debug ---")
-    
-    best_start_flat = None
-    best_goal_flat = None
-    min_cost = float('inf')
-
-    print(f"\n--- Running Cost Comparison ({len(start_locations)}x{len(goal_locations)} checks) ---")
-    for s_flat in start_locations:
-        for g_flat in goal_locations:
-            cost = heuristic(s_flat, g_flat)
-            
-            if cost < min_cost:
-                min_cost = cost
-                best_start_flat = s_flat
-                best_goal_flat = g_flat
-
-    if not best_start_flat or not best_goal_flat:
-        print("Error: Could not determine start/goal points from labels.")
+    # --- 3. Resolve, pick the closest label pair and run pathfinding ---
+    print(f"\n--- 2. Route Search ---")
+    try:
+        route = find_route(start_building_code, start_loc_str, goal_building_code, goal_loc_str)
+    except LookupError as e:
+        print(e)
         sys.exit(1)
 
-    # 5. Use the closest pair for pathfinding
-    start = snap_to_free(best_start_flat)
-    goal = snap_to_free(best_goal_flat)
+    start, goal = route["start"], route["goal"]
+    smoothed_path = route["smoothed"]
 
     print(f"\n--- 3. Final Selection ---")
     print(f"Start location '{start_loc_str}' -> Final Grid {start}")
     print(f"Goal location '{goal_loc_str}' -> Final Grid {goal}")
 
-    # --- 6. Run pathfinding ---
-    path = astar_multi_floor(start, goal)
-    
-    if not path:
-        print("No path found!")
-        sys.exit(1)
-
     print(f"\n--- 4. Path Results ---")
-    print(f"Raw path found: {len(path)} steps")
+    print(f"Raw path found: {route['steps']} steps")
     
-    smoothed_path = smooth_path(path)
     save_path_array(smoothed_path) 
     
     print(f"Smoothed path: {len(smoothed_path)} key steps")
 
-    # --- 7. Visualize the path (Grid plot and Image Overlay) ---
+    # --- 5. Visualize the path (Grid plot and Image Overlay) ---
     visualize_path(smoothed_path, start, goal) # Saves *_full.png
 
     if len(smoothed_path) > 20:
@@ -724,4 +3132,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
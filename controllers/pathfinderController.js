@@ -4,6 +4,48 @@ import { fileURLToPath } from "url";
 
 const __dirname = path.dirname(fileURLToPath(import.meta.url));
 
+// Identical route queries that arrive while one is already running share that
+// run (and the images / final_path.json it renders) instead of spawning their own.
+const inFlight = new Map(); // normalized query key -> callbacks waiting on the run
+const coalescingStats = { requests: 0, runs: 0, coalesced: 0 };
+
+export const getPathRequestStats = () => ({ ...coalescingStats, inFlight: inFlight.size });
+
+// Building codes and locations are matched case-insensitively by the script
+const queryKey = (scriptArgs) =>
+    scriptArgs.map((arg) => String(arg ?? "").trim().toLowerCase()).join("|");
+
+const runPathfinder = (scriptPath, scriptArgs, callback) => {
+    const key = queryKey(scriptArgs);
+    coalescingStats.requests += 1;
+
+    if (inFlight.has(key)) {
+        coalescingStats.coalesced += 1;
+        console.log("Joining in-flight pathfinder run…");
+        inFlight.get(key).push(callback);
+        return;
+    }
+
+    const waiters = [callback];
+    inFlight.set(key, waiters);
+    coalescingStats.runs += 1;
+
+    console.log("Running python script…");
+
+    execFile("python3", [scriptPath, ...scriptArgs], { cwd: path.join(__dirname, "../") }, (err, stdout, stderr) => {
+        // Cleared before notifying, so a failing waiter cannot leave the key joined forever
+        inFlight.delete(key);
+        waiters.forEach((waiter) => {
+            try {
+                waiter(err, stdout, stderr);
+            } catch (waiterErr) {
+                // One broken response must not leave the other requests hanging
+                console.error("Pathfinder waiter failed:", waiterErr);
+            }
+        });
+    });
+};
+
 export const handlePathRequest = (req, res) => {
     console.log("REQ BODY:", req.body);
     const { startBuildingCode, startRoom, goalBuildingCode, goalRoom } = req.body;
@@ -24,9 +66,7 @@ export const handlePathRequest = (req, res) => {
         goalRoom
     ];
 
-    console.log("Running python script…");
-
-    execFile("python3", [scriptPath, ...scriptArgs], { cwd: path.join(__dirname, "../") }, (err, stdout, stderr) => {
+    runPathfinder(scriptPath, scriptArgs, (err, stdout, stderr) => {
         if (err) {
             console.error(stderr);
             return res.status(500).json({
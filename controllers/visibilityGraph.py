@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Vector visibility-graph geometry for pathFindingRoom.py.
+
+Builds a routing graph directly from the wall segments of a floor's
+cleaned.dxf: nodes sit just outside reflex wall corners (inflated by a
+clearance radius), along both sides of the walls and at the floor's label
+points (rooms, stairs, entrances); edges join nodes that can see each other.
+Everything is in DXF coordinates, so precision does not depend on the grid's
+cell_size, and memory grows with the walls and labels rather than the floor
+area.
+"""
+
+import math
+import numpy as np
+
+# === CONFIG ===
+CLEARANCE = 1.0        # keep routes this far from walls (DXF units)
+MAX_EDGE = 150.0       # only link nodes closer than this (DXF units)
+WALL_SPACING = 60.0    # nodes along both sides of every wall, so curved or corner-free corridors are covered
+MIN_TURN_DEG = 20.0    # ignore near-straight vertices (arcs drawn as many short lines)
+
+# =============================================================
+# === DXF INPUT ===
+# =============================================================
+
+def load_wall_segments(dxf_path):
+    """
+    Reads every LINE / LWPOLYLINE / POLYLINE of a DXF as straight segments.
+    Returns: float64 array (n, 4) of x1, y1, x2, y2
+    """
+    import ezdxf # only needed when (re)building a graph
+
+    doc = ezdxf.readfile(dxf_path)
+    msp = doc.modelspace()
+    segments = []
+
+    for e in msp.query("LINE"):
+        start, end = e.dxf.start, e.dxf.end
+        segments.append((start.x, start.y, end.x, end.y))
+
+    polylines = [[tuple(p[0:2]) for p in e.get_points()] for e in msp.query("LWPOLYLINE")]
+    polylines += [[(v.dxf.location.x, v.dxf.location.y) for v in e.vertices] for e in msp.query("POLYLINE")]
+    for pts in polylines:
+        segments += [(x1, y1, x2, y2) for (x1, y1), (x2, y2) in zip(pts, pts[1:])]
+
+    segments = np.array(segments, dtype=np.float64).reshape(-1, 4)
+    # Drop zero-length segments
+    return segments[np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1]) > 0]
+
+# =============================================================
+# === SPATIAL INDEX ===
+# =============================================================
+
+class SegmentIndex:
+    """
+    Uniform-grid spatial hash over wall segments: each bucket lists the
+    segments whose bounding box overlaps it, so intersection and clearance
+    tests only look at walls near the query.
+    """
+
+    def __init__(self, segments, cell=None):
+        self.segments = segments
+        xs = np.concatenate([segments[:, 0], segments[:, 2]])
+        ys = np.concatenate([segments[:, 1], segments[:, 3]])
+        self.min_x, self.min_y = xs.min(), ys.min()
+        extent = max(xs.max() - self.min_x, ys.max() - self.min_y, 1.0)
+        self.cell = cell or extent / 64.0
+
+        buckets = {}
+        lo_x, hi_x = self._cells(np.minimum(segments[:, 0], segments[:, 2]), np.maximum(segments[:, 0], segments[:, 2]), self.min_x)
+        lo_y, hi_y = self._cells(np.minimum(segments[:, 1], segments[:, 3]), np.maximum(segments[:, 1], segments[:, 3]), self.min_y)
+        for i in range(len(segments)):
+            for cx in range(lo_x[i], hi_x[i] + 1):
+                for cy in range(lo_y[i], hi_y[i] + 1):
+                    buckets.setdefault((cx, cy), []).append(i)
+        self.buckets = {k: np.array(v, dtype=np.int64) for k, v in buckets.items()}
+
+    def _cells(self, lo, hi, origin):
+        return (np.floor((lo - origin) / self.cell).astype(int),
+                np.floor((hi - origin) / self.cell).astype(int))
+
+    def query_bbox(self, x0, y0, x1, y1):
+        """Indices of segments whose bucket overlaps the box."""
+        cx0, cx1 = int(math.floor((x0 - self.min_x) / self.cell)), int(math.floor((x1 - self.min_x) / self.cell))
+        cy0, cy1 = int(math.floor((y0 - self.min_y) / self.cell)), int(math.floor((y1 - self.min_y) / self.cell))
+        found = [self.buckets[(cx, cy)] for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)
+                 if (cx, cy) in self.buckets]
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def blocked(self, p, targets, clearance=0.0):
+        """
+        For a point p (2,) and target points (k, 2): True where the straight
+        segment p -> target crosses or touches a wall, passes within
+        `clearance` of a wall end, or comes within `clearance` of any part of
+        a wall away from its own ends. A start or goal may sit next to a wall,
+        so the first and last 2 * clearance of the leg only have to avoid
+        crossing walls and wall ends.
+        """
+        targets = np.asarray(targets, dtype=np.float64).reshape(-1, 2)
+        if len(targets) == 0:
+            return np.zeros(0, dtype=bool)
+        xs = np.append(targets[:, 0], p[0]); ys = np.append(targets[:, 1], p[1])
+        walls = self.segments[self.query_bbox(xs.min() - clearance, ys.min() - clearance,
+                                              xs.max() + clearance, ys.max() + clearance)]
+        if len(walls) == 0:
+            return np.zeros(len(targets), dtype=bool)
+
+        ax, ay, bx, by = (walls[:, i][None, :] for i in range(4))
+        px, py = p[0], p[1]
+        qx, qy = targets[:, 0:1], targets[:, 1:2]
+
+        def orient(x1, y1, x2, y2, x3, y3):
+            return np.sign((x2 - x1) * (y3 - y1) - (y2 - y1) * (x3 - x1))
+
+        o1 = orient(px, py, qx, qy, ax, ay)
+        o2 = orient(px, py, qx, qy, bx, by)
+        o3 = orient(ax, ay, bx, by, px, py)
+        o4 = orient(ax, ay, bx, by, qx, qy)
+        hits = (o1 * o2 <= 0) & (o3 * o4 <= 0)
+        # Collinear but disjoint segments give o1 = o2 = o3 = o4 = 0; require overlap
+        collinear = (o1 == 0) & (o2 == 0)
+        if collinear.any():
+            overlap_x = (np.maximum(np.minimum(ax, bx), np.minimum(px, qx)) <= np.minimum(np.maximum(ax, bx), np.maximum(px, qx)))
+            overlap_y = (np.maximum(np.minimum(ay, by), np.minimum(py, qy)) <= np.minimum(np.maximum(ay, by), np.maximum(py, qy)))
+            hits &= ~collinear | (overlap_x & overlap_y)
+        if clearance > 0:
+            # Non-crossing segments are closest at an endpoint of one of them:
+            # wall ends against the whole leg ...
+            dx, dy = qx - px, qy - py
+            length2 = np.maximum(dx * dx + dy * dy, 1e-12)
+            for ex, ey in ((ax, ay), (bx, by)):
+                t = np.clip(((ex - px) * dx + (ey - py) * dy) / length2, 0.0, 1.0)
+                hits |= np.hypot(px + t * dx - ex, py + t * dy - ey) < clearance
+            # ... and the ends of the leg, less its end stubs, against the whole wall
+            length = np.sqrt(length2)
+            trim = np.minimum(2 * clearance, length / 2) / length
+            for t in (trim, 1 - trim):
+                hits |= segment_distance(px + t * dx, py + t * dy, ax, ay, bx, by) < clearance
+        return hits.any(axis=1)
+
+    def clearance(self, points, radius):
+        """Distance from each point (k, 2) to its nearest wall, capped at `radius`."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        result = np.full(len(points), radius)
+        for i, (x, y) in enumerate(points):
+            walls = self.segments[self.query_bbox(x - radius, y - radius, x + radius, y + radius)]
+            if len(walls):
+                result[i] = min(radius, point_segment_distance(x, y, walls).min())
+        return result
+
+
+def point_segment_distance(x, y, walls):
+    """Distances from one point to each segment in walls (n, 4)."""
+    return segment_distance(x, y, walls[:, 0], walls[:, 1], walls[:, 2], walls[:, 3])
+
+
+def segment_distance(x, y, ax, ay, bx, by):
+    """Distances from points (x, y) to segments (ax, ay)-(bx, by), with numpy broadcasting."""
+    dx, dy = bx - ax, by - ay
+    t = np.clip(((x - ax) * dx + (y - ay) * dy) / np.maximum(dx * dx + dy * dy, 1e-12), 0.0, 1.0)
+    return np.hypot(ax + t * dx - x, ay + t * dy - y)
+
+# =============================================================
+# === GRAPH CONSTRUCTION ===
+# =============================================================
+
+def corner_nodes(segments, clearance=CLEARANCE, min_turn_deg=MIN_TURN_DEG):
+    """
+    Candidate nodes just outside reflex corners. Segment endpoints are grouped
+    into vertices; wherever the free-space angle between consecutive incident
+    walls exceeds 180 degrees (plus min_turn_deg), nodes are placed inside that
+    gap at distance 1.5 * clearance from the vertex. Free wall ends get two
+    nodes so routes can pass on either side.
+    """
+    tol = clearance / 4.0
+    ends = np.concatenate([segments[:, 0:2], segments[:, 2:4]])
+    others = np.concatenate([segments[:, 2:4], segments[:, 0:2]])
+    keys = np.round(ends / tol).astype(np.int64)
+
+    incident = {}
+    for key, end, other in zip(map(tuple, keys), ends, others):
+        v = incident.setdefault(key, [end, []])
+        v[1].append(math.atan2(other[1] - end[1], other[0] - end[0]))
+
+    nodes = []
+    reflex = math.pi + math.radians(min_turn_deg)
+    for (x, y), angles in incident.values():
+        angles = sorted(angles)
+        gaps = [(angles[(i + 1) % len(angles)] - a) % (2 * math.pi) or 2 * math.pi for i, a in enumerate(angles)]
+        for a, gap in zip(angles, gaps):
+            if gap <= reflex:
+                continue
+            count = 1 if gap <= 1.5 * math.pi else 2
+            for k in range(1, count + 1):
+                theta = a + gap * k / (count + 1)
+                nodes.append((x + 1.5 * clearance * math.cos(theta), y + 1.5 * clearance * math.sin(theta)))
+    return np.array(nodes, dtype=np.float64).reshape(-1, 2)
+
+
+def wall_nodes(segments, clearance=CLEARANCE, spacing=WALL_SPACING):
+    """
+    Points every `spacing` along the walls, measured over the whole segment
+    list so walls drawn as many short segments (arcs, curved corridors) are
+    sampled too, placed 1.5 * clearance off the wall on both sides.
+    """
+    p, q = segments[:, 0:2], segments[:, 2:4]
+    length = np.hypot(q[:, 0] - p[:, 0], q[:, 1] - p[:, 1])
+    ends = np.cumsum(length)
+    marks = np.arange(spacing / 2, ends[-1], spacing)
+    seg = np.searchsorted(ends, marks, side="right")
+    t = ((marks - (ends[seg] - length[seg])) / length[seg])[:, None]
+    points = p[seg] + t * (q[seg] - p[seg])
+    normals = np.column_stack([p[seg, 1] - q[seg, 1], q[seg, 0] - p[seg, 0]]) / length[seg][:, None]
+    return np.concatenate([points + 1.5 * clearance * normals, points - 1.5 * clearance * normals])
+
+
+def build_visibility_graph(segments, anchors=(), clearance=CLEARANCE, max_edge=MAX_EDGE, wall_spacing=WALL_SPACING):
+    """
+    Builds the visibility graph for one floor. This is the slow, offline part
+    (tens of seconds per floor); pathFindingRoom.py --build-visibility-graphs
+    runs it and the router only loads the result.
+    anchors: extra (x, y) nodes, the floor's label points.
+    Returns: {"nodes": (n, 2) DXF points, "edges": (m, 3) [i, j, length]}
+    """
+    index = SegmentIndex(segments)
+    nodes = np.concatenate([corner_nodes(segments, clearance), wall_nodes(segments, clearance, wall_spacing),
+                            np.asarray(anchors, dtype=np.float64).reshape(-1, 2)])
+
+    # Keep nodes with enough clearance, merging near-duplicates
+    nodes = nodes[index.clearance(nodes, clearance) >= clearance * 0.99]
+    _, keep = np.unique(np.round(nodes / (clearance / 2)).astype(np.int64), axis=0, return_index=True)
+    nodes = nodes[np.sort(keep)]
+
+    edges = []
+    for i in range(len(nodes) - 1):
+        others = nodes[i + 1:]
+        lengths = np.hypot(others[:, 0] - nodes[i, 0], others[:, 1] - nodes[i, 1])
+        near = np.nonzero(lengths <= max_edge)[0]
+        if near.size == 0:
+            continue
+        visible = near[~index.blocked(nodes[i], others[near], clearance)]
+        edges += [(i, i + 1 + j, lengths[j]) for j in visible.tolist()]
+
+    return {
+        "nodes": nodes,
+        "edges": np.array(edges, dtype=np.float64).reshape(-1, 3),
+    }
+
+
+def visible_nodes(index, nodes, point, max_edge=MAX_EDGE, clearance=CLEARANCE):
+    """Indices and distances of graph nodes visible from an arbitrary point."""
+    lengths = np.hypot(nodes[:, 0] - point[0], nodes[:, 1] - point[1])
+    near = np.nonzero(lengths <= max_edge)[0]
+    visible = near[~index.blocked(np.asarray(point, dtype=np.float64), nodes[near], clearance)]
+    return visible, lengths[visible]
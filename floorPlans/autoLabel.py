@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Automatic room labeling from the text of the original plan.
+
+Room numbers, stairs and entrances are read from the TEXT / MTEXT entities of
+the source DXF or, when it has none, from the text layer of the source PDF
+(PyMuPDF, optional). Strings that match LABEL_PATTERNS are normalised to the
+names the pathfinder understands ('1840', 'stairs A', 'entranceNorth') and
+written to <floor>/labels.json in the {x, y, label} schema of the manual
+tool, at the text's position in DXF coordinates. Text outside the zoomed
+plan (title block, legend) is dropped.
+
+Plans whose text was exported as outlined glyphs carry neither, so they
+still need the interactive labeler; it now starts from the existing
+labels.json and is used to review/correct them.
+
+Usage: python floorPlans/autoLabel.py <code|glob> [...] [--merge | --force]
+       (default: only floors without a labels.json; --merge adds labels that
+        are not there yet at that position; --force replaces the file)
+"""
+
+import json
+import os
+import re
+import sys
+
+import dxfGeometry
+import newFloorPlan as nfp
+
+# === CONFIG ===
+TEXT_TYPES = ("TEXT", "MTEXT")
+DIRECTIONS = ("north", "south", "east", "west")
+REVIEW_RADIUS = 8 # display px: a click this close to a label edits it (review)
+MERGE_RADIUS = 5.0 # DXF units: the same label this close to an existing one is that label (--merge)
+
+# pattern -> label builder, tried in order on whitespace-normalised text
+LABEL_PATTERNS = [
+    (re.compile(r"^(?:rm\.?|room)?\s*(\d{3,4})$", re.I),
+     lambda m: m.group(1)),
+    (re.compile(r"^stairs?\s*([a-z])$", re.I),
+     lambda m: f"stairs {m.group(1).upper()}"),
+    (re.compile(rf"^(?:({'|'.join(DIRECTIONS)})\s*)?entrance(?:\s*({'|'.join(DIRECTIONS)}))?$", re.I),
+     lambda m: "entrance" + (m.group(1) or m.group(2) or "").capitalize()),
+]
+
+# =============================================================
+# === TEXT SOURCES ===
+# =============================================================
+
+def normalize_label(text):
+    """Label for a plan string ('RM 1840' -> '1840'), None when it is not one."""
+    text = " ".join(text.replace("\\P", " ").split()).strip(" .:-")
+    for pattern, build in LABEL_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            return build(match)
+    return None
+
+
+def dxf_text_items(path):
+    """(text, x, y) of every TEXT / MTEXT entity, streamed."""
+    items = []
+    for e in dxfGeometry.iter_entities(path, TEXT_TYPES):
+        insert = e.dxf.insert
+        items.append((e.plain_text(), insert.x, insert.y))
+    return items
+
+
+def pdf_text_items(path):
+    """
+    (text, x, y) of every text line on the first PDF page, in PDF user space
+    (y up), which is the DXF frame of the pdf2dxf exports. [] without PyMuPDF.
+    """
+    try:
+        import fitz
+    except ImportError:
+        print(f"[!] PyMuPDF is not installed; skipping the text layer of {path}.")
+        return []
+
+    with fitz.open(path) as doc:
+        page = doc[0]
+        height = page.mediabox.height
+        lines = {}
+        for x0, y0, x1, y1, word, block, line, _ in page.get_text("words"):
+            rect = fitz.Rect(x0, y0, x1, y1) * page.derotation_matrix
+            lines.setdefault((block, line), []).append((word, rect))
+
+    items = []
+    for words in lines.values():
+        # A whole line ('STAIR A') and each of its words ('1840 OFFICE') can be a label
+        for text, rects in [(" ".join(w for w, _ in words), [r for _, r in words])] + [(w, [r]) for w, r in words]:
+            x = sum((r.x0 + r.x1) / 2 for r in rects) / len(rects)
+            y = sum((r.y0 + r.y1) / 2 for r in rects) / len(rects)
+            items.append((text, x, height - y))
+    return items
+
+
+def find_source_pdf(folder_path, building_code):
+    # Same naming as the source DXF: <code>.pdf or <code>Plan.pdf
+    for name in (f"{building_code}.pdf", f"{building_code}Plan.pdf"):
+        if os.path.exists(f"{folder_path}/{name}"):
+            return f"{folder_path}/{name}"
+    return None
+
+# =============================================================
+# === LABELS ===
+# =============================================================
+
+def auto_label(building_code):
+    """
+    Labels found in the plan text of one floor, inside the zoomed plan.
+    Returns: (points, source) with source 'dxf', 'pdf' or None (no usable text)
+    """
+    paths = nfp.floor_paths(building_code)
+    bounds_path = paths["cleaned"] if os.path.exists(paths["cleaned"]) else paths["cropped"]
+    min_x, max_x, min_y, max_y = dxfGeometry.load_geometry(bounds_path).bounds()
+
+    sources = []
+    if os.path.exists(paths["source"]):
+        sources.append(("dxf", lambda: dxf_text_items(paths["source"])))
+    pdf = find_source_pdf(paths["folder"], building_code)
+    if pdf:
+        sources.append(("pdf", lambda: pdf_text_items(pdf)))
+
+    for source, read_items in sources:
+        points = []
+        for text, x, y in read_items():
+            label = normalize_label(text)
+            point = {"x": round(float(x), 2), "y": round(float(y), 2), "label": label}
+            if label and min_x <= x <= max_x and min_y <= y <= max_y and point not in points:
+                points.append(point)
+        if points:
+            return points, source
+    return [], None
+
+
+def load_labels(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_labels(path, points):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(points, f, indent=2)
+
+
+def nearest_label(points, x, y, radius):
+    """Index of the point closest to (x, y) within radius, else None (review clicks)."""
+    best, best_d2 = None, radius * radius
+    for i, p in enumerate(points):
+        d2 = (p["x"] - x) ** 2 + (p["y"] - y) ** 2
+        if d2 <= best_d2:
+            best, best_d2 = i, d2
+    return best
+
+
+def label_floor(building_code, mode="missing"):
+    """
+    Writes auto labels for one floor. mode: 'missing' (only without a
+    labels.json), 'merge' (append labels not present yet at that position,
+    within MERGE_RADIUS) or 'force'.
+    Returns: (number of labels written, message)
+    """
+    paths = nfp.floor_paths(building_code)
+    existing = load_labels(paths["labels"])
+    if existing and mode == "missing":
+        return 0, "has labels.json"
+
+    points, source = auto_label(building_code)
+    if not points:
+        return 0, "no room/stair/entrance text in the plan; label it with newFloorPlan.py"
+
+    if mode == "merge":
+        # Keyed by label and position: 'stairs A' and entrances occur more than once per floor
+        new = [p for p in points
+               if nearest_label([q for q in existing if q["label"].strip().lower() == p["label"].lower()],
+                                p["x"], p["y"], MERGE_RADIUS) is None]
+        points = existing + new
+        added = len(new)
+    else:
+        added = len(points)
+    save_labels(paths["labels"], points)
+    return added, f"from {source} text -> {paths['labels']}"
+
+
+def main():
+    args = sys.argv[1:]
+    mode = "missing"
+    for flag in ("--merge", "--force"):
+        if flag in args:
+            args.remove(flag)
+            mode = flag[2:]
+    if not args:
+        print("Usage: python floorPlans/autoLabel.py <code|glob> [...] [--merge | --force]")
+        sys.exit(1)
+
+    codes = nfp.find_floor_codes(args)
+    if not codes:
+        print(f"No floors match {' '.join(args)}.")
+        sys.exit(1)
+    for code in codes:
+        try:
+            added, message = label_floor(code, mode)
+        except (FileNotFoundError, ValueError) as e:
+            added, message = 0, str(e)
+        print(f"{code:<8} {added:>4} label(s)  {message}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the automatable floor-plan stages on the committed floors.
+
+For every floor under floorPlans/se and floorPlans/sw that has the inputs,
+each stage runs headless (Agg backend, no windows) against a scratch copy of
+its outputs, so the committed artifacts are never touched:
+
+    scrape   <code>.dxf -> scraped.dxf          (newFloorPlan.scrape)
+    zoom     scraped.dxf -> cropped.dxf         (newFloorPlan.zoom, show=False)
+    grid     cleaned.dxf -> grid + meta         (generate_grid.dxf_to_grid)
+    labels   labels.json -> grid (row, col)     (the pathfinder's to_grid_coords; not timed)
+
+Per timed stage it records the first run on an empty geometry cache (cold_s),
+the median of the following runs (wall_s) and the tracemalloc peak of one run
+(peak_kb); every stage records what came out (entity counts, grid shape).
+The outputs must match BASELINE_FILE exactly. Times depend on the machine,
+so they are only compared on request, against results saved with --output
+on the same machine (e.g. before a change): wall_s may not grow by more than
+TIME_TOLERANCE.
+
+Usage: python floorPlans/benchmark.py [code|glob ...] [--repeat N] [--save-baseline] [--output results.json] [--times-against results.json]
+"""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import matplotlib
+matplotlib.use("Agg") # stub the GUI: plt.show() becomes a no-op
+
+import dxfGeometry
+import generate_grid
+import newFloorPlan as nfp
+
+# === CONFIG ===
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+DEFAULT_FLOORS = ["se*", "sw*"]
+REPEAT = 3             # warm runs per stage (after the cold one)
+TIME_TOLERANCE = 1.5   # wall_s above baseline * this is a regression
+MIN_TIME_S = 0.005     # below this, timings are noise and not compared
+TIMING_KEYS = ("cold_s", "wall_s", "peak_kb")
+UNTIMED_STAGES = {"labels"} # too fast to time; only its output is checked
+
+# =============================================================
+# === STAGES ===
+# =============================================================
+
+def label_cells(labels, meta):
+    """Labels -> grid (row, col), exactly as pathFindingRoom.load_floor_data converts them."""
+    min_x, max_y, cell_size = meta["min_x"], meta["max_y"], meta["cell_size"]
+    return [(int((max_y - item["y"]) / cell_size), int((item["x"] - min_x) / cell_size)) for item in labels]
+
+
+def floor_stages(paths, scratch):
+    """
+    (name, run) pairs for one floor; run() does the work and returns the
+    stage's output counts. Stages whose inputs are not committed are left out.
+    """
+    out = dict(paths, scraped=f"{scratch}/scraped.dxf", cropped=f"{scratch}/cropped.dxf")
+    stages = []
+
+    if os.path.exists(paths["source"]):
+        def scrape():
+            nfp.scrape(out)
+            return {"polylines": len(dxfGeometry.load_geometry(out["scraped"]))}
+        stages.append(("scrape", scrape))
+
+        def zoom():
+            nfp.zoom(out, show=False)
+            return {"polylines": len(dxfGeometry.load_geometry(out["cropped"]))}
+        stages.append(("zoom", zoom))
+
+    if os.path.exists(paths["cleaned"]):
+        def grid():
+            grid, _ = generate_grid.dxf_to_grid(paths["cleaned"], nfp.cell_size, nfp.BOUNDARY_BUFFER)
+            return {"polylines": len(dxfGeometry.load_geometry(paths["cleaned"])),
+                    "grid_shape": list(grid.shape), "wall_cells": int(grid.sum())}
+        stages.append(("grid", grid))
+
+    if os.path.exists(paths["labels"]) and os.path.exists(paths["meta"]):
+        with open(paths["labels"], "r", encoding="utf-8") as f:
+            labels = json.load(f)
+        with open(paths["meta"], "r") as f:
+            meta = json.load(f)
+        shape = None
+        if os.path.exists(paths["grid"]):
+            shape = np.load(paths["grid"], mmap_mode="r").shape
+
+        def labels_stage():
+            cells = label_cells(labels, meta)
+            off_grid = sum(1 for r, c in cells if shape and not (0 <= r < shape[0] and 0 <= c < shape[1]))
+            return {"labels": len(cells), "off_grid": off_grid}
+        stages.append(("labels", labels_stage))
+
+    return stages
+
+
+def measure(run, repeat):
+    """Cold run, one traced run for the memory peak, then `repeat` timed warm runs."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        counts = run()
+        cold = time.perf_counter() - start
+
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+
+    return {"cold_s": round(cold, 4), "wall_s": round(statistics.median(times), 4),
+            "peak_kb": round(peak / 1024), **counts}
+
+
+def run_benchmark(patterns, repeat=REPEAT):
+    """{code: {stage: record}} for the matching floors."""
+    results = {}
+    scratch_root = tempfile.mkdtemp(prefix="floorplan-bench-")
+    cache_dir = dxfGeometry.CACHE_DIR
+    try:
+        # A private, initially empty geometry cache: cold runs really parse
+        dxfGeometry.CACHE_DIR = os.path.join(scratch_root, "geometry_cache")
+        for code in nfp.find_floor_codes(patterns):
+            scratch = os.path.join(scratch_root, code)
+            os.makedirs(scratch)
+            records = {}
+            for name, run in floor_stages(nfp.floor_paths(code), scratch):
+                try:
+                    records[name] = run() if name in UNTIMED_STAGES else measure(run, repeat)
+                except (FileNotFoundError, ValueError) as e:
+                    records[name] = {"error": str(e)}
+            if records:
+                results[code] = records
+    finally:
+        dxfGeometry.CACHE_DIR = cache_dir
+        shutil.rmtree(scratch_root, ignore_errors=True)
+    return results
+
+# =============================================================
+# === BASELINE ===
+# =============================================================
+
+def outputs_only(results):
+    """results without the timing keys, as stored in BASELINE_FILE."""
+    return {code: {name: {k: v for k, v in record.items() if k not in TIMING_KEYS}
+                   for name, record in stages.items()}
+            for code, stages in results.items()}
+
+
+def compare(results, baseline, times=None):
+    """
+    Human-readable regressions ([] when none): outputs that differ from the
+    baseline and, with times (results of an earlier run on this machine),
+    wall_s that grew by more than TIME_TOLERANCE.
+    """
+    problems = []
+    for code, stages in results.items():
+        for name, record in stages.items():
+            base = baseline.get(code, {}).get(name)
+            if base is not None:
+                for key, value in record.items():
+                    if key in TIMING_KEYS or key not in base:
+                        continue
+                    if value != base[key]:
+                        problems.append(f"{code} {name}: {key} {base[key]} -> {value}")
+            before = (times or {}).get(code, {}).get(name, {}).get("wall_s")
+            if "wall_s" in record and before is not None and before >= MIN_TIME_S \
+                    and record["wall_s"] > before * TIME_TOLERANCE:
+                problems.append(f"{code} {name}: wall_s {before} -> {record['wall_s']}")
+    return problems
+
+
+def print_table(results, times=None):
+    print(f"\n{'floor':<8} {'stage':<7} {'wall_s':>8} {'before':>8} {'cold_s':>8} {'peak_kb':>8}  output")
+    for code, stages in results.items():
+        for name, record in stages.items():
+            if "error" in record:
+                print(f"{code:<8} {name:<7} {record['error']}")
+                continue
+            before = (times or {}).get(code, {}).get(name, {}).get("wall_s")
+            output = ", ".join(f"{k}={v}" for k, v in record.items() if k not in TIMING_KEYS)
+            wall, cold = (f"{record[k]:>8.4f}" if k in record else f"{'-':>8}" for k in ("wall_s", "cold_s"))
+            print(f"{code:<8} {name:<7} {wall} {before if before is not None else '-':>8} "
+                  f"{cold} {record.get('peak_kb', '-'):>8}  {output}")
+
+
+def load_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    args = sys.argv[1:]
+    repeat, save, output, times_file = REPEAT, False, None, None
+    if "--save-baseline" in args:
+        args.remove("--save-baseline")
+        save = True
+    if "--repeat" in args:
+        i = args.index("--repeat")
+        repeat = int(args[i + 1])
+        del args[i:i + 2]
+    if "--output" in args:
+        i = args.index("--output")
+        output = args[i + 1]
+        del args[i:i + 2]
+    if "--times-against" in args:
+        i = args.index("--times-against")
+        times_file = args[i + 1]
+        del args[i:i + 2]
+    if any(a.startswith("--") for a in args) or repeat < 1:
+        print("Usage: python floorPlans/benchmark.py [code|glob ...] [--repeat N] [--save-baseline] [--output results.json] [--times-against results.json]")
+        sys.exit(1)
+    if times_file and not os.path.exists(times_file):
+        print(f"Error: {times_file} does not exist; save one with --output first. Exiting.")
+        sys.exit(1)
+
+    results = run_benchmark(args or DEFAULT_FLOORS, repeat)
+    if not results:
+        print(f"No benchmarkable floors match {' '.join(args or DEFAULT_FLOORS)}.")
+        sys.exit(1)
+
+    baseline = load_json(BASELINE_FILE)
+    times = load_json(times_file) if times_file else None
+    print_table(results, times)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\n[x] Saved results -> {output}")
+
+    if save:
+        baseline.update(outputs_only(results))
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\n[x] Saved baseline -> {BASELINE_FILE}")
+        return
+
+    problems = compare(results, baseline, times)
+    if not baseline:
+        print("\nNo baseline yet; create one with --save-baseline.")
+    if problems:
+        print("\n--- Regressions" + (f" (times against {times_file})" if times else "") + " ---")
+        for problem in problems:
+            print(problem)
+        sys.exit(1)
+    elif baseline or times:
+        print("\n[x] No regressions" + (f" (times against {times_file})." if times else "; times not compared."))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Incremental, content-hashed build of the floor-plan artifacts.
+
+Every floor is the same small DAG of automatable stages:
+
+    <code>.dxf --scrape--> scraped.dxf --zoom--> cropped.dxf --replay-edits--> cleaned.dxf --grid--> floorplan_grid.npy, meta.json
+                                                 edits.json ------^
+
+<floor>/build_manifest.json records, per stage, the hashes of its inputs, the
+parameter values it ran with and the hashes of its outputs. A stage with
+no record yet whose outputs all exist (a fresh clone) records the files on
+disk as they are instead of rebuilding them (unless one of its parameters
+is overridden with --set). A stage reruns only when one
+of those differs (or an output is missing), so a parameter
+tweak rebuilds just that stage and whatever it actually changed downstream.
+When only cleaned.dxf changed, the grid stage regrids just the changed
+entities (newFloorPlan.regrid), keeping meta.json and the labels' cells.
+DXF artifacts are hashed by geometry (dxfGeometry.geometry_digest), so a
+rewritten but identical file stops the cascade. cleaned.dxf without an
+edits.json is hand-made and only ever read; labels.json is generated once
+from the plan text (autoLabel.py) when missing and otherwise left alone.
+
+Usage: python floorPlans/buildPipeline.py <code|glob> [...] [--workers N] [--force] [--dry-run] [--set name=value ...]
+       e.g. python floorPlans/buildPipeline.py "s*" --set SCRAPE_MIN_DIAG=40
+"""
+
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import autoLabel
+import dxfGeometry
+import editLog
+import newFloorPlan as nfp
+
+# === CONFIG ===
+MANIFEST_FILE = "build_manifest.json"
+DXF_ARTIFACTS = {"scraped", "cropped", "cleaned"} # hashed by geometry, not bytes
+
+# name, input keys, output keys, parameters (module globals of newFloorPlan.py)
+STAGES = [
+    ("scrape", ["source"], ["scraped"], ["SCRAPE_MIN_DIAG"]),
+    ("zoom", ["scraped"], ["cropped"], ["zoom_ratio", "zoom_factor", "cell_size"]),
+    ("replay-edits", ["cropped", "edits"], ["cleaned"], []),
+    ("grid", ["cleaned"], ["grid", "meta"], ["BOUNDARY_BUFFER", "cell_size"]),
+]
+PARAMETERS = sorted({p for _, _, _, params in STAGES for p in params})
+
+def _run_stage(name, paths, incremental=False):
+    if name == "scrape":
+        nfp.scrape(paths)
+    elif name == "zoom":
+        nfp.zoom(paths, show=False)
+    elif name == "replay-edits":
+        editLog.replay_edits(paths["cropped"], paths["edits"], paths["cleaned"])
+    elif name == "grid" and incremental:
+        nfp.regrid(paths)
+    elif name == "grid":
+        nfp.generate_grid(paths, show=False)
+
+# =============================================================
+# === MANIFEST ===
+# =============================================================
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def artifact_digest(paths, key):
+    path = paths[key]
+    if not os.path.exists(path):
+        return None
+    if key in DXF_ARTIFACTS:
+        return dxfGeometry.geometry_digest(path)
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+# =============================================================
+# === BUILD ===
+# =============================================================
+
+def build_floor(building_code, force=False, dry_run=False, overrides=None):
+    """
+    Brings one floor's artifacts up to date, running only the stages whose
+    inputs, parameters or outputs changed since the manifest was written
+    (every stage with force=True). With dry_run=True nothing is run or
+    written; the stages that would run are reported.
+    Returns: {"code": ..., "stages": [...], "status": "ok" | "needs-cleanup" |
+              "needs-labels" | "error", "message": ...}
+    """
+    for name, value in (overrides or {}).items():
+        setattr(nfp, name, value)
+    paths = nfp.floor_paths(building_code)
+    paths["manifest"] = f"{paths['folder']}/{MANIFEST_FILE}"
+    manifest = load_manifest(paths["manifest"])
+    result = {"code": building_code, "stages": [], "status": "ok", "message": ""}
+
+    rebuilt = set() # artifacts (re)written, or pending in a dry run, during this build
+    digests = {}
+    def digest(key):
+        if key not in digests:
+            digests[key] = artifact_digest(paths, key)
+        return digests[key]
+
+    try:
+        for name, inputs, outputs, params in STAGES:
+            if name == "replay-edits" and not os.path.exists(paths["edits"]):
+                continue # cleaned.dxf is hand-made for this floor
+
+            if any(digest(key) is None for key in inputs):
+                if all(digest(key) is not None for key in outputs):
+                    continue # e.g. no source plan on disk: keep the stored output as given
+                if name == "grid":
+                    result["status"] = "needs-cleanup"
+                    result["message"] = f"no cleaned.dxf yet; run: python {nfp.BASE_DIR}/newFloorPlan.py {building_code}"
+                    return result
+                missing = next(paths[key] for key in inputs if digest(key) is None)
+                raise FileNotFoundError(f"Error: {name} needs {missing}, which does not exist.")
+
+            record = {
+                "inputs": {key: digest(key) for key in inputs},
+                "params": {p: getattr(nfp, p) for p in params},
+            }
+            if name not in manifest and not force and not rebuilt.intersection(inputs) \
+                    and not any(p in (overrides or {}) for p in params) \
+                    and all(digest(key) is not None for key in outputs):
+                # No record yet (e.g. a fresh clone): the artifacts on disk become the baseline
+                if not dry_run:
+                    record["outputs"] = {key: digest(key) for key in outputs}
+                    manifest[name] = record
+                    save_manifest(paths["manifest"], manifest)
+                continue
+
+            previous = manifest.get(name, {})
+            up_to_date = (
+                not force
+                and previous.get("inputs") == record["inputs"]
+                and previous.get("params") == record["params"]
+                and all(digest(key) is not None and previous.get("outputs", {}).get(key) == digest(key) for key in outputs)
+            )
+            if up_to_date:
+                continue
+
+            # Same parameters and an untouched grid: only redraw where cleaned.dxf changed
+            incremental = (
+                name == "grid" and not force
+                and previous.get("params") == record["params"]
+                and all(previous.get("outputs", {}).get(key) == digest(key) for key in outputs)
+                and os.path.exists(paths["grid_source"])
+            )
+            result["stages"].append("regrid" if incremental else name)
+            rebuilt.update(outputs)
+            if dry_run:
+                for key in outputs:
+                    digests[key] = f"pending:{name}" # downstream stages see a change
+                continue
+
+            _run_stage(name, paths, incremental)
+            for key in outputs:
+                digests.pop(key, None)
+            record["outputs"] = {key: digest(key) for key in outputs}
+            manifest[name] = record
+            save_manifest(paths["manifest"], manifest)
+
+        if not os.path.exists(paths["labels"]) and not dry_run:
+            added, message = autoLabel.label_floor(building_code)
+            if added:
+                result["stages"].append("auto-label")
+                result["message"] = f"{added} auto label(s) to review"
+        if not os.path.exists(paths["labels"]):
+            result["status"] = "needs-labels"
+            result["message"] = "no labels.json yet"
+    except (FileNotFoundError, ValueError) as e:
+        result["status"] = "error"
+        result["message"] = str(e)
+    return result
+
+
+def run_pipeline(patterns, workers=None, force=False, dry_run=False, overrides=None):
+    codes = nfp.find_floor_codes(patterns)
+    if not codes:
+        print(f"No floors match {' '.join(patterns)}.")
+        return []
+
+    verb = "Checking" if dry_run else "Building"
+    print(f"{verb} {len(codes)} floor(s) with {workers or os.cpu_count()} worker(s)...")
+    n = len(codes)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(build_floor, codes, [force] * n, [dry_run] * n, [overrides] * n))
+
+    print("\n--- Build summary" + (" (dry run)" if dry_run else "") + " ---")
+    for r in results:
+        stages = ", ".join(r["stages"]) or "up to date"
+        print(f"{r['code']:<8} {r['status']:<14} {stages}" + (f" ({r['message']})" if r["message"] else ""))
+    return results
+
+
+def parse_overrides(assignments):
+    """['zoom_ratio=0.9', ...] -> {'zoom_ratio': 0.9}, checked against PARAMETERS."""
+    overrides = {}
+    for assignment in assignments:
+        name, _, value = assignment.partition("=")
+        if name not in PARAMETERS or not value:
+            raise ValueError(f"Unknown parameter '{assignment}'. Choose from: {', '.join(PARAMETERS)}")
+        try:
+            number = float(value)
+        except ValueError:
+            raise ValueError(f"Parameter '{name}' needs a number, got '{value}'.")
+        overrides[name] = int(number) if isinstance(getattr(nfp, name), int) and number.is_integer() else number
+    return overrides
+
+
+def main():
+    args = sys.argv[1:]
+    workers, force, dry_run, assignments = None, False, False, []
+    if "--force" in args:
+        args.remove("--force")
+        force = True
+    if "--dry-run" in args:
+        args.remove("--dry-run")
+        dry_run = True
+    if "--workers" in args:
+        i = args.index("--workers")
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    while "--set" in args:
+        i = args.index("--set")
+        assignments.append(args[i + 1])
+        del args[i:i + 2]
+
+    if not args:
+        print("Usage: python floorPlans/buildPipeline.py <code|glob> [...] [--workers N] [--force] [--dry-run] [--set name=value ...]")
+        sys.exit(1)
+    try:
+        overrides = parse_overrides(assignments)
+    except ValueError as e:
+        print(f"{e} Exiting.")
+        sys.exit(1)
+
+    results = run_pipeline(args, workers, force, dry_run, overrides)
+    sys.exit(1 if any(r["status"] == "error" for r in results) else 0)
+
+if __name__ == "__main__":
+    main()
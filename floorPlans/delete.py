@@ -1,8 +1,8 @@
 import ezdxf
-import numpy as np
 import cv2
 import pyautogui
 import os
+import editLog
 
 # === Paths ===
 BUILDING_CODE = "se06F1"
@@ -10,26 +10,14 @@ BUILDING_CODE = "se06F1"
 folder_path = f"floorPlans/{BUILDING_CODE[:2]}/{BUILDING_CODE[2:4]}/{BUILDING_CODE[4:]}"
 INPUT_DXF = f"{folder_path}/cropped.dxf"
 OUTPUT_DXF = f"{folder_path}/cleaned.dxf"
+EDITS_JSON = f"{folder_path}/{editLog.EDITS_FILE}"
 
 # === Load DXF ===
 doc = ezdxf.readfile(INPUT_DXF)
 msp = doc.modelspace()
 
-# --- Extract geometry function ---
-def extract_lines(msp):
-    lines = []
-    for e in msp.query("LINE"):
-        start, end = e.dxf.start, e.dxf.end
-        lines.append([(start.x, start.y), (end.x, end.y)])
-    for e in msp.query("LWPOLYLINE"):
-        pts = [tuple(p[0:2]) for p in e.get_points()]
-        lines.append(pts)
-    for e in msp.query("POLYLINE"):
-        pts = [(v.dxf.location.x, v.dxf.location.y) for v in e.vertices]
-        lines.append(pts)
-    return lines
-
-line_data = extract_lines(msp)
+# --- Editable segments and their vertices (msp itself is only rewritten on save) ---
+line_data, _ = editLog.entity_segments(editLog.editable_entities(msp))
 
 # === Bounds & rasterization ===
 all_pts = [p for seg in line_data for p in seg]
@@ -39,27 +27,6 @@ min_y, max_y = min(ys), max(ys)
 
 cell_size = 1
 
-def draw_dxf_to_image(msp, scale, min_x, max_y, cell_size):
-    lines = extract_lines(msp)
-    all_pts = [p for seg in lines for p in seg]
-    xs, ys = zip(*all_pts)
-    width = int((max(xs) - min(xs)) / cell_size) + 1
-    height = int((max(ys) - min(ys)) / cell_size) + 1
-    img = np.zeros((height, width), np.uint8)
-
-    def to_grid(x, y):
-        gx = int((x - min_x) / cell_size)
-        gy = int((max_y - y) / cell_size)
-        return gx, gy
-
-    for seg in lines:
-        pts = np.array([to_grid(x, y) for x, y in seg], np.int32).reshape((-1, 1, 2))
-        cv2.polylines(img, [pts], isClosed=False, color=255, thickness=1)
-
-    img_color = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-    disp_img = cv2.resize(img_color, (int(img_color.shape[1] * scale), int(img_color.shape[0] * scale)), interpolation=cv2.INTER_AREA)
-    return disp_img
-
 # === Resize for display ===
 screen_w, screen_h = pyautogui.size()
 width = int((max_x - min_x) / cell_size) + 1
@@ -68,7 +35,15 @@ scale = min((screen_w - 100) / width, (screen_h - 150) / height)
 if scale > 1.0:
     scale = 1.0
 
-display_img = draw_dxf_to_image(msp, scale, min_x, max_y, cell_size)
+# === Spatial index + raster (deletes/undos only redraw the region they touch) ===
+canvas = editLog.EditCanvas(line_data, min_x, max_x, min_y, max_y, cell_size, scale)
+display_img = canvas.display # updated in place
+
+# === Continue from the recorded edits ===
+edits = editLog.load_edits(EDITS_JSON)
+if edits:
+    removed = canvas.apply(edits)
+    print(f"[↻] Replayed {len(edits)} recorded edit(s) from {EDITS_JSON} ({len(removed)} segments removed)")
 
 # === Undo stack ===
 undo_stack = []
@@ -102,29 +77,14 @@ def mouse_draw(event, x, y, flags, param):
 
         print(f"\n[🧹] Removing lines in area: ({x1_dxf:.2f}, {y1_dxf:.2f}) → ({x2_dxf:.2f}, {y2_dxf:.2f})")
 
-        # --- Track deleted entities ---
-        deleted_entities = []
-
-        for e in list(msp):
-            if e.dxftype() in {"LINE", "LWPOLYLINE", "POLYLINE"}:
-                pts = []
-                if e.dxftype() == "LINE":
-                    pts = [(e.dxf.start.x, e.dxf.start.y), (e.dxf.end.x, e.dxf.end.y)]
-                elif e.dxftype() == "LWPOLYLINE":
-                    pts = [tuple(p[0:2]) for p in e.get_points()]
-                elif e.dxftype() == "POLYLINE":
-                    pts = [(v.dxf.location.x, v.dxf.location.y) for v in e.vertices]
-
-                if any(x1_dxf <= x <= x2_dxf and y1_dxf <= y <= y2_dxf for (x, y) in pts):
-                    deleted_entities.append(e.copy())  # save for undo
-                    msp.delete_entity(e)
-
-        if deleted_entities:
-            undo_stack.append(deleted_entities)
-            print(f" → Removed {len(deleted_entities)} entities. (Undo available)")
+        # --- Only the index candidates are tested; the canvas redraws their region ---
+        hit = canvas.delete(x1_dxf, y1_dxf, x2_dxf, y2_dxf)
+        if len(hit):
+            undo_stack.append(hit)
+            edits.append(editLog.delete_op(x1_dxf, y1_dxf, x2_dxf, y2_dxf))
+            print(f" → Removed {len(hit)} segments. (Undo available)")
 
         # === Update visualization ===
-        display_img = draw_dxf_to_image(msp, scale, min_x, max_y, cell_size)
         cv2.imshow("Edit DXF", display_img)
 
 # === Display window ===
@@ -134,7 +94,7 @@ cv2.imshow("Edit DXF", display_img)
 cv2.setMouseCallback("Edit DXF", mouse_draw)
 
 print("\n🖱️ Drag to select areas to delete.")
-print("💾 Press 'S' to save cleaned DXF")
+print("💾 Press 'S' to save cleaned DXF (and the edit log)")
 print("↩️  Press 'Z' to undo last delete")
 print("❌ Press ESC to quit")
 
@@ -143,15 +103,16 @@ while True:
     if key == 27:  # ESC
         break
     elif key in [ord('s'), ord('S')]:
-        doc.saveas(OUTPUT_DXF)
-        print(f"[💾] Saved cleaned DXF to {OUTPUT_DXF}")
+        # cleaned.dxf is the edit log replayed onto cropped.dxf
+        editLog.save_edits(EDITS_JSON, edits)
+        editLog.replay_edits(INPUT_DXF, EDITS_JSON, OUTPUT_DXF)
+        print(f"[💾] Saved cleaned DXF to {OUTPUT_DXF} ({len(edits)} edit(s) in {EDITS_JSON})")
     elif key in [ord('z'), ord('Z')]:
         if undo_stack:
-            last_deleted = undo_stack.pop()
-            for e in last_deleted:
-                msp.add_entity(e)
-            print(f"[↩️] Undid last delete ({len(last_deleted)} entities).")
-            display_img = draw_dxf_to_image(msp, scale, min_x, max_y, cell_size)
+            ids = undo_stack.pop()
+            canvas.restore(ids)
+            edits.append(editLog.undo_op())
+            print(f"[↩️] Undid last delete ({len(ids)} segments).")
             cv2.imshow("Edit DXF", display_img)
         else:
             print("[⚠️] Nothing to undo.")
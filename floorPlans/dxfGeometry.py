@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Parse-once geometry for the floor-plan stages.
+
+Every LINE / LWPOLYLINE / POLYLINE of a DXF (in modelspace order) is stored
+as one flat float64 vertex array plus polyline offsets and entity kinds, in
+an .npz under CACHE_DIR named by the SHA-1 of the DXF's bytes. The first
+stage that needs a file parses it; every later stage (or rerun) loads the
+arrays instead. Editing or regenerating a DXF changes its hash, so stale
+entries are never read.
+
+Parsing streams the modelspace with ezdxf's iterdxf add-on: entities are
+read one at a time and only their vertices are kept, so memory does not grow
+with the text, hatch and block entities of large source plans.
+
+Usage: python floorPlans/dxfGeometry.py --clear   (empties the cache)
+"""
+
+import hashlib
+import os
+import shutil
+import sys
+import numpy as np
+import cv2
+
+# === CONFIG ===
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".geometry_cache")
+FORMAT_VERSION = 1 # bump to invalidate every cached file
+
+LINE, LWPOLYLINE, POLYLINE = 0, 1, 2 # entity kinds
+KIND_CODES = {"LINE": LINE, "LWPOLYLINE": LWPOLYLINE, "POLYLINE": POLYLINE}
+
+# =============================================================
+# === GEOMETRY ===
+# =============================================================
+
+class Geometry:
+    """
+    Polylines as flat arrays: polyline i is vertices[offsets[i]:offsets[i + 1]]
+    (x, y rows) and was a kinds[i] entity. LINEs are 2-vertex polylines.
+    """
+
+    def __init__(self, vertices, offsets, kinds):
+        self.vertices = vertices
+        self.offsets = offsets
+        self.kinds = kinds
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def polylines(self):
+        """List of (k, 2) vertex arrays (views into vertices)."""
+        if len(self) == 0:
+            return []
+        return np.split(self.vertices, self.offsets[1:-1])
+
+    def line_data(self):
+        """The stages' classic list of [(x, y), ...] point lists."""
+        return [list(map(tuple, poly)) for poly in self.polylines()]
+
+    def bounds(self):
+        """(min_x, max_x, min_y, max_y) of every vertex."""
+        if len(self.vertices) == 0:
+            raise ValueError("No geometry found in DXF.")
+        (min_x, min_y), (max_x, max_y) = self.vertices.min(axis=0), self.vertices.max(axis=0)
+        return float(min_x), float(max_x), float(min_y), float(max_y)
+
+    @classmethod
+    def from_polylines(cls, polylines, kind):
+        """Geometry of point lists that are all written as `kind` entities."""
+        counts = [len(p) for p in polylines]
+        vertices = np.array([pt for p in polylines for pt in p], dtype=np.float64).reshape(-1, 2)
+        offsets = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]).astype(np.int64)
+        return cls(vertices, offsets, np.full(len(polylines), kind, dtype=np.uint8))
+
+# =============================================================
+# === RASTERIZATION ===
+# =============================================================
+
+def rasterize(geometry, min_x, max_x, min_y, max_y, cell_size=1):
+    """
+    Draws every polyline into a (height, width) uint8 image (255 = wall) on
+    the frame given by the bounds. The grid transform runs once over the flat
+    vertex array (truncating like int() did per point) and all polylines go
+    to a single cv2.polylines call.
+    """
+    width = int((max_x - min_x) / cell_size) + 1
+    height = int((max_y - min_y) / cell_size) + 1
+    img = np.zeros((height, width), dtype=np.uint8)
+
+    gx, gy = grid_coords(geometry, min_x, max_y, cell_size)
+    polys = np.split(np.column_stack([gx, gy]), geometry.offsets[1:-1]) if len(geometry) else []
+    polys = [p for p in polys if len(p)]
+    if polys:
+        cv2.polylines(img, polys, isClosed=False, color=255, thickness=1)
+    return img
+
+def grid_coords(geometry, min_x, max_y, cell_size=1):
+    """(column, row) int32 arrays of every vertex on the grid frame."""
+    gx = ((geometry.vertices[:, 0] - min_x) / cell_size).astype(np.int32)
+    gy = ((max_y - geometry.vertices[:, 1]) / cell_size).astype(np.int32)
+    return gx, gy
+
+
+def rasterize_windows(geometry, shape, min_x, max_y, cell_size, windows):
+    """
+    For each (r0, r1, c0, c1) window (inclusive, inside `shape`), the part of
+    what rasterize() draws on the same frame, drawing only the polylines
+    whose cells reach into that window. cv2 clipping a segment at the image
+    edge can move its pixels, so they are drawn on a canvas spanning their
+    whole extent (cut only at the grid's own edges): every window then
+    matches a full rasterization exactly.
+    Returns: list of uint8 images (255 = wall), one per window
+    """
+    ids = np.nonzero(geometry.counts() > 0)[0]
+    gx, gy = grid_coords(geometry, min_x, max_y, cell_size)
+    starts = geometry.offsets[ids]
+    if len(ids):
+        lo_x, hi_x = np.minimum.reduceat(gx, starts), np.maximum.reduceat(gx, starts)
+        lo_y, hi_y = np.minimum.reduceat(gy, starts), np.maximum.reduceat(gy, starts)
+    height, width = shape
+
+    patches = []
+    for r0, r1, c0, c1 in windows:
+        hit = (lo_x <= c1) & (hi_x >= c0) & (lo_y <= r1) & (hi_y >= r0) if len(ids) else np.zeros(0, dtype=bool)
+        if not hit.any():
+            patches.append(np.zeros((r1 - r0 + 1, c1 - c0 + 1), dtype=np.uint8))
+            continue
+        x0, x1 = max(0, min(c0, lo_x[hit].min())), min(width - 1, max(c1, hi_x[hit].max()))
+        y0, y1 = max(0, min(r0, lo_y[hit].min())), min(height - 1, max(r1, hi_y[hit].max()))
+        canvas = np.zeros((y1 - y0 + 1, x1 - x0 + 1), dtype=np.uint8)
+        polys = [np.column_stack([gx[a:b] - x0, gy[a:b] - y0])
+                 for a, b in zip(geometry.offsets[ids[hit]], geometry.offsets[ids[hit] + 1])]
+        cv2.polylines(canvas, polys, isClosed=False, color=255, thickness=1)
+        patches.append(canvas[r0 - y0:r1 - y0 + 1, c0 - x0:c1 - x0 + 1])
+    return patches
+
+
+def polyline_hashes(geometry):
+    """
+    uint64 fingerprint per polyline of its exact vertices (in order), mixed
+    per vertex and summed with reduceat. Empty polylines hash to 0.
+    """
+    counts = geometry.counts()
+    bits = np.ascontiguousarray(geometry.vertices, dtype=np.float64).view(np.uint64).reshape(-1, 2)
+    position = np.arange(len(bits), dtype=np.uint64) - np.repeat(geometry.offsets[:-1], counts).astype(np.uint64)
+    mix = (bits[:, 0] * np.uint64(0x9E3779B97F4A7C15)) ^ (bits[:, 1] * np.uint64(0xC2B2AE3D27D4EB4F)) \
+        ^ ((position + np.uint64(1)) * np.uint64(0x165667B19E3779F9))
+    mix ^= mix >> np.uint64(31)
+    hashes = np.zeros(len(geometry), dtype=np.uint64)
+    nonempty = counts > 0
+    if nonempty.any():
+        hashes[nonempty] = np.add.reduceat(mix, geometry.offsets[:-1][nonempty])
+    return hashes
+
+
+def _unmatched(hashes, others):
+    """Mask of the entries of `hashes` left over after pairing equal values with `others` (multisets)."""
+    order = np.argsort(hashes, kind="stable")
+    ordered = hashes[order]
+    occurrence = np.empty(len(hashes), dtype=np.int64)
+    occurrence[order] = np.arange(len(hashes)) - np.searchsorted(ordered, ordered, side="left")
+    others = np.sort(others)
+    available = np.searchsorted(others, hashes, side="right") - np.searchsorted(others, hashes, side="left")
+    return occurrence >= available
+
+
+def changed_boxes(old, new):
+    """
+    (x_min, y_min, x_max, y_max) rows of the polylines only one of two
+    geometries has (compared by vertex fingerprints, as multisets): the
+    regions a regrid has to redraw after old became new.
+    """
+    old_hashes, new_hashes = polyline_hashes(old), polyline_hashes(new)
+    boxes = []
+    for geometry, changed in ((old, _unmatched(old_hashes, new_hashes)), (new, _unmatched(new_hashes, old_hashes))):
+        nonempty = geometry.counts() > 0
+        if not (changed & nonempty).any():
+            continue
+        starts = geometry.offsets[:-1][nonempty]
+        lo, hi = np.minimum.reduceat(geometry.vertices, starts), np.maximum.reduceat(geometry.vertices, starts)
+        pick = changed[nonempty]
+        boxes.append(np.column_stack([lo[pick], hi[pick]]))
+    return np.concatenate(boxes) if boxes else np.zeros((0, 4))
+
+
+def clip_to_box(geometry, x_min, y_min, x_max, y_max):
+    """
+    Liang-Barsky clipping of every segment against the box at once. Segments
+    crossing the box are cut at its edges (also those with both ends outside)
+    and consecutive visible segments stay joined, so each polyline comes back
+    as its runs inside the box.
+    Returns: Geometry of LWPOLYLINE runs (2+ vertices each)
+    """
+    v = geometry.vertices
+    owner = np.repeat(np.arange(len(geometry)), geometry.counts())
+    seg = np.nonzero(owner[:-1] == owner[1:])[0] # segment s joins vertices s and s + 1
+    inside = (v[:, 0] >= x_min) & (v[:, 0] <= x_max) & (v[:, 1] >= y_min) & (v[:, 1] <= y_max)
+
+    p0, d = v[seg], v[seg + 1] - v[seg]
+    t0, t1 = np.zeros(len(seg)), np.ones(len(seg))
+    rejected = np.zeros(len(seg), dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for p, q in ((-d[:, 0], p0[:, 0] - x_min), (d[:, 0], x_max - p0[:, 0]),
+                     (-d[:, 1], p0[:, 1] - y_min), (d[:, 1], y_max - p0[:, 1])):
+            r = q / p
+            rejected |= (p == 0) & (q < 0)
+            t0 = np.where(p < 0, np.maximum(t0, r), t0)
+            t1 = np.where(p > 0, np.minimum(t1, r), t1)
+    visible = ~rejected & (t0 <= t1)
+    seg, p0, d, t0, t1 = seg[visible], p0[visible], d[visible], t0[visible], t1[visible]
+
+    # Keep original vertices exactly where they are inside the box
+    a = np.where(inside[seg][:, None], v[seg], p0 + t0[:, None] * d)
+    b = np.where(inside[seg + 1][:, None], v[seg + 1], p0 + t1[:, None] * d)
+
+    # A run continues when the next visible segment starts at this one's (inside) end vertex
+    joined = np.zeros(len(seg), dtype=bool)
+    joined[1:] = (seg[1:] == seg[:-1] + 1) & inside[seg[:-1] + 1]
+    starts = np.nonzero(~joined)[0]
+    vertices = np.insert(b, starts, a[starts], axis=0)
+    run_lengths = np.diff(np.append(starts, len(seg))) + 1
+    offsets = np.concatenate([[0], np.cumsum(run_lengths)]).astype(np.int64)
+    return Geometry(vertices.reshape(-1, 2), offsets, np.full(len(starts), LWPOLYLINE, dtype=np.uint8))
+
+# =============================================================
+# === PARSE / CACHE ===
+# =============================================================
+
+def entity_points(e):
+    """Vertices of a LINE / LWPOLYLINE / POLYLINE entity, None for anything else."""
+    kind = e.dxftype()
+    if kind == "LINE":
+        return [(e.dxf.start.x, e.dxf.start.y), (e.dxf.end.x, e.dxf.end.y)]
+    if kind == "LWPOLYLINE":
+        return [tuple(p[0:2]) for p in e.get_points()]
+    if kind == "POLYLINE":
+        return [(v.dxf.location.x, v.dxf.location.y) for v in e.vertices]
+    return None
+
+
+def file_digest(path):
+    sha = hashlib.sha1(f"v{FORMAT_VERSION}:".encode())
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def iter_entities(path, types):
+    """
+    Streams the modelspace entities of the given types without loading the
+    document; only the current entity is in memory. Falls back to
+    ezdxf.readfile for files iterdxf cannot walk.
+    """
+    import ezdxf
+    from ezdxf.addons import iterdxf
+
+    try:
+        entities = iterdxf.modelspace(path, types=list(types))
+        first = next(entities, None)
+    except IOError:
+        raise FileNotFoundError(f"Error: Cannot read DXF file at {path}.")
+    except ezdxf.DXFStructureError:
+        try:
+            doc = ezdxf.readfile(path)
+        except (IOError, ezdxf.DXFStructureError):
+            raise FileNotFoundError(f"Error: Cannot read DXF file at {path}.")
+        entities, first = iter(doc.modelspace().query(" ".join(types))), None
+
+    if first is not None:
+        yield first
+    yield from entities
+
+
+def iter_entity_points(path, types=tuple(KIND_CODES)):
+    """Streams (dxftype, points) for the modelspace entities of the given types."""
+    for e in iter_entities(path, types):
+        yield e.dxftype(), entity_points(e)
+
+
+def parse_dxf(path):
+    """Reads the geometry of a DXF (no cache)."""
+    points, counts, kinds = [], [], []
+    for kind, pts in iter_entity_points(path):
+        points += pts
+        counts.append(len(pts))
+        kinds.append(KIND_CODES[kind])
+
+    vertices = np.array(points, dtype=np.float64).reshape(-1, 2)
+    offsets = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]).astype(np.int64)
+    return Geometry(vertices, offsets, np.array(kinds, dtype=np.uint8))
+
+
+def _cache_path(path, cache_dir):
+    # Resolved per call so tools (benchmark.py) can point CACHE_DIR elsewhere
+    return os.path.join(cache_dir or CACHE_DIR, f"{file_digest(path)}.npz")
+
+
+def save_geometry(path, geometry):
+    """Writes the arrays to an .npz (atomically: parallel builds never read half a file)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path[:-4]}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, vertices=geometry.vertices, offsets=geometry.offsets, kinds=geometry.kinds)
+    os.replace(tmp, path)
+
+
+def read_saved_geometry(path):
+    with np.load(path) as data:
+        return Geometry(data["vertices"], data["offsets"], data["kinds"])
+
+
+def remember_geometry(path, geometry, cache_dir=None):
+    """
+    Caches the geometry a stage just wrote to `path`, so the next stage does
+    not parse the file it was generated from.
+    """
+    save_geometry(_cache_path(path, cache_dir), geometry)
+
+
+def load_geometry(path, cache_dir=None):
+    """
+    Geometry of a DXF, from the cache when this exact file was parsed before.
+    Raises FileNotFoundError when the DXF does not exist or cannot be read.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Error: Cannot read DXF file at {path}.")
+    cached = _cache_path(path, cache_dir)
+    if os.path.exists(cached):
+        return read_saved_geometry(cached)
+
+    geometry = parse_dxf(path)
+    save_geometry(cached, geometry)
+    return geometry
+
+
+def geometry_digest(path, cache_dir=None):
+    """
+    SHA-1 of a DXF's geometry rather than its bytes: rewriting the same
+    polylines (new header timestamps, handles) gives the same digest.
+    """
+    geometry = load_geometry(path, cache_dir)
+    sha = hashlib.sha1()
+    for array in (geometry.vertices, geometry.offsets, geometry.kinds):
+        sha.update(np.ascontiguousarray(array).tobytes())
+    return sha.hexdigest()
+
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["--clear"]:
+        print("Usage: python floorPlans/dxfGeometry.py --clear")
+        sys.exit(1)
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    print(f"[x] Cleared {CACHE_DIR}")
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Replayable edit log for the delete step (delete.py / stage 3 of newFloorPlan.py).
+
+Every rectangle deletion and every undo is appended to <floor>/edits.json as
+  {"op": "delete", "rect": [x1, y1, x2, y2]}   (DXF coordinates, x1 <= x2, y1 <= y2)
+  {"op": "undo"}
+so cleaned.dxf can be rebuilt from a regenerated cropped.dxf without redoing
+the clicks. A rectangle removes every straight segment (a LINE or one span
+of a polyline) with a vertex inside it; polylines it does not touch are left
+whole. Replay uses a uniform-grid index over segment vertices, so each
+rectangle only tests the vertices near it. The interactive tools use the same
+index through EditCanvas, which also redraws only the region a delete or undo
+touched instead of rerasterizing the whole floor.
+
+Usage: python floorPlans/editLog.py <building_code>   (cropped.dxf + edits.json -> cleaned.dxf)
+"""
+
+import json
+import math
+import os
+import sys
+import numpy as np
+import cv2
+from dxfGeometry import entity_points
+
+# === CONFIG ===
+EDITS_FILE = "edits.json"
+INDEX_BUCKETS = 128 # buckets along the longer side of the plan
+EDITABLE_TYPES = {"LINE", "LWPOLYLINE", "POLYLINE"}
+
+# =============================================================
+# === LOG FILE ===
+# =============================================================
+
+def load_edits(path):
+    """The recorded operations of one floor ([] when nothing was recorded yet)."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_edits(path, edits):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(edits, f, indent=2)
+
+
+def delete_op(x1, y1, x2, y2):
+    return {"op": "delete", "rect": [min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)]}
+
+
+def undo_op():
+    return {"op": "undo"}
+
+# =============================================================
+# === SPATIAL INDEX ===
+# =============================================================
+
+def editable_entities(msp):
+    """The entities the delete step works on (LINEs and whole polylines), in modelspace order."""
+    return [e for e in msp if e.dxftype() in EDITABLE_TYPES]
+
+
+def entity_segments(entities):
+    """
+    Every straight segment of the entities as a two-point list, with the
+    (entity, segment) it belongs to. The delete rule applies per segment, so
+    a rectangle removes the same lines it did when polylines were exploded,
+    while polylines it does not touch stay whole.
+    Returns: (point_lists, owners (n, 2) int64 array of entity, segment)
+    """
+    point_lists, owners = [], []
+    for i, e in enumerate(entities):
+        pts = entity_points(e)
+        if e.dxftype() != "LINE" and e.is_closed and len(pts) > 2:
+            pts = pts + pts[:1]
+        for k in range(len(pts) - 1):
+            point_lists.append([pts[k], pts[k + 1]])
+            owners.append((i, k))
+    return point_lists, np.array(owners, dtype=np.int64).reshape(-1, 2)
+
+
+def _segment_runs(count, removed, closed):
+    # (first, last) segment of every run of consecutive kept segments; a
+    # closed polyline's run may wrap past its last segment
+    start = (max(removed) + 1) % count if closed else 0
+    runs, first = [], None
+    for k in [(start + j) % count for j in range(count)] if closed else range(count):
+        if k in removed:
+            if first is not None:
+                runs.append((first, last))
+            first = None
+        else:
+            first, last = (k, k) if first is None else (first, k)
+    if first is not None:
+        runs.append((first, last))
+    return runs
+
+
+def remove_segments(msp, entities, owners, deleted):
+    """
+    Removes the deleted segments (ids into entity_segments()) from msp. A
+    LINE or a polyline that loses every segment is deleted; a polyline that
+    loses some is replaced by one open polyline per run of segments it keeps,
+    with the same layer, colour and bulges. Other entities are not touched.
+    Returns: number of segments removed
+    """
+    removed = {}
+    for i, k in owners[deleted].tolist():
+        removed.setdefault(i, set()).add(k)
+
+    for i, segs in removed.items():
+        e = entities[i]
+        kind = e.dxftype()
+        if kind != "LINE":
+            if kind == "LWPOLYLINE":
+                vertices = [tuple(p) for p in e.get_points("xyseb")] # x, y, start width, end width, bulge
+            else:
+                vertices = [(*v.dxf.location, v.dxf.bulge) for v in e.vertices] # x, y, z, bulge
+            closed = e.is_closed and len(vertices) > 2
+            count = len(vertices) if closed else len(vertices) - 1
+            for first, last in _segment_runs(count, segs, closed):
+                run = [vertices[(first + j) % len(vertices)] for j in range((last - first) % count + 2)]
+                run[-1] = run[-1][:-1] + (0.0,) # the end vertex starts no arc
+                if kind == "LWPOLYLINE":
+                    part = e.copy()
+                    part.set_points(run, format="xyseb")
+                    part.closed = False
+                    msp.add_entity(part)
+                elif e.is_3d_polyline:
+                    msp.add_polyline3d([v[:3] for v in run], dxfattribs=e.graphic_properties())
+                else:
+                    msp.add_polyline2d([(v[0], v[1], v[3]) for v in run], format="xyb",
+                                       dxfattribs=e.graphic_properties())
+        msp.delete_entity(e)
+    return len(deleted)
+
+
+class EntityIndex:
+    """
+    Uniform-grid spatial hash over the vertices of a list of entities (given
+    as point lists). query() returns the live entities with at least one
+    vertex inside a rectangle, the same rule the delete tool applies.
+    """
+
+    def __init__(self, point_lists, buckets=INDEX_BUCKETS):
+        counts = np.array([len(p) for p in point_lists], dtype=np.int64)
+        pts = np.array([pt for p in point_lists for pt in p], dtype=np.float64).reshape(-1, 2)
+        self.counts = counts
+        self.owner = np.repeat(np.arange(len(point_lists)), counts)
+        self.xs, self.ys = pts[:, 0], pts[:, 1]
+        self.alive = np.ones(len(point_lists), dtype=bool)
+
+        if len(pts):
+            self.min_x, self.min_y = self.xs.min(), self.ys.min()
+            extent = max(self.xs.max() - self.min_x, self.ys.max() - self.min_y, 1.0)
+        else:
+            self.min_x, self.min_y, extent = 0.0, 0.0, 1.0
+        self.cell = extent / buckets
+        cx = np.floor((self.xs - self.min_x) / self.cell).astype(np.int64)
+        cy = np.floor((self.ys - self.min_y) / self.cell).astype(np.int64)
+        self.rows = int(cx.max()) + 1 if len(pts) else 1
+        self.cols = int(cy.max()) + 1 if len(pts) else 1
+
+        keys = cx * self.cols + cy
+        order = np.argsort(keys, kind="stable")
+        unique, starts = np.unique(keys[order], return_index=True)
+        self.buckets = dict(zip(unique.tolist(), np.split(order, starts[1:])))
+
+    def query(self, x1, y1, x2, y2):
+        """Sorted ids of live entities with a vertex in [x1, x2] x [y1, y2]."""
+        cx0 = max(int(math.floor((x1 - self.min_x) / self.cell)), 0)
+        cx1 = min(int(math.floor((x2 - self.min_x) / self.cell)), self.rows - 1)
+        cy0 = max(int(math.floor((y1 - self.min_y) / self.cell)), 0)
+        cy1 = min(int(math.floor((y2 - self.min_y) / self.cell)), self.cols - 1)
+        found = [self.buckets[k] for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)
+                 if (k := cx * self.cols + cy) in self.buckets]
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        idx = np.concatenate(found)
+        x, y = self.xs[idx], self.ys[idx]
+        owners = np.unique(self.owner[idx[(x1 <= x) & (x <= x2) & (y1 <= y) & (y <= y2)]])
+        return owners[self.alive[owners]]
+
+    def remove(self, ids):
+        self.alive[ids] = False
+
+    def restore(self, ids):
+        self.alive[ids] = True
+
+# =============================================================
+# === INTERACTIVE CANVAS ===
+# =============================================================
+
+class EditCanvas:
+    """
+    Raster of the live entities for the delete tools. Keeps a full-resolution
+    image on the fixed frame given by the initial bounds, plus the scaled BGR
+    copy shown in the window; delete() / restore() only clear and redraw the
+    bounding box of the entities they change, then rescale that patch.
+    """
+
+    def __init__(self, point_lists, min_x, max_x, min_y, max_y, cell_size, scale):
+        self.index = EntityIndex(point_lists)
+        self.scale = scale
+        width = int((max_x - min_x) / cell_size) + 1
+        height = int((max_y - min_y) / cell_size) + 1
+
+        # Grid coordinates of every vertex in one step, split back per entity
+        gx = ((self.index.xs - min_x) / cell_size).astype(np.int32)
+        gy = ((max_y - self.index.ys) / cell_size).astype(np.int32)
+        grid_pts = np.column_stack([gx, gy])
+        self.polys = np.split(grid_pts, np.cumsum(self.index.counts)[:-1])
+
+        # Per-entity grid bounding boxes: col0, col1, row0, row1 (inclusive)
+        self.boxes = np.zeros((len(self.polys), 4), dtype=np.int64)
+        has_pts = self.index.counts > 0
+        if has_pts.any():
+            starts = (np.cumsum(self.index.counts) - self.index.counts)[has_pts]
+            self.boxes[has_pts] = np.column_stack([
+                np.minimum.reduceat(gx, starts), np.maximum.reduceat(gx, starts),
+                np.minimum.reduceat(gy, starts), np.maximum.reduceat(gy, starts),
+            ])
+        self.boxes[~has_pts] = (0, -1, 0, -1) # never overlaps anything
+
+        self.img = np.zeros((height, width), dtype=np.uint8)
+        self.display = np.zeros((int(height * scale), int(width * scale), 3), dtype=np.uint8)
+        self.redraw()
+
+    def apply(self, edits):
+        """Replays a recorded edit log and redraws. Returns: ids that stay deleted"""
+        deleted = apply_edits(self.index, edits)
+        self.redraw()
+        return deleted
+
+    def delete(self, x1, y1, x2, y2):
+        """Removes the live entities with a vertex in the DXF rectangle. Returns: their ids"""
+        hit = self.index.query(x1, y1, x2, y2)
+        if len(hit):
+            self.index.remove(hit)
+            self.redraw(hit)
+        return hit
+
+    def restore(self, ids):
+        self.index.restore(ids)
+        self.redraw(ids)
+
+    def redraw(self, ids=None):
+        """Redraws the region covered by entities `ids` (everything when None)."""
+        height, width = self.img.shape
+        if ids is None:
+            c0, c1, r0, r1 = 0, width, 0, height
+        else:
+            box = self.boxes[ids]
+            c0, c1 = max(int(box[:, 0].min()) - 1, 0), min(int(box[:, 1].max()) + 2, width)
+            r0, r1 = max(int(box[:, 2].min()) - 1, 0), min(int(box[:, 3].max()) + 2, height)
+            if c0 >= c1 or r0 >= r1:
+                return
+
+        # Clear the region, then draw every live entity whose box overlaps it
+        self.img[r0:r1, c0:c1] = 0
+        b = self.boxes
+        near = np.nonzero(self.index.alive & (b[:, 0] < c1) & (b[:, 1] >= c0) & (b[:, 2] < r1) & (b[:, 3] >= r0))[0]
+        if len(near):
+            cv2.polylines(self.img, [self.polys[i] for i in near.tolist()], isClosed=False, color=255, thickness=1)
+
+        # Rescale just the matching patch of the display image (area averaging, like INTER_AREA)
+        disp_h, disp_w = self.display.shape[:2]
+        fx, fy = width / disp_w, height / disp_h # exact source pixels per display pixel
+        d_c0, d_c1 = int(c0 / fx), min(int(math.ceil(c1 / fx)), disp_w)
+        d_r0, d_r1 = int(r0 / fy), min(int(math.ceil(r1 / fy)), disp_h)
+        if d_c0 >= d_c1 or d_r0 >= d_r1:
+            return
+        s_c0, s_c1 = int(d_c0 * fx), min(int(math.ceil(d_c1 * fx)), width)
+        s_r0, s_r1 = int(d_r0 * fy), min(int(math.ceil(d_r1 * fy)), height)
+        patch = area_weights(d_r0, d_r1, s_r0, s_r1, fy) @ self.img[s_r0:s_r1, s_c0:s_c1].astype(np.float32) \
+            @ area_weights(d_c0, d_c1, s_c0, s_c1, fx).T
+        self.display[d_r0:d_r1, d_c0:d_c1] = np.rint(patch).astype(np.uint8)[:, :, None]
+
+
+def area_weights(d0, d1, s0, s1, f):
+    """
+    Resampling matrix (d1 - d0, s1 - s0): display pixel d averages source
+    pixels [d * f, (d + 1) * f) weighted by overlap. Separable, so a patch of
+    the display can be recomputed from just the source pixels under it.
+    """
+    d = np.arange(d0, d1, dtype=np.float64)[:, None]
+    s = np.arange(s0, s1, dtype=np.float64)[None, :]
+    overlap = np.minimum((d + 1) * f, s + 1) - np.maximum(d * f, s)
+    return (np.clip(overlap, 0.0, None) / f).astype(np.float32)
+
+# =============================================================
+# === REPLAY ===
+# =============================================================
+
+def apply_edits(index, edits):
+    """
+    Replays the operations on the index: a delete removes the live entities
+    in its rectangle, an undo restores the most recent delete. The tools only
+    log deletes that removed something, so every logged delete was on their
+    undo stack; one that hits nothing in a regenerated plan is still pushed,
+    and the undo that followed it restores nothing.
+    Returns: ids of the entities that stay deleted
+    """
+    undo_stack = []
+    for edit in edits:
+        if edit["op"] == "delete":
+            hit = index.query(*edit["rect"])
+            index.remove(hit)
+            undo_stack.append(hit)
+        elif edit["op"] == "undo":
+            if undo_stack:
+                index.restore(undo_stack.pop())
+        else:
+            raise ValueError(f"Unknown edit operation {edit['op']!r}.")
+    return np.nonzero(~index.alive)[0]
+
+
+def apply_edits_to_modelspace(msp, edits):
+    """Removes the segments the edit log deletes from msp. Returns: number of segments removed"""
+    entities = editable_entities(msp)
+    point_lists, owners = entity_segments(entities)
+    deleted = apply_edits(EntityIndex(point_lists), edits)
+    return remove_segments(msp, entities, owners, deleted)
+
+
+def replay_edits(input_dxf, edits_path, output_dxf):
+    """
+    Rebuilds output_dxf (cleaned.dxf) from input_dxf (cropped.dxf) and the edit log.
+    Returns: (number of operations, number of segments removed)
+    """
+    import ezdxf
+
+    edits = load_edits(edits_path)
+    try:
+        doc = ezdxf.readfile(input_dxf)
+    except IOError:
+        raise FileNotFoundError(f"Error: Cannot read DXF file at {input_dxf}.")
+    deleted = apply_edits_to_modelspace(doc.modelspace(), edits)
+    doc.saveas(output_dxf)
+    return len(edits), deleted
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python floorPlans/editLog.py <building_code>")
+        sys.exit(1)
+    from newFloorPlan import floor_paths
+
+    paths = floor_paths(sys.argv[1])
+    if not os.path.exists(paths["edits"]):
+        print(f"No edit log at {paths['edits']}. Exiting.")
+        sys.exit(1)
+    try:
+        ops, deleted = replay_edits(paths["cropped"], paths["edits"], paths["cleaned"])
+    except (FileNotFoundError, ValueError) as e:
+        print(f"{e} Exiting.")
+        sys.exit(1)
+    print(f"[x] Replayed {ops} edit(s), removed {deleted} segments -> {paths['cleaned']}")
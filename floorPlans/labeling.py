@@ -1,8 +1,8 @@
-import ezdxf
-import numpy as np
 import cv2
 import json
 import pyautogui
+import dxfGeometry
+import autoLabel
 
 BUILDING_CODE = "se06F1"
 
@@ -10,48 +10,15 @@ folder_path = f"floorPlans/{BUILDING_CODE[:2]}/{BUILDING_CODE[2:4]}/{BUILDING_CO
 DXF_PATH = f"{folder_path}/cleaned.dxf"
 OUTPUT_JSON = f"{folder_path}/labels.json"
 
-# === Load DXF ===
-doc = ezdxf.readfile(DXF_PATH)
-msp = doc.modelspace()
+# === Load DXF geometry (parsed once, then cached) ===
+geometry = dxfGeometry.load_geometry(DXF_PATH)
 
-# Extract all polylines/lines
-line_data = []
+# Bounds of every vertex
+min_x, max_x, min_y, max_y = geometry.bounds()
 
-for e in msp.query('LINE'):
-    start = e.dxf.start
-    end = e.dxf.end
-    line_data.append([(start.x, start.y), (end.x, end.y)])
-
-for e in msp.query('LWPOLYLINE'):
-    points = [tuple(p[0:2]) for p in e.get_points()]
-    line_data.append(points)
-
-for e in msp.query('POLYLINE'):
-    points = [(v.dxf.location.x, v.dxf.location.y) for v in e.vertices]
-    line_data.append(points)
-
-# Flatten to compute bounds
-all_points = [pt for poly in line_data for pt in poly]
-xs, ys = zip(*all_points)
-min_x, max_x = min(xs), max(xs)
-min_y, max_y = min(ys), max(ys)
-
-# Create grid
+# Draw DXF geometry into image (vectorized, single cv2.polylines call)
 cell_size = 1
-width = int((max_x - min_x) / cell_size) + 1
-height = int((max_y - min_y) / cell_size) + 1
-img = np.zeros((height, width), dtype=np.uint8)
-
-def to_grid_coords(x, y):
-    gx = int((x - min_x) / cell_size)
-    gy = int((max_y - y) / cell_size)
-    return gx, gy
-
-# Draw DXF geometry into image
-for poly in line_data:
-    pts = np.array([to_grid_coords(x, y) for x, y in poly], np.int32)
-    pts = pts.reshape((-1, 1, 2))
-    cv2.polylines(img, [pts], isClosed=False, color=255, thickness=1)
+img = dxfGeometry.rasterize(geometry, min_x, max_x, min_y, max_y, cell_size)
 
 # Convert to 3-channel for display
 img_color = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
@@ -68,7 +35,12 @@ else:
     display_img = img_color.copy()
     scale = 1.0
 
-points = []
+# Keep the labels already on file (e.g. from autoLabel.py) and show them
+points = autoLabel.load_labels(OUTPUT_JSON)
+for p in points:
+    px, py = int((p["x"] - min_x) / cell_size * scale), int((max_y - p["y"]) / cell_size * scale)
+    cv2.circle(display_img, (px, py), 5, (0, 0, 255), -1)
+    cv2.putText(display_img, p["label"], (px + 5, py - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
 
 def click_event(event, x, y, flags, param):
     if event == cv2.EVENT_LBUTTONDOWN:
@@ -4,23 +4,47 @@ import numpy as np
 import cv2
 import matplotlib.pyplot as plt
 import json
-import pyautogui
 import os
+import sys
+import fnmatch
+from concurrent.futures import ProcessPoolExecutor
+import editLog
+import dxfGeometry
 
 # === GLOBAL CONFIGURATION AND PATHS ===
-BUILDING_CODE = "sw05F1"
-
-folder_path = f"floorPlans/{BUILDING_CODE[:2]}/{BUILDING_CODE[2:4]}/{BUILDING_CODE[4:]}"
-os.makedirs(folder_path, exist_ok=True) # Ensure directory exists
-
-# Define all file paths
-DXF_PATH = f"{folder_path}/{BUILDING_CODE}.dxf" # Scrape Input
-SCRAPED_DXF = f"{folder_path}/scraped.dxf"          # Scrape Output / Zoom Input
-CROPPED_DXF = f"{folder_path}/cropped.dxf"          # Zoom Output / Delete Input
-CLEANED_DXF = f"{folder_path}/cleaned.dxf"          # Delete Output / Label & Grid Input
-OUTPUT_JSON = f"{folder_path}/labels.json"
-OUTPUT_NPY = f"{folder_path}/floorplan_grid.npy"
-META_JSON = f"{folder_path}/meta.json"
+BUILDING_CODE = "sw05F1" # default floor for the interactive run
+BASE_DIR = "floorPlans"
+
+def floor_paths(building_code):
+    """
+    All file paths of one floor, e.g. 'sw05F1' -> floorPlans/sw/05/F1/...
+    """
+    folder_path = f"{BASE_DIR}/{building_code[:2]}/{building_code[2:4]}/{building_code[4:]}"
+    return {
+        "folder": folder_path,
+        "source": find_source_dxf(folder_path, building_code), # Scrape Input
+        "scraped": f"{folder_path}/scraped.dxf",               # Scrape Output / Zoom Input
+        "cropped": f"{folder_path}/cropped.dxf",               # Zoom Output / Delete Input
+        "cleaned": f"{folder_path}/cleaned.dxf",               # Delete Output / Label & Grid Input
+        "edits": f"{folder_path}/{editLog.EDITS_FILE}",          # Delete rectangles/undos (replayable)
+        "labels": f"{folder_path}/labels.json",
+        "grid": f"{folder_path}/floorplan_grid.npy",
+        "meta": f"{folder_path}/meta.json",
+        "grid_source": f"{folder_path}/grid_geometry.npz",     # Geometry the grid was drawn from (Regrid)
+        "grid_delta": f"{folder_path}/grid_delta.npz",         # Cells the last regrid changed
+    }
+
+def find_source_dxf(folder_path, building_code):
+    # Original plans are saved as <code>.dxf or <code>Plan.dxf
+    for name in (f"{building_code}.dxf", f"{building_code}Plan.dxf"):
+        if os.path.exists(f"{folder_path}/{name}"):
+            return f"{folder_path}/{name}"
+    derived = {"scraped.dxf", "cropped.dxf", "cleaned.dxf"}
+    if os.path.isdir(folder_path):
+        others = sorted(f for f in os.listdir(folder_path) if f.lower().endswith(".dxf") and f not in derived)
+        if others:
+            return f"{folder_path}/{others[0]}"
+    return f"{folder_path}/{building_code}.dxf"
 
 # --- Parameters (Consolidated/defined once) ---
 scale_factor = 4        # for visualization (Zoom/Grid)
@@ -28,529 +52,534 @@ zoom_ratio = 0.95       # for vertical crop (Zoom)
 zoom_factor = 1.1       # for centered zoom-in (Zoom)
 cell_size = 1           # adjust based on drawing scale (Zoom, Delete, Label, Grid)
 BOUNDARY_BUFFER = 0.02  # for 'Generate Grid' process
+SCRAPE_MIN_DIAG = 35    # polylines with a smaller bounding-box diagonal are text junk (Scrape)
 
 # ----------------------------------------------------
-# 1. Scrape Process
+# Shared geometry helpers
 # ----------------------------------------------------
-print("--- 1. Scrape Process: Clean DXF geometry ---")
+def read_dxf(path, what):
+    try:
+        return ezdxf.readfile(path)
+    except IOError:
+        raise FileNotFoundError(f"Error: Cannot read {what} DXF file at {path}.")
+
+def read_geometry(path, what):
+    # Parsed once per file version, then served from the dxfGeometry cache
+    try:
+        return dxfGeometry.load_geometry(path)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Error: Cannot read {what} DXF file at {path}.")
+
+def line_bounds(line_data):
+    all_points = [pt for poly in line_data for pt in poly]
+    xs, ys = zip(*all_points)
+    return min(xs), max(xs), min(ys), max(ys)
+
+def rasterize(geometry, min_x, max_x, min_y, max_y):
+    # One vectorized transform + one cv2.polylines call (see dxfGeometry.rasterize)
+    return dxfGeometry.rasterize(geometry, min_x, max_x, min_y, max_y, cell_size)
+
+def screen_size():
+    import pyautogui # only needed by the interactive stages
+    return pyautogui.size()
 
-try:
-    doc_dxf = ezdxf.readfile(DXF_PATH)
-except IOError:
-    print(f"Error: Cannot read initial DXF file at {DXF_PATH}. Exiting.")
-    exit()
+# ----------------------------------------------------
+# 1. Scrape Process
+# ----------------------------------------------------
+def scrape(paths):
+    print("--- 1. Scrape Process: Clean DXF geometry ---")
 
-msp = doc_dxf.modelspace()
-cleaned_polys = []
+    if not os.path.exists(paths["source"]):
+        raise FileNotFoundError(f"Error: Cannot read initial DXF file at {paths['source']}.")
+    cleaned_polys = []
 
-for e in msp.query('LWPOLYLINE POLYLINE'):
-    if e.dxftype() == "LWPOLYLINE":
-        pts = [p[0:2] for p in e.get_points()]
-    else:
-        pts = [(v.dxf.location.x, v.dxf.location.y) for v in e.vertices]
+    # Stream the (large) source plan: only the polylines that are kept stay in memory
+    for _, pts in dxfGeometry.iter_entity_points(paths["source"], ("LWPOLYLINE", "POLYLINE")):
+        if len(pts) < 2:
+            continue
 
-    if len(pts) < 2:
-        continue
+        xs, ys = zip(*pts)
+        diag = math.hypot(max(xs) - min(xs), max(ys) - min(ys))
 
-    xs, ys = zip(*pts)
-    diag = math.hypot(max(xs) - min(xs), max(ys) - min(ys))
+        if diag < SCRAPE_MIN_DIAG: # small = likely text junk
+            continue
 
-    if diag < 35: # small = likely text junk
-        continue
+        cleaned_polys.append(pts)
 
-    cleaned_polys.append(pts)
+    print(f"[x] Kept {len(cleaned_polys)} wall polylines after filtering.")
 
-print(f"[x] Kept {len(cleaned_polys)} wall polylines after filtering.")
-
-# Save cleaned DXF
-new_doc = ezdxf.new()
-msp_new = new_doc.modelspace()
-for poly in cleaned_polys:
-    msp_new.add_lwpolyline(poly)
-new_doc.saveas(SCRAPED_DXF)
-print(f"[x] Saved cleaned DXF: {SCRAPED_DXF}")
+    # Save cleaned DXF
+    new_doc = ezdxf.new()
+    msp_new = new_doc.modelspace()
+    for poly in cleaned_polys:
+        msp_new.add_lwpolyline(poly)
+    new_doc.saveas(paths["scraped"])
+    dxfGeometry.remember_geometry(paths["scraped"], dxfGeometry.Geometry.from_polylines(cleaned_polys, dxfGeometry.LWPOLYLINE))
+    print(f"[x] Saved cleaned DXF: {paths['scraped']}")
 
 # ----------------------------------------------------
 # 2. Zoom Process
 # ----------------------------------------------------
-print("\n--- 2. Zoom Process: Crop and Zoom to relevant area ---")
-
-INPUT_DXF_ZOOM = SCRAPED_DXF
-OUTPUT_DXF_ZOOM = CROPPED_DXF
-
-try:
-    doc = ezdxf.readfile(INPUT_DXF_ZOOM)
-except IOError:
-    print(f"Error: Cannot read scraped DXF file at {INPUT_DXF_ZOOM}. Exiting.")
-    exit()
-
-msp = doc.modelspace()
-
-line_data = []
-
-# Collect all geometry
-for e in msp.query("LINE"):
-    start, end = e.dxf.start, e.dxf.end
-    line_data.append([(start.x, start.y), (end.x, end.y)])
-
-for e in msp.query("LWPOLYLINE"):
-    points = [tuple(p[0:2]) for p in e.get_points()]
-    line_data.append(points)
-
-for e in msp.query("POLYLINE"):
-    points = [(v.dxf.location.x, v.dxf.location.y) for v in e.vertices]
-    line_data.append(points)
-    
-if not line_data:
-    print("No geometry found for zooming. Exiting.")
-    exit()
-
-# Compute bounds
-all_points = [pt for poly in line_data for pt in poly]
-xs, ys = zip(*all_points)
-min_x, max_x = min(xs), max(xs)
-min_y, max_y = min(ys), max(ys)
-
-# Rasterize for visualization
-width = int((max_x - min_x) / cell_size) + 1
-height = int((max_y - min_y) / cell_size) + 1
-img = np.zeros((height, width), dtype=np.uint8)
-
-def to_grid_coords(x, y):
-    gx = int((x - min_x) / cell_size)
-    gy = int((max_y - y) / cell_size)
-    return gx, gy
-
-for poly in line_data:
-    pts = np.array([to_grid_coords(x, y) for x, y in poly], np.int32)
-    pts = pts.reshape((-1, 1, 2))
-    cv2.polylines(img, [pts], isClosed=False, color=255, thickness=1)
-
-grid = (img > 0).astype(int)
-
-# Crop top 90%
-height_zoom = int(grid.shape[0] * zoom_ratio)
-grid_zoomed = grid[:height_zoom, :]
-
-# Centered zoom-in
-h, w = grid_zoomed.shape
-new_h, new_w = int(h / zoom_factor), int(w / zoom_factor)
-start_y, start_x = (h - new_h) // 2, (w - new_w) // 2
-grid_zoomed_center = grid_zoomed[start_y:start_y + new_h, start_x:start_x + new_w]
-
-# Compute new DXF bounds
-y1_dxf = max_y - (start_y + new_h) * cell_size
-y2_dxf = max_y - start_y * cell_size
-x1_dxf = min_x + start_x * cell_size
-x2_dxf = min_x + (start_x + new_w) * cell_size
-
-# Create new DXF with cropped content
-new_doc = ezdxf.new(dxfversion="R2010")
-new_msp = new_doc.modelspace()
-
-for poly in line_data:
-    for i in range(len(poly) - 1):
-        (x1, y1), (x2, y2) = poly[i], poly[i + 1]
-        if (
-            (x1_dxf <= x1 <= x2_dxf and y1_dxf <= y1 <= y2_dxf)
-            or (x1_dxf <= x2 <= x2_dxf and y1_dxf <= y2 <= y2_dxf)
-        ):
-            new_msp.add_line((x1, y1), (x2, y2))
-
-new_doc.saveas(OUTPUT_DXF_ZOOM)
-print(f"[x] Saved cropped DXF region -> {OUTPUT_DXF_ZOOM}")
-
-# Optional display for confirmation
-grid_scaled = cv2.resize(
-    grid_zoomed_center,
-    (grid_zoomed_center.shape[1] * scale_factor, grid_zoomed_center.shape[0] * scale_factor),
-    interpolation=cv2.INTER_NEAREST,
-)
-
-plt.imshow(grid_scaled, cmap="gray")
-plt.title("Cropped DXF Region (Zoomed)")
-plt.axis("off")
-plt.show(block=False)
-plt.pause(2)
-plt.close()
-
+def zoom(paths, show=True):
+    print("\n--- 2. Zoom Process: Crop and Zoom to relevant area ---")
+
+    geometry = read_geometry(paths["scraped"], "scraped")
+
+    if len(geometry) == 0:
+        raise ValueError("No geometry found for zooming.")
+
+    # Compute bounds and rasterize for visualization
+    min_x, max_x, min_y, max_y = geometry.bounds()
+    grid = (rasterize(geometry, min_x, max_x, min_y, max_y) > 0).astype(np.uint8)
+
+    # Crop top 90%
+    height_zoom = int(grid.shape[0] * zoom_ratio)
+    grid_zoomed = grid[:height_zoom, :]
+
+    # Centered zoom-in
+    h, w = grid_zoomed.shape
+    new_h, new_w = int(h / zoom_factor), int(w / zoom_factor)
+    start_y, start_x = (h - new_h) // 2, (w - new_w) // 2
+    grid_zoomed_center = grid_zoomed[start_y:start_y + new_h, start_x:start_x + new_w]
+
+    # Compute new DXF bounds
+    y1_dxf = max_y - (start_y + new_h) * cell_size
+    y2_dxf = max_y - start_y * cell_size
+    x1_dxf = min_x + start_x * cell_size
+    x2_dxf = min_x + (start_x + new_w) * cell_size
+
+    # Create new DXF with cropped content: segments clipped to the box, polylines kept whole
+    cropped = dxfGeometry.clip_to_box(geometry, x1_dxf, y1_dxf, x2_dxf, y2_dxf)
+    new_doc = ezdxf.new(dxfversion="R2010")
+    new_msp = new_doc.modelspace()
+    for poly in cropped.polylines():
+        new_msp.add_lwpolyline(poly.tolist())
+
+    new_doc.saveas(paths["cropped"])
+    dxfGeometry.remember_geometry(paths["cropped"], cropped)
+    print(f"[x] Saved cropped DXF region -> {paths['cropped']}")
+
+    if not show:
+        return
+
+    # Optional display for confirmation
+    grid_scaled = cv2.resize(
+        grid_zoomed_center,
+        (grid_zoomed_center.shape[1] * scale_factor, grid_zoomed_center.shape[0] * scale_factor),
+        interpolation=cv2.INTER_NEAREST,
+    )
+
+    plt.imshow(grid_scaled, cmap="gray")
+    plt.title("Cropped DXF Region (Zoomed)")
+    plt.axis("off")
+    plt.show(block=False)
+    plt.pause(2)
+    plt.close()
 
 # ----------------------------------------------------
 # 3. Delete Process: Manual Deletion of junk (Interactive)
 # ----------------------------------------------------
-print("\n--- 3. Delete Process: Manual Deletion of junk (Interactive) ---")
-
-INPUT_DXF_DELETE = CROPPED_DXF
-OUTPUT_DXF_DELETE = CLEANED_DXF
-
-try:
-    doc = ezdxf.readfile(INPUT_DXF_DELETE)
-except IOError:
-    print(f"Error: Cannot read cropped DXF file at {INPUT_DXF_DELETE}. Exiting.")
-    exit()
-
-msp = doc.modelspace()
-
-# --- Extract geometry function (Re-defined from original Delete Process file) ---
-def extract_lines_delete(msp):
-    lines = []
-    for e in msp.query("LINE"):
-        start, end = e.dxf.start, e.dxf.end
-        lines.append([(start.x, start.y), (end.x, end.y)])
-    for e in msp.query("LWPOLYLINE"):
-        pts = [tuple(p[0:2]) for p in e.get_points()]
-        lines.append(pts)
-    for e in msp.query("POLYLINE"):
-        pts = [(v.dxf.location.x, v.dxf.location.y) for v in e.vertices]
-        lines.append(pts)
-    return lines
-
-line_data = extract_lines_delete(msp)
-
-# === Bounds & rasterization ===
-all_pts = [p for seg in line_data for p in seg]
-xs, ys = zip(*all_pts)
-min_x, max_x = min(xs), max(xs)
-min_y, max_y = min(ys), max(ys)
-
-# --- draw_dxf_to_image function (MODIFIED to use all four bounds) ---
-# NOTE: We now pass and use min_y and max_x as well for a fixed canvas size.
-def draw_dxf_to_image(msp, scale, initial_min_x, initial_max_x, initial_min_y, initial_max_y, cell_size):
-    lines = extract_lines_delete(msp)
-    
-    # Use INITIAL bounds to define a FIXED canvas size
-    width = int((initial_max_x - initial_min_x) / cell_size) + 1
-    height = int((initial_max_y - initial_min_y) / cell_size) + 1
-    img = np.zeros((height, width), np.uint8)
-
-    def to_grid(x, y):
-        # Use INITIAL bounds for coordinate mapping
-        gx = int((x - initial_min_x) / cell_size)
-        gy = int((initial_max_y - y) / cell_size)
-        return gx, gy
-
-    for seg in lines:
-        pts = np.array([to_grid(x, y) for x, y in seg], np.int32).reshape((-1, 1, 2))
-        cv2.polylines(img, [pts], isClosed=False, color=255, thickness=1)
-
-    img_color = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-    disp_img = cv2.resize(img_color, (int(img_color.shape[1] * scale), int(img_color.shape[0] * scale)), interpolation=cv2.INTER_AREA)
-    return disp_img
-
-# === Resize for display ===
-screen_w, screen_h = pyautogui.size()
-width = int((max_x - min_x) / cell_size) + 1
-height = int((max_y - min_y) / cell_size) + 1
-scale = min((screen_w - 100) / width, (screen_h - 150) / height)
-if scale > 1.0:
-    scale = 1.0
-
-# === INITIAL CALL: Use all four bounds to set the fixed frame ===
-display_img = draw_dxf_to_image(msp, scale, min_x, max_x, min_y, max_y, cell_size)
-
-# === Undo stack ===
-undo_stack = []
-
-# === Mouse interaction ===
-drawing = False
-x_start, y_start = -1, -1
-
-# Capture bounds to use inside the callback
-delete_min_x = min_x
-delete_max_x = max_x # New capture
-delete_min_y = min_y # New capture
-delete_max_y = max_y
-
-def mouse_draw(event, x, y, flags, param):
-    global drawing, x_start, y_start, display_img, undo_stack
-
-    if event == cv2.EVENT_LBUTTONDOWN:
-        drawing = True
-        x_start, y_start = x, y
-
-    elif event == cv2.EVENT_MOUSEMOVE and drawing:
-        img_copy = display_img.copy()
-        cv2.rectangle(img_copy, (x_start, y_start), (x, y), (0, 0, 255), 2)
-        cv2.imshow("Edit DXF", img_copy)
-
-    elif event == cv2.EVENT_LBUTTONUP:
-        drawing = False
-        x_end, y_end = x, y
-
-        gx1, gy1 = int(min(x_start, x_end) / scale), int(min(y_start, y_end) / scale)
-        gx2, gy2 = int(max(x_start, x_end) / scale), int(max(y_start, y_end) / scale)
-        
-        # Use captured bounds for transformation
-        x1_dxf = delete_min_x + gx1 * cell_size
-        x2_dxf = delete_min_x + gx2 * cell_size
-        y1_dxf = delete_max_y - gy2 * cell_size
-        y2_dxf = delete_max_y - gy1 * cell_size
-
-        print(f"\n[ ] Removing lines in area: ({x1_dxf:.2f}, {y1_dxf:.2f}) -> ({x2_dxf:.2f}, {y2_dxf:.2f})")
-
-        # --- Track deleted entities ---
-        deleted_entities = []
-
-        for e in list(msp):
-            if e.dxftype() in {"LINE", "LWPOLYLINE", "POLYLINE"}:
-                pts = []
-                if e.dxftype() == "LINE":
-                    pts = [(e.dxf.start.x, e.dxf.start.y), (e.dxf.end.x, e.dxf.end.y)]
-                elif e.dxftype() == "LWPOLYLINE":
-                    pts = [tuple(p[0:2]) for p in e.get_points()]
-                elif e.dxftype() == "POLYLINE":
-                    pts = [(v.dxf.location.x, v.dxf.location.y) for v in e.vertices]
-
-                if any(x1_dxf <= x <= x2_dxf and y1_dxf <= y <= y2_dxf for (x, y) in pts):
-                    deleted_entities.append(e.copy())  # save for undo
-                    msp.delete_entity(e)
-
-        if deleted_entities:
-            undo_stack.append(deleted_entities)
-            print(f" -> Removed {len(deleted_entities)} entities. (Undo available)")
-
-        # === UPDATE CALL: Use all four original bounds again to redraw fixed frame ===
-        display_img = draw_dxf_to_image(msp, scale, delete_min_x, delete_max_x, delete_min_y, delete_max_y, cell_size)
-        cv2.imshow("Edit DXF", display_img)
-
-# === Display window (rest of the code remains the same) ===
-cv2.namedWindow("Edit DXF", cv2.WINDOW_NORMAL)
-cv2.resizeWindow("Edit DXF", display_img.shape[1], display_img.shape[0])
-cv2.imshow("Edit DXF", display_img)
-cv2.setMouseCallback("Edit DXF", mouse_draw)
-
-print("\n[M] Drag to select areas to delete.")
-print(f"[S] Press 'S' to save cleaned DXF to {OUTPUT_DXF_DELETE}")
-print("[Z] Press 'Z' to undo last delete")
-print("[E] Press ESC to quit")
-
-while True:
-    key = cv2.waitKey(1) & 0xFF
-    if key == 27:  # ESC
-        break
-    elif key in [ord('s'), ord('S')]:
-        doc.saveas(OUTPUT_DXF_DELETE)
-        print(f"[S] Saved cleaned DXF to {OUTPUT_DXF_DELETE}")
-    elif key in [ord('z'), ord('Z')]:
-        if undo_stack:
-            last_deleted = undo_stack.pop()
-            for e in last_deleted:
-                msp.add_entity(e)
-            print(f"[Z] Undid last delete ({len(last_deleted)} entities).")
-            # === UPDATE CALL: Use all four original bounds again to redraw fixed frame ===
-            display_img = draw_dxf_to_image(msp, scale, delete_min_x, delete_max_x, delete_min_y, delete_max_y, cell_size)
-            cv2.imshow("Edit DXF", display_img)
-        else:
-            print("[W] Nothing to undo.")
-
-cv2.destroyAllWindows()
+def delete_interactive(paths):
+    print("\n--- 3. Delete Process: Manual Deletion of junk (Interactive) ---")
+
+    doc = read_dxf(paths["cropped"], "cropped")
+    msp = doc.modelspace()
+
+    # === Bounds & spatial index (per segment; msp itself is only rewritten on save) ===
+    point_lists, _ = editLog.entity_segments(editLog.editable_entities(msp))
+    min_x, max_x, min_y, max_y = line_bounds(point_lists)
+
+    # === Resize for display ===
+    screen_w, screen_h = screen_size()
+    width = int((max_x - min_x) / cell_size) + 1
+    height = int((max_y - min_y) / cell_size) + 1
+    scale = min((screen_w - 100) / width, (screen_h - 150) / height)
+    if scale > 1.0:
+        scale = 1.0
+
+    # NOTE: The INITIAL bounds define a FIXED canvas; deletes/undos only redraw the region they touch.
+    canvas = editLog.EditCanvas(point_lists, min_x, max_x, min_y, max_y, cell_size, scale)
+
+    # === Continue from the recorded edits (applied to the fresh cropped.dxf) ===
+    edits = editLog.load_edits(paths["edits"])
+    if edits:
+        removed = canvas.apply(edits)
+        print(f"[x] Replayed {len(edits)} recorded edit(s) from {paths['edits']} ({len(removed)} segments removed)")
+
+    state = {
+        "display_img": canvas.display, # updated in place by the canvas
+        "undo_stack": [],
+        "drawing": False,
+        "x_start": -1,
+        "y_start": -1,
+    }
+
+    def mouse_draw(event, x, y, flags, param):
+        if event == cv2.EVENT_LBUTTONDOWN:
+            state["drawing"] = True
+            state["x_start"], state["y_start"] = x, y
+
+        elif event == cv2.EVENT_MOUSEMOVE and state["drawing"]:
+            img_copy = state["display_img"].copy()
+            cv2.rectangle(img_copy, (state["x_start"], state["y_start"]), (x, y), (0, 0, 255), 2)
+            cv2.imshow("Edit DXF", img_copy)
+
+        elif event == cv2.EVENT_LBUTTONUP:
+            state["drawing"] = False
+            x_start, y_start, x_end, y_end = state["x_start"], state["y_start"], x, y
+
+            gx1, gy1 = int(min(x_start, x_end) / scale), int(min(y_start, y_end) / scale)
+            gx2, gy2 = int(max(x_start, x_end) / scale), int(max(y_start, y_end) / scale)
+
+            # Use the fixed-frame bounds for transformation
+            x1_dxf = min_x + gx1 * cell_size
+            x2_dxf = min_x + gx2 * cell_size
+            y1_dxf = max_y - gy2 * cell_size
+            y2_dxf = max_y - gy1 * cell_size
+
+            print(f"\n[ ] Removing lines in area: ({x1_dxf:.2f}, {y1_dxf:.2f}) -> ({x2_dxf:.2f}, {y2_dxf:.2f})")
+
+            # --- Only the index candidates are tested; the canvas redraws their region ---
+            hit = canvas.delete(x1_dxf, y1_dxf, x2_dxf, y2_dxf)
+            if len(hit):
+                state["undo_stack"].append(hit)
+                edits.append(editLog.delete_op(x1_dxf, y1_dxf, x2_dxf, y2_dxf))
+                print(f" -> Removed {len(hit)} segments. (Undo available)")
+
+            cv2.imshow("Edit DXF", state["display_img"])
+
+    # === Display window ===
+    cv2.namedWindow("Edit DXF", cv2.WINDOW_NORMAL)
+    cv2.resizeWindow("Edit DXF", state["display_img"].shape[1], state["display_img"].shape[0])
+    cv2.imshow("Edit DXF", state["display_img"])
+    cv2.setMouseCallback("Edit DXF", mouse_draw)
+
+    print("\n[M] Drag to select areas to delete.")
+    print(f"[S] Press 'S' to save cleaned DXF to {paths['cleaned']} (and the edit log)")
+    print("[Z] Press 'Z' to undo last delete")
+    print("[E] Press ESC to quit")
+
+    while True:
+        key = cv2.waitKey(1) & 0xFF
+        if key == 27:  # ESC
+            break
+        elif key in [ord('s'), ord('S')]:
+            # cleaned.dxf is the edit log replayed onto cropped.dxf, exactly as a rebuild makes it
+            editLog.save_edits(paths["edits"], edits)
+            editLog.replay_edits(paths["cropped"], paths["edits"], paths["cleaned"])
+            print(f"[S] Saved cleaned DXF to {paths['cleaned']} ({len(edits)} edit(s) in {paths['edits']})")
+        elif key in [ord('z'), ord('Z')]:
+            if state["undo_stack"]:
+                ids = state["undo_stack"].pop()
+                canvas.restore(ids)
+                edits.append(editLog.undo_op())
+                print(f"[Z] Undid last delete ({len(ids)} segments).")
+                cv2.imshow("Edit DXF", state["display_img"])
+            else:
+                print("[W] Nothing to undo.")
+
+    cv2.destroyAllWindows()
 
 # ----------------------------------------------------
 # 4. Label Process
 # ----------------------------------------------------
-print("\n--- 4. Label Process: Manual Room Labeling (Interactive) ---")
-
-DXF_PATH_LABEL = CLEANED_DXF
-
-try:
-    doc = ezdxf.readfile(DXF_PATH_LABEL)
-except IOError:
-    print(f"Error: Cannot read cleaned DXF file at {DXF_PATH_LABEL}. Exiting.")
-    exit()
-
-msp = doc.modelspace()
-
-# Extract all polylines/lines (Re-defined from original Label Process file)
-line_data = []
-
-for e in msp.query('LINE'):
-    start = e.dxf.start
-    end = e.dxf.end
-    line_data.append([(start.x, start.y), (end.x, end.y)])
-
-for e in msp.query('LWPOLYLINE'):
-    points = [tuple(p[0:2]) for p in e.get_points()]
-    line_data.append(points)
-
-for e in msp.query('POLYLINE'):
-    points = [(v.dxf.location.x, v.dxf.location.y) for v in e.vertices]
-    line_data.append(points)
-
-if not line_data:
-    print("No geometry found for labeling. Exiting.")
-    exit()
-    
-# Flatten to compute bounds
-all_points = [pt for poly in line_data for pt in poly]
-xs, ys = zip(*all_points)
-min_x, max_x = min(xs), max(xs)
-min_y, max_y = min(ys), max(ys)
-
-# Create grid
-width = int((max_x - min_x) / cell_size) + 1
-height = int((max_y - min_y) / cell_size) + 1
-img = np.zeros((height, width), dtype=np.uint8)
-
-def to_grid_coords_label(x, y):
-    gx = int((x - min_x) / cell_size)
-    gy = int((max_y - y) / cell_size)
-    return gx, gy
-
-# Draw DXF geometry into image
-for poly in line_data:
-    pts = np.array([to_grid_coords_label(x, y) for x, y in poly], np.int32)
-    pts = pts.reshape((-1, 1, 2))
-    cv2.polylines(img, [pts], isClosed=False, color=255, thickness=1)
-
-# Convert to 3-channel for display
-img_color = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-
-# === Fit to screen ===
-screen_w, screen_h = pyautogui.size()
-h, w = img_color.shape[:2]
-scale = min((screen_w - 100) / w, (screen_h - 150) / h)
-if scale < 1.0:
-    display_w = int(w * scale)
-    display_h = int(h * scale)
-    display_img = cv2.resize(img_color, (display_w, display_h), interpolation=cv2.INTER_AREA)
-else:
-    display_img = img_color.copy()
-    scale = 1.0
-
-points = []
-
-# Capture bounds to use inside the callback
-label_min_x = min_x
-label_max_y = max_y
-
-def click_event(event, x, y, flags, param):
-    if event == cv2.EVENT_LBUTTONDOWN:
-        # Convert scaled coords -> original DXF coordinates
-        grid_x = int(x / scale)
-        grid_y = int(y / scale)
-
-        # Map back to DXF coordinate system
-        dxf_x = label_min_x + grid_x * cell_size
-        dxf_y = label_max_y - grid_y * cell_size
-
-        print(f"\nClicked at DXF coords ({dxf_x:.2f}, {dxf_y:.2f})")
-        label = input("Enter room label: ").strip() or "unlabeled"
-        points.append({"x": dxf_x, "y": dxf_y, "label": label})
-
-        cv2.circle(param, (x, y), 5, (0, 0, 255), -1)
-        cv2.putText(param, label, (x + 5, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        cv2.imshow("Label DXF", param)
-
-cv2.namedWindow("Label DXF", cv2.WINDOW_NORMAL)
-cv2.resizeWindow("Label DXF", display_img.shape[1], display_img.shape[0])
-cv2.imshow("Label DXF", display_img)
-cv2.setMouseCallback("Label DXF", click_event, display_img)
-
-print("Click on room centers/corners to label them. Press ESC when done.")
-while True:
-    key = cv2.waitKey(1)
-    if key == 27:  # ESC
-        break
-
-cv2.destroyAllWindows()
-
-# === Save labeled data ===
-with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-    json.dump(points, f, indent=2)
-
-print(f"\n[x] Saved {len(points)} labeled points to {OUTPUT_JSON}")
+def label_interactive(paths):
+    print("\n--- 4. Label Process: Manual Room Labeling (Interactive) ---")
+
+    geometry = read_geometry(paths["cleaned"], "cleaned")
+
+    if len(geometry) == 0:
+        raise ValueError("No geometry found for labeling.")
 
+    # Draw DXF geometry into image
+    min_x, max_x, min_y, max_y = geometry.bounds()
+    img = rasterize(geometry, min_x, max_x, min_y, max_y)
+
+    # Convert to 3-channel for display
+    img_color = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+    # === Fit to screen ===
+    screen_w, screen_h = screen_size()
+    h, w = img_color.shape[:2]
+    scale = min((screen_w - 100) / w, (screen_h - 150) / h)
+    if scale < 1.0:
+        display_w = int(w * scale)
+        display_h = int(h * scale)
+        display_img = cv2.resize(img_color, (display_w, display_h), interpolation=cv2.INTER_AREA)
+    else:
+        display_img = img_color.copy()
+        scale = 1.0
+
+    # Start from the existing (e.g. auto-generated) labels: clicks near one review it
+    import autoLabel
+    points = autoLabel.load_labels(paths["labels"])
+    base_img = display_img.copy()
+
+    def to_display(p):
+        return int((p["x"] - min_x) / cell_size * scale), int((max_y - p["y"]) / cell_size * scale)
+
+    def draw_labels():
+        display_img[:] = base_img
+        for p in points:
+            x, y = to_display(p)
+            cv2.circle(display_img, (x, y), 5, (0, 0, 255), -1)
+            cv2.putText(display_img, p["label"], (x + 5, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        cv2.imshow("Label DXF", display_img)
+
+    def click_event(event, x, y, flags, param):
+        if event == cv2.EVENT_LBUTTONDOWN:
+            # Convert scaled coords -> original DXF coordinates
+            grid_x = int(x / scale)
+            grid_y = int(y / scale)
+
+            # Map back to DXF coordinate system
+            dxf_x = min_x + grid_x * cell_size
+            dxf_y = max_y - grid_y * cell_size
+
+            i = autoLabel.nearest_label(points, dxf_x, dxf_y, autoLabel.REVIEW_RADIUS / scale * cell_size)
+            if i is not None:
+                old = points[i]["label"]
+                label = input(f"\nRelabel '{old}' (Enter keeps, '-' removes): ").strip()
+                if label == "-":
+                    del points[i]
+                elif label:
+                    points[i]["label"] = label
+            else:
+                print(f"\nClicked at DXF coords ({dxf_x:.2f}, {dxf_y:.2f})")
+                label = input("Enter room label: ").strip() or "unlabeled"
+                points.append({"x": dxf_x, "y": dxf_y, "label": label})
+            draw_labels()
+
+    cv2.namedWindow("Label DXF", cv2.WINDOW_NORMAL)
+    cv2.resizeWindow("Label DXF", display_img.shape[1], display_img.shape[0])
+    cv2.imshow("Label DXF", display_img)
+    cv2.setMouseCallback("Label DXF", click_event)
+    draw_labels()
+
+    print("Click on room centers/corners to label them, or on a label to review it. Press ESC when done.")
+    while True:
+        key = cv2.waitKey(1)
+        if key == 27:  # ESC
+            break
+
+    cv2.destroyAllWindows()
+
+    # === Save labeled data ===
+    with open(paths["labels"], "w", encoding="utf-8") as f:
+        json.dump(points, f, indent=2)
+
+    print(f"\n[x] Saved {len(points)} labeled points to {paths['labels']}")
 
 # ----------------------------------------------------
 # 5. Generate Grid Process
 # ----------------------------------------------------
-print("\n--- 5. Generate Grid Process: Final Rasterization ---")
-
-INPUT_DXF_GRID = CLEANED_DXF
-
-# === Load DXF ===
-try:
-    doc = ezdxf.readfile(INPUT_DXF_GRID)
-except IOError:
-    print(f"Error: Cannot read cleaned DXF file at {INPUT_DXF_GRID}. Exiting.")
-    exit()
-
-msp = doc.modelspace()
-line_data = []
-
-# Extract lines (Re-defined from original Grid Process file)
-for e in msp.query("LINE"):
-    start, end = e.dxf.start, e.dxf.end
-    line_data.append([(start.x, start.y), (end.x, end.y)])
-
-for e in msp.query("LWPOLYLINE"):
-    points = [tuple(p[0:2]) for p in e.get_points()]
-    line_data.append(points)
-
-for e in msp.query("POLYLINE"):
-    points = [(v.dxf.location.x, v.dxf.location.y) for v in e.vertices]
-    line_data.append(points)
-
-if not line_data:
-    print("No geometry found to generate grid. Exiting.")
-    exit()
-
-# === Compute bounds ===
-all_points = [pt for poly in line_data for pt in poly]
-xs, ys = zip(*all_points)
-min_x, max_x = min(xs), max(xs)
-min_y, max_y = min(ys), max(ys)
-
-# --- Add buffer around edges ---
-x_range = max_x - min_x
-y_range = max_y - min_y
-min_x -= x_range * BOUNDARY_BUFFER
-max_x += x_range * BOUNDARY_BUFFER
-min_y -= y_range * BOUNDARY_BUFFER
-max_y += y_range * BOUNDARY_BUFFER
-print(f"Applied {BOUNDARY_BUFFER*100:.0f}% boundary buffer.")
-
-# === Rasterize ===
-width = int((max_x - min_x) / cell_size) + 1
-height = int((max_y - min_y) / cell_size) + 1
-img = np.zeros((height, width), dtype=np.uint8)
-
-def to_grid_coords_grid(x, y):
-    gx = int((x - min_x) / cell_size)
-    gy = int((max_y - y) / cell_size)
-    return gx, gy
-
-for poly in line_data:
-    pts = np.array([to_grid_coords_grid(x, y) for x, y in poly], np.int32)
-    pts = pts.reshape((-1, 1, 2))
-    cv2.polylines(img, [pts], isClosed=False, color=255, thickness=1)
-
-grid = (img > 0).astype(int)
-
-meta = {
-    "min_x": min_x,
-    "max_x": max_x,
-    "min_y": min_y,
-    "max_y": max_y,
-    "cell_size": cell_size,
-}
-
-np.save(OUTPUT_NPY, grid)
-print(f"[x] Saved grid (shape: {grid.shape}) -> {OUTPUT_NPY}")
-
-grid_scaled = cv2.resize(
-    grid,
-    (grid.shape[1] * scale_factor, grid.shape[0] * scale_factor),
-    interpolation=cv2.INTER_NEAREST
-)
-
-with open(META_JSON, "w") as f:
-    json.dump(meta, f, indent=2)
-print(f"[x] Saved grid metadata -> {META_JSON}")
-
-plt.imshow(grid_scaled, cmap="gray")
-plt.title("Final Floorplan Grid")
-plt.axis("off")
-plt.show()
-
-print("\n--- All processes completed! ---")
\ No newline at end of file
+def generate_grid(paths, show=True):
+    print("\n--- 5. Generate Grid Process: Final Rasterization ---")
+
+    geometry = read_geometry(paths["cleaned"], "cleaned")
+
+    if len(geometry) == 0:
+        raise ValueError("No geometry found to generate grid.")
+
+    # === Compute bounds ===
+    min_x, max_x, min_y, max_y = geometry.bounds()
+
+    # --- Add buffer around edges ---
+    x_range = max_x - min_x
+    y_range = max_y - min_y
+    min_x -= x_range * BOUNDARY_BUFFER
+    max_x += x_range * BOUNDARY_BUFFER
+    min_y -= y_range * BOUNDARY_BUFFER
+    max_y += y_range * BOUNDARY_BUFFER
+    print(f"Applied {BOUNDARY_BUFFER*100:.0f}% boundary buffer.")
+
+    # === Rasterize ===
+    grid = (rasterize(geometry, min_x, max_x, min_y, max_y) > 0).astype(np.uint8)
+
+    meta = {
+        "min_x": min_x,
+        "max_x": max_x,
+        "min_y": min_y,
+        "max_y": max_y,
+        "cell_size": cell_size,
+    }
+
+    np.save(paths["grid"], grid)
+    print(f"[x] Saved grid (shape: {grid.shape}) -> {paths['grid']}")
+
+    with open(paths["meta"], "w") as f:
+        json.dump(meta, f, indent=2)
+    print(f"[x] Saved grid metadata -> {paths['meta']}")
+
+    # Remember what was drawn so later edits can be regridded incrementally
+    dxfGeometry.save_geometry(paths["grid_source"], geometry)
+    if os.path.exists(paths["grid_delta"]):
+        os.remove(paths["grid_delta"]) # describes a grid that no longer exists
+
+    if not show:
+        return
+
+    grid_scaled = cv2.resize(
+        grid,
+        (grid.shape[1] * scale_factor, grid.shape[0] * scale_factor),
+        interpolation=cv2.INTER_NEAREST
+    )
+
+    plt.imshow(grid_scaled, cmap="gray")
+    plt.title("Final Floorplan Grid")
+    plt.axis("off")
+    plt.show()
+
+# ----------------------------------------------------
+# 5b. Incremental Regrid (localized edits)
+# ----------------------------------------------------
+def rect_to_cells(rect, meta, shape):
+    """DXF rect (x1, y1, x2, y2) -> inclusive (r0, r1, c0, c1) on the grid, None if off-grid."""
+    x1, y1, x2, y2 = rect
+    size = meta["cell_size"]
+    c0, c1 = int((min(x1, x2) - meta["min_x"]) / size), int((max(x1, x2) - meta["min_x"]) / size)
+    r0, r1 = int((meta["max_y"] - max(y1, y2)) / size), int((meta["max_y"] - min(y1, y2)) / size)
+    c0, r0 = max(c0, 0), max(r0, 0)
+    c1, r1 = min(c1, shape[1] - 1), min(r1, shape[0] - 1)
+    if c0 > c1 or r0 > r1:
+        return None
+    return r0, r1, c0, c1
+
+def regrid(paths, rects=None):
+    """
+    Rerasterizes only the cells under `rects` (DXF x1, y1, x2, y2) or, by
+    default, under the entities of cleaned.dxf that changed since the grid
+    was drawn. meta.json is kept as is, so labels stay on the same cells.
+    The changed cells go to grid_delta.npz (rows, cols, values) for
+    downstream caches to patch.
+    Returns: (rows, cols) of the changed cells
+    """
+    print("\n--- 5b. Regrid Process: Incremental Rasterization ---")
+
+    if not (os.path.exists(paths["grid"]) and os.path.exists(paths["meta"])):
+        raise FileNotFoundError(f"Error: No grid at {paths['grid']} to update; run the grid stage first.")
+    grid = np.load(paths["grid"])
+    with open(paths["meta"], "r") as f:
+        meta = json.load(f)
+    geometry = read_geometry(paths["cleaned"], "cleaned")
+
+    if rects is None:
+        if not os.path.exists(paths["grid_source"]):
+            raise FileNotFoundError(f"Error: No {paths['grid_source']} to diff against; pass a rect or run the grid stage.")
+        rects = dxfGeometry.changed_boxes(dxfGeometry.read_saved_geometry(paths["grid_source"]), geometry)
+        print(f"{len(rects)} polyline(s) changed since the grid was drawn.")
+
+    min_x, max_x, min_y, max_y = geometry.bounds()
+    if min_x < meta["min_x"] or max_x > meta["max_x"] or min_y < meta["min_y"] or max_y > meta["max_y"]:
+        print("[!] Geometry now reaches past the grid frame; the part outside is not drawn (full grid stage re-frames).")
+
+    windows = [w for w in (rect_to_cells(rect, meta, grid.shape) for rect in rects) if w is not None]
+    patches = dxfGeometry.rasterize_windows(geometry, grid.shape, meta["min_x"], meta["max_y"], meta["cell_size"], windows)
+
+    changed = np.zeros(grid.shape, dtype=bool)
+    for (r0, r1, c0, c1), patch in zip(windows, patches):
+        patch = (patch > 0).astype(np.uint8)
+        changed[r0:r1 + 1, c0:c1 + 1] |= patch != grid[r0:r1 + 1, c0:c1 + 1]
+        grid[r0:r1 + 1, c0:c1 + 1] = patch
+
+    rows, cols = np.nonzero(changed)
+    if len(rows):
+        np.save(paths["grid"], grid)
+    np.savez(paths["grid_delta"], rows=rows, cols=cols, values=grid[rows, cols])
+    dxfGeometry.save_geometry(paths["grid_source"], geometry)
+    print(f"[x] {len(rows)} cell(s) changed -> {paths['grid']} (delta: {paths['grid_delta']})")
+    return rows, cols
+
+# ----------------------------------------------------
+# Interactive run (one floor, every stage)
+# ----------------------------------------------------
+def run_interactive(building_code):
+    paths = floor_paths(building_code)
+    os.makedirs(paths["folder"], exist_ok=True) # Ensure directory exists
+
+    scrape(paths)
+    zoom(paths)
+    delete_interactive(paths)
+    if not os.path.exists(paths["labels"]):
+        # Prefill from the plan's text when it has any; the labeler then reviews them
+        import autoLabel
+        added, message = autoLabel.label_floor(building_code)
+        print(f"\n[x] Auto-labeled {added} point(s): {message}")
+    label_interactive(paths)
+    generate_grid(paths)
+
+    print("\n--- All processes completed! ---")
+
+# ----------------------------------------------------
+# Batch run (many floors, automatable stages only)
+# ----------------------------------------------------
+def find_floor_codes(patterns, base_dir=BASE_DIR):
+    """
+    Expands floor codes / globs ('sw03F1', 'sw03' = all its floors, 'sw*F2',
+    'se1?') to the sorted floor codes that have a folder under base_dir.
+    """
+    codes = []
+    for direction in sorted(os.listdir(base_dir)):
+        direction_dir = os.path.join(base_dir, direction)
+        if not os.path.isdir(direction_dir):
+            continue
+        for number in sorted(os.listdir(direction_dir)):
+            building_dir = os.path.join(direction_dir, number)
+            if not os.path.isdir(building_dir):
+                continue
+            codes += [f"{direction}{number}{f}" for f in sorted(os.listdir(building_dir))
+                      if f.startswith("F") and os.path.isdir(os.path.join(building_dir, f))]
+
+    matched = []
+    for pattern in patterns:
+        pattern = pattern.lower()
+        if "f" not in pattern and not pattern.endswith("*"):
+            pattern += "f*" # building code alone: every floor
+        matched += [code for code in codes if fnmatch.fnmatch(code.lower(), pattern) and code not in matched]
+    return matched
+
+def run_batch(patterns, workers=None, force=False):
+    # The content-hashed orchestrator does the work; imported here because it imports this module
+    import buildPipeline
+    return buildPipeline.run_pipeline(patterns, workers, force)
+
+def main():
+    # Batch: --batch <code|glob> [...] [--workers N] [--force]
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        args = sys.argv[2:]
+        workers, force = None, False
+        if "--force" in args:
+            args.remove("--force")
+            force = True
+        if "--workers" in args:
+            i = args.index("--workers")
+            workers = int(args[i + 1])
+            del args[i:i + 2]
+        if not args:
+            print("Usage: python floorPlans/newFloorPlan.py --batch <code|glob> [...] [--workers N] [--force]")
+            sys.exit(1)
+        results = run_batch(args, workers, force)
+        sys.exit(1 if any(r["status"] == "error" for r in results) else 0)
+
+    # Regrid: --regrid <building_code> [x1 y1 x2 y2]
+    if len(sys.argv) > 1 and sys.argv[1] == "--regrid":
+        if len(sys.argv) not in (3, 7):
+            print("Usage: python floorPlans/newFloorPlan.py --regrid <building_code> [x1 y1 x2 y2]")
+            sys.exit(1)
+        rects = [[float(v) for v in sys.argv[3:7]]] if len(sys.argv) == 7 else None
+        try:
+            regrid(floor_paths(sys.argv[2]), rects)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"{e} Exiting.")
+            sys.exit(1)
+        return
+
+    # Interactive: [building_code], e.g. sw05F1
+    try:
+        run_interactive(sys.argv[1] if len(sys.argv) > 1 else BUILDING_CODE)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"{e} Exiting.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
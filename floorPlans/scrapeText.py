@@ -1,5 +1,6 @@
 import ezdxf
 import math
+import dxfGeometry
 
 BUILDING_CODE = "se06F1"
 
@@ -7,17 +8,10 @@ folder_path = f"floorPlans/{BUILDING_CODE[:2]}/{BUILDING_CODE[2:4]}/{BUILDING_CO
 DXF_PATH = f"{folder_path}/{BUILDING_CODE}Plan.dxf"
 OUTPUT_DXF = f"{folder_path}/scraped.dxf"
 
-# === STEP 2: Clean DXF geometry ===
-doc_dxf = ezdxf.readfile(DXF_PATH)
-msp = doc_dxf.modelspace()
+# === STEP 2: Clean DXF geometry (streamed: only kept polylines stay in memory) ===
 cleaned_polys = []
 
-for e in msp.query('LWPOLYLINE POLYLINE'):
-    if e.dxftype() == "LWPOLYLINE":
-        pts = [p[0:2] for p in e.get_points()]
-    else:
-        pts = [(v.dxf.location.x, v.dxf.location.y) for v in e.vertices]
-
+for _, pts in dxfGeometry.iter_entity_points(DXF_PATH, ("LWPOLYLINE", "POLYLINE")):
     if len(pts) < 2:
         continue
 
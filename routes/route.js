@@ -2,7 +2,7 @@ import express from "express";
 import { checkSession } from "../middleware/authMiddleware.js";
 import admin from "../config/firebase.js";
 
-import { handlePathRequest } from "../controllers/pathfinderController.js";
+import { handlePathRequest, getPathRequestStats } from "../controllers/pathfinderController.js";
 
 const router = express.Router();
 const db = admin.firestore();
@@ -79,6 +79,11 @@ router.get('/interior', (req, res) => {
 // Pathfinding submission
 router.post("/find-path", handlePathRequest);
 
+// How many pathfinding requests shared an in-flight run
+router.get("/find-path/stats", (req, res) => {
+  res.json(getPathRequestStats());
+});
+
 
 // --- Test Logging Route ---
 router.get("/test-error", (req, res, next) => {
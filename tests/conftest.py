@@ -0,0 +1,38 @@
+"""
+Shared setup for the Python tests: puts controllers/ and floorPlans/ on
+sys.path (both are script directories, not packages) and resets the
+pathfinder's module-level tables between tests.
+"""
+
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FLOORPLANS_DIR = os.path.join(REPO_DIR, "floorPlans")
+for path in (os.path.join(REPO_DIR, "controllers"), FLOORPLANS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import matplotlib
+matplotlib.use("Agg") # no windows from plt.show()
+
+import pathFindingRoom
+
+
+def reset_pathfinder():
+    """Empties every global table pathFindingRoom fills while loading and routing."""
+    P = pathFindingRoom
+    for table in (P.ALL_BUILDING_DATA, P.ROOM_COORDS, P.STAIRS, P.ENTRANCES, P.PORTALS, P.FACILITY_MAPS,
+                  P.FREE_MASKS, P.ROUTE_TABLES, P.SKELETON_GRAPHS, P.VISIBILITY_GRAPHS, P.CLOSURES,
+                  P.CLOSED_CELLS, P.CLOSED_PORTALS, P.ROUTE_CACHE):
+        table.clear()
+
+
+@pytest.fixture
+def pathfinder():
+    """The pathFindingRoom module with empty tables, emptied again afterwards."""
+    reset_pathfinder()
+    yield pathFindingRoom
+    reset_pathfinder()
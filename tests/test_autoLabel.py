@@ -0,0 +1,89 @@
+"""
+autoLabel.py on a synthetic floor: a source DXF with TEXT / MTEXT built with
+ezdxf.new() in a tmp floorPlans tree, so no committed plan is needed.
+"""
+
+import ezdxf
+import pytest
+
+import autoLabel
+import dxfGeometry
+import newFloorPlan as nfp
+
+CODE = "zz01F1"
+
+# text, kind, insert; None = not a label or outside the plan
+PLAN_TEXT = [
+    ("RM 1840", "TEXT", (50, 60), "1840"),
+    ("STAIR\\PA", "MTEXT", (150, 20), "stairs A"),
+    ("stairs a", "TEXT", (10, 90), "stairs A"),
+    ("North Entrance", "MTEXT", (100, 2), "entranceNorth"),
+    ("OFFICE", "TEXT", (80, 50), None),
+    ("1841", "TEXT", (500, 500), None), # title block, outside the walls
+]
+
+
+@pytest.fixture
+def floor(tmp_path, monkeypatch):
+    """floor_paths() of CODE under a tmp floorPlans dir with a walled 200 x 100 plan."""
+    monkeypatch.setattr(nfp, "BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(dxfGeometry, "CACHE_DIR", str(tmp_path / ".geometry_cache"))
+    paths = nfp.floor_paths(CODE)
+    (tmp_path / "zz" / "01" / "F1").mkdir(parents=True)
+
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    msp.add_lwpolyline([(0, 0), (200, 0), (200, 100), (0, 100)], close=True)
+    msp.add_line((100, 0), (100, 40))
+    doc.saveas(paths["cleaned"])
+
+    for text, kind, insert, _ in PLAN_TEXT:
+        if kind == "TEXT":
+            msp.add_text(text, dxfattribs={"insert": insert})
+        else:
+            msp.add_mtext(text, dxfattribs={"insert": insert})
+    doc.saveas(f"{paths['folder']}/{CODE}.dxf")
+    return nfp.floor_paths(CODE)
+
+
+def test_labels_come_from_text_and_mtext_inside_the_plan(floor):
+    points, source = autoLabel.auto_label(CODE)
+
+    assert source == "dxf"
+    assert sorted((p["label"], p["x"], p["y"]) for p in points) == sorted(
+        (label, float(x), float(y)) for _, _, (x, y), label in PLAN_TEXT if label)
+
+
+def test_label_positions_map_to_the_pathfinder_grid(floor, pathfinder, tmp_path):
+    nfp.generate_grid(floor, show=False)
+    added, _ = autoLabel.label_floor(CODE)
+    assert added == 4
+
+    data = pathfinder.load_floor_data(str(tmp_path), CODE[:4])[1]
+    meta, grid = data["meta"], data["grid"]
+
+    def cell(x, y):
+        return int((meta["max_y"] - y) / meta["cell_size"]), int((x - meta["min_x"]) / meta["cell_size"])
+
+    assert data["rooms"] == {1840: [(1, cell(50, 60))]}
+    assert data["stairs"] == {"A": {1: cell(10, 90)}} # one stair cell per floor: the last label wins
+    assert data["entrances"] == {"entrancenorth": [(1, cell(100, 2))]}
+    for r, c in data["dxf_points"]:
+        assert 0 <= r < grid.shape[0] and 0 <= c < grid.shape[1]
+    assert data["dxf_points"][cell(50, 60)] == (50.0, 60.0)
+    # The walls the labels sit between are where the plan draws them
+    assert grid[cell(100, 20)] == 1 and grid[cell(50, 60)] == 0
+
+
+def test_merge_is_keyed_by_label_and_position(floor):
+    autoLabel.save_labels(floor["labels"], [
+        {"x": 151.5, "y": 19.0, "label": "Stairs A"}, # hand-placed next to the plan text
+        {"x": 50.0, "y": 60.0, "label": "1840"},
+    ])
+
+    added, _ = autoLabel.label_floor(CODE, mode="merge")
+
+    labels = autoLabel.load_labels(floor["labels"])
+    assert added == 2
+    assert [(p["label"], p["x"], p["y"]) for p in labels[2:]] == [
+        ("stairs A", 10.0, 90.0), ("entranceNorth", 100.0, 2.0)]
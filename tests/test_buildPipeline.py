@@ -0,0 +1,157 @@
+"""
+Tests for floorPlans/buildPipeline.py: which stages a build reruns, on a
+synthetic floor (source DXF built with ezdxf.new()) in a tmp floorPlans tree.
+
+Usage: python -m pytest tests/test_buildPipeline.py
+"""
+
+import json
+import os
+
+import ezdxf
+import numpy as np
+import pytest
+
+import buildPipeline
+import dxfGeometry
+import editLog
+import newFloorPlan as nfp
+
+CODE = "zz01F1"
+ALL_STAGES = ["scrape", "zoom", "replay-edits", "grid"]
+
+
+@pytest.fixture
+def floor(tmp_path, monkeypatch):
+    """floor_paths() of CODE with a source plan, an edit log and labels; parameters restored afterwards."""
+    monkeypatch.setattr(nfp, "BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(dxfGeometry, "CACHE_DIR", str(tmp_path / ".geometry_cache"))
+    for name in buildPipeline.PARAMETERS:
+        monkeypatch.setattr(nfp, name, getattr(nfp, name)) # build_floor(overrides=...) sets them
+    paths = nfp.floor_paths(CODE)
+    os.makedirs(paths["folder"])
+
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    msp.add_lwpolyline([(0, 0), (400, 0), (400, 300), (0, 300)], close=True)
+    for x in (100, 200, 300):
+        msp.add_lwpolyline([(x, 0), (x, 120)])
+        msp.add_lwpolyline([(x, 180), (x, 300)])
+    msp.add_lwpolyline([(0, 150), (60, 150), (60, 190)]) # diagonal 72
+    msp.add_lwpolyline([(150, 60), (170, 70)])            # diagonal 22: text junk
+    msp.add_text("RM 101", dxfattribs={"insert": (50, 50)})
+    doc.saveas(f"{paths['folder']}/{CODE}.dxf")
+
+    editLog.save_edits(paths["edits"], [editLog.delete_op(295, 230, 305, 310)])
+    with open(paths["labels"], "w") as f:
+        json.dump([{"x": 50.0, "y": 50.0, "label": "101"}], f)
+    return nfp.floor_paths(CODE)
+
+
+def build(**kwargs):
+    result = buildPipeline.build_floor(CODE, **kwargs)
+    assert result["status"] == "ok", result["message"]
+    return result["stages"]
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_first_build_runs_every_stage_then_none(floor):
+    assert build() == ALL_STAGES
+    assert build() == []
+    manifest = buildPipeline.load_manifest(f"{floor['folder']}/{buildPipeline.MANIFEST_FILE}")
+    assert sorted(manifest) == sorted(ALL_STAGES)
+
+
+def test_parameter_change_reruns_only_what_it_changes(floor):
+    build()
+    assert build(overrides={"BOUNDARY_BUFFER": 0.05}) == ["grid"]
+    # Junk threshold moved but the same polylines survive: the cascade stops at scrape
+    assert build(overrides={"SCRAPE_MIN_DIAG": 40}) == ["scrape"]
+    # Walls dropped: everything downstream reruns, the grid in place on its frame
+    assert build(overrides={"SCRAPE_MIN_DIAG": 100}) == ["scrape", "zoom", "replay-edits", "regrid"]
+    assert build(force=True) == ALL_STAGES
+
+
+def test_edit_log_change_regrids_only_the_changed_cells(floor):
+    build()
+    with open(floor["meta"]) as f:
+        meta = json.load(f)
+
+    edits = editLog.load_edits(floor["edits"])
+    editLog.save_edits(floor["edits"], edits + [editLog.delete_op(195, -10, 205, 60)])
+    assert build() == ["replay-edits", "regrid"]
+
+    with open(floor["meta"]) as f:
+        assert json.load(f) == meta # labels keep their cells
+    cleaned = dxfGeometry.load_geometry(floor["cleaned"])
+    full = dxfGeometry.rasterize(cleaned, meta["min_x"], meta["max_x"], meta["min_y"], meta["max_y"], meta["cell_size"])
+    assert np.array_equal(np.load(floor["grid"]), (full > 0).astype(np.uint8))
+    with np.load(floor["grid_delta"]) as delta:
+        assert 0 < len(delta["rows"]) < full.size // 100
+
+
+def test_rewritten_but_identical_dxf_is_up_to_date(floor):
+    build()
+    doc = ezdxf.readfile(floor["cropped"])
+    doc.header["$FINGERPRINTGUID"] = "{00000000-0000-0000-0000-000000000001}"
+    doc.saveas(floor["cropped"])
+    assert build() == []
+
+
+def test_missing_or_changed_output_is_rebuilt(floor):
+    build()
+    os.remove(floor["grid"])
+    assert build() == ["grid"]
+
+    doc = ezdxf.readfile(floor["cleaned"])
+    doc.modelspace().add_line((10, 10), (90, 10))
+    doc.saveas(floor["cleaned"]) # hand edit of a generated file
+    # Replay overwrites it with what the grid was built from
+    assert build() == ["replay-edits"]
+    assert build() == []
+
+
+def test_dry_run_reports_and_writes_nothing(floor):
+    build()
+    editLog.save_edits(floor["edits"], [])
+    manifest_path = f"{floor['folder']}/{buildPipeline.MANIFEST_FILE}"
+    before = {key: read(floor[key]) for key in ("cleaned", "grid")}
+    manifest = read(manifest_path)
+
+    assert build(dry_run=True) == ["replay-edits", "regrid"]
+    assert {key: read(floor[key]) for key in before} == before
+    assert read(manifest_path) == manifest
+
+
+def test_fresh_clone_records_the_committed_artifacts(floor):
+    build()
+    manifest_path = f"{floor['folder']}/{buildPipeline.MANIFEST_FILE}"
+    # A committed grid written by an older grid stage
+    np.save(floor["grid"], np.load(floor["grid"]).astype(np.int32))
+    os.remove(manifest_path)
+    committed = {key: read(floor[key]) for key in ("scraped", "cropped", "cleaned", "grid", "meta")}
+
+    assert build() == []
+    assert {key: read(floor[key]) for key in committed} == committed
+    assert np.load(floor["grid"]).dtype == np.int32
+    assert build() == []
+    # An explicit parameter still rebuilds its stage
+    assert build(overrides={"BOUNDARY_BUFFER": 0.05}) == ["grid"]
+
+
+def test_fresh_clone_rebuilds_downstream_of_a_missing_output(floor):
+    build()
+    os.remove(f"{floor['folder']}/{buildPipeline.MANIFEST_FILE}")
+    os.remove(floor["cropped"])
+    assert build() == ["zoom", "replay-edits", "grid"]
+
+
+def test_floor_without_cleanup_is_reported(floor):
+    os.remove(floor["edits"])
+    result = buildPipeline.build_floor(CODE)
+    assert result["stages"] == ["scrape", "zoom"]
+    assert result["status"] == "needs-cleanup"
@@ -0,0 +1,257 @@
+"""
+Tests for floorPlans/dxfGeometry.py: clipping, rasterization, change
+detection and the parse cache, on small DXFs built with ezdxf.new().
+
+Usage: python -m pytest tests/test_dxfGeometry.py
+"""
+
+import os
+
+import cv2
+import ezdxf
+import numpy as np
+import pytest
+
+from conftest import FLOORPLANS_DIR
+
+import dxfGeometry
+from dxfGeometry import LINE, LWPOLYLINE, Geometry
+
+
+def runs(geometry):
+    return [[tuple(map(float, p)) for p in poly] for poly in geometry.polylines()]
+
+
+def random_geometry(rng, n, extent=200.0):
+    polylines = [rng.uniform(0, extent, size=(rng.integers(2, 6), 2)).tolist() for _ in range(n)]
+    return Geometry.from_polylines(polylines, LWPOLYLINE)
+
+
+def rasterize_per_line(line_data, min_x, max_x, min_y, max_y, cell_size=1):
+    """The original generate_grid loop: int() per point, one cv2.polylines call per polyline."""
+    width = int((max_x - min_x) / cell_size) + 1
+    height = int((max_y - min_y) / cell_size) + 1
+    img = np.zeros((height, width), dtype=np.uint8)
+    for poly in line_data:
+        pts = np.array([(int((x - min_x) / cell_size), int((max_y - y) / cell_size)) for x, y in poly], np.int32)
+        cv2.polylines(img, [pts.reshape((-1, 1, 2))], isClosed=False, color=255, thickness=1)
+    return img
+
+# =============================================================
+# === CLIPPING ===
+# =============================================================
+
+BOX = (0.0, 0.0, 10.0, 10.0)
+
+
+@pytest.mark.parametrize("points, expected", [
+    ([(-5, 5), (15, 5)], [[(0, 5), (10, 5)]]),                     # crosses, both ends outside
+    ([(-5, -5), (15, 15)], [[(0, 0), (10, 10)]]),                  # diagonal through two corners
+    ([(5, -5), (5, 15)], [[(5, 0), (5, 10)]]),                     # vertical (dx == 0)
+    ([(2, 3), (8, 7)], [[(2, 3), (8, 7)]]),                        # inside: kept exactly
+    ([(-5, 12), (15, 12)], []),                                    # parallel to an edge, outside
+    ([(-1, -5), (-1, 15)], []),                                    # parallel to an edge, outside
+    ([(-5, 10), (15, 10)], [[(0, 10), (10, 10)]]),                 # lies on an edge
+    ([(10, 2), (14, 2)], [[(10, 2), (10, 2)]]),                    # touches an edge at one point
+    ([(20, 20), (30, 30), (40, 20)], []),                          # outside
+    ([(2, 2), (15, 2), (15, 8), (2, 8)], [[(2, 2), (10, 2)], [(10, 8), (2, 8)]]), # leaves and comes back
+    ([(1, 1), (9, 1), (9, 9), (1, 9)], [[(1, 1), (9, 1), (9, 9), (1, 9)]]),       # inside: one run
+])
+def test_clip_to_box(points, expected):
+    clipped = dxfGeometry.clip_to_box(Geometry.from_polylines([points], LINE), *BOX)
+    assert runs(clipped) == [[(float(x), float(y)) for x, y in run] for run in expected]
+    assert (clipped.kinds == LWPOLYLINE).all()
+
+
+def test_clip_to_box_keeps_polylines_apart():
+    # The end of one polyline and the start of the next are not a segment
+    geometry = Geometry.from_polylines([[(1, 1), (4, 4)], [(6, 6), (9, 9)]], LINE)
+    assert runs(dxfGeometry.clip_to_box(geometry, *BOX)) == [[(1, 1), (4, 4)], [(6, 6), (9, 9)]]
+
+
+def test_clip_to_box_matches_per_segment_clipping():
+    rng = np.random.default_rng(4)
+    geometry = random_geometry(rng, 300)
+    box = (50.0, 60.0, 140.0, 150.0)
+    clipped = dxfGeometry.clip_to_box(geometry, *box)
+
+    expected = []
+    for poly in geometry.polylines():
+        for p, q in zip(poly, poly[1:]):
+            t0, t1, d = 0.0, 1.0, q - p
+            inside = True
+            for pk, qk in ((-d[0], p[0] - box[0]), (d[0], box[2] - p[0]), (-d[1], p[1] - box[1]), (d[1], box[3] - p[1])):
+                if pk == 0:
+                    inside &= qk >= 0
+                elif pk < 0:
+                    t0 = max(t0, qk / pk)
+                else:
+                    t1 = min(t1, qk / pk)
+            if inside and t0 <= t1:
+                expected.append((p + t0 * d, p + t1 * d))
+    got = [(a, b) for poly in clipped.polylines() for a, b in zip(poly, poly[1:])]
+    assert len(got) == len(expected)
+    for (a, b), (ea, eb) in zip(got, expected):
+        assert np.allclose(a, ea) and np.allclose(b, eb)
+
+# =============================================================
+# === RASTERIZATION ===
+# =============================================================
+
+def test_rasterize_matches_the_per_line_loop():
+    rng = np.random.default_rng(1)
+    geometry = random_geometry(rng, 400)
+    min_x, max_x, min_y, max_y = geometry.bounds()
+    for cell_size in (1, 2.5):
+        img = dxfGeometry.rasterize(geometry, min_x - 3.3, max_x + 1.7, min_y - 0.4, max_y + 2.0, cell_size)
+        assert np.array_equal(img, rasterize_per_line(geometry.line_data(), min_x - 3.3, max_x + 1.7,
+                                                      min_y - 0.4, max_y + 2.0, cell_size))
+
+
+def test_rasterize_matches_the_per_line_loop_on_a_committed_floor(tmp_path):
+    geometry = dxfGeometry.load_geometry(os.path.join(FLOORPLANS_DIR, "se", "06", "F1", "cleaned.dxf"),
+                                         cache_dir=str(tmp_path))
+    bounds = geometry.bounds()
+    assert np.array_equal(dxfGeometry.rasterize(geometry, *bounds), rasterize_per_line(geometry.line_data(), *bounds))
+
+
+def test_rasterize_windows_match_the_full_raster():
+    rng = np.random.default_rng(2)
+    geometry = random_geometry(rng, 300)
+    min_x, max_x, min_y, max_y = geometry.bounds()
+    full = dxfGeometry.rasterize(geometry, min_x, max_x, min_y, max_y)
+    windows = [(0, full.shape[0] - 1, 0, full.shape[1] - 1), (0, 0, 0, 0)]
+    for _ in range(40):
+        r0, r1 = sorted(rng.integers(0, full.shape[0], 2))
+        c0, c1 = sorted(rng.integers(0, full.shape[1], 2))
+        windows.append((int(r0), int(r1), int(c0), int(c1)))
+    patches = dxfGeometry.rasterize_windows(geometry, full.shape, min_x, max_y, 1, windows)
+    for (r0, r1, c0, c1), patch in zip(windows, patches):
+        assert np.array_equal(patch, full[r0:r1 + 1, c0:c1 + 1])
+
+# =============================================================
+# === CHANGE DETECTION ===
+# =============================================================
+
+def test_changed_boxes_are_the_polylines_only_one_side_has():
+    kept = [[(0, 0), (5, 0)], [(1, 1), (1, 6), (3, 6)]]
+    old = Geometry.from_polylines(kept + [[(10, 10), (12, 14)], [(0, 0), (5, 0)]], LWPOLYLINE)
+    new = Geometry.from_polylines(kept[::-1] + [[(20, 20), (21, 25)]], LWPOLYLINE)
+    boxes = sorted(map(tuple, dxfGeometry.changed_boxes(old, new).tolist()))
+    # The duplicate (0, 0)-(5, 0) lost one copy: multisets, not sets
+    assert boxes == [(0, 0, 5, 0), (10, 10, 12, 14), (20, 20, 21, 25)]
+    assert len(dxfGeometry.changed_boxes(old, old)) == 0
+
+
+def test_changed_boxes_see_reversed_polylines():
+    old = Geometry.from_polylines([[(0, 0), (5, 0), (5, 5)]], LWPOLYLINE)
+    new = Geometry.from_polylines([[(5, 5), (5, 0), (0, 0)]], LWPOLYLINE)
+    assert len(dxfGeometry.changed_boxes(old, new)) == 2
+
+
+def test_regridding_changed_boxes_equals_a_full_regrid():
+    rng = np.random.default_rng(3)
+    old_lines = random_geometry(rng, 300).line_data()
+    new_lines = [p for p in old_lines if rng.random() > 0.1] # deletions
+    new_lines += random_geometry(rng, 20).line_data()         # additions
+    new_lines[5] = [(x + 0.6, y) for x, y in new_lines[5]]     # a moved polyline
+    rng.shuffle(new_lines)                                     # order does not matter
+    old = Geometry.from_polylines(old_lines, LWPOLYLINE)
+    new = Geometry.from_polylines(new_lines, LWPOLYLINE)
+
+    min_x, max_x, min_y, max_y = -10.0, 210.0, -10.0, 210.0
+    grid = dxfGeometry.rasterize(old, min_x, max_x, min_y, max_y)
+    windows = []
+    for x1, y1, x2, y2 in dxfGeometry.changed_boxes(old, new).tolist():
+        windows.append((int(max_y - y2), int(max_y - y1), int(x1 - min_x), int(x2 - min_x)))
+    for (r0, r1, c0, c1), patch in zip(windows, dxfGeometry.rasterize_windows(new, grid.shape, min_x, max_y, 1, windows)):
+        grid[r0:r1 + 1, c0:c1 + 1] = patch
+    assert np.array_equal(grid, dxfGeometry.rasterize(new, min_x, max_x, min_y, max_y))
+
+# =============================================================
+# === PARSING AND CACHE ===
+# =============================================================
+
+@pytest.fixture
+def plan(tmp_path):
+    """A DXF with every geometry kind plus TEXT / MTEXT, and its expected polylines."""
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    msp.add_line((0, 0), (10, 0))
+    msp.add_text("RM 101", dxfattribs={"insert": (2, 2)})
+    msp.add_lwpolyline([(0, 0), (0, 10), (10, 10)])
+    msp.add_mtext("STAIR\\PA", dxfattribs={"insert": (5, 5)})
+    msp.add_polyline2d([(1, 1), (2, 3), (4, 1)])
+    path = str(tmp_path / "plan.dxf")
+    doc.saveas(path)
+    polylines = [[(0.0, 0.0), (10.0, 0.0)], [(0.0, 0.0), (0.0, 10.0), (10.0, 10.0)],
+                 [(1.0, 1.0), (2.0, 3.0), (4.0, 1.0)]]
+    return path, polylines
+
+
+def test_parse_reads_lines_and_polylines_only(plan):
+    path, polylines = plan
+    geometry = dxfGeometry.parse_dxf(path)
+    assert geometry.line_data() == polylines
+    assert geometry.kinds.tolist() == [dxfGeometry.LINE, dxfGeometry.LWPOLYLINE, dxfGeometry.POLYLINE]
+
+
+def test_text_and_mtext_are_streamed_in_order(plan):
+    path, _ = plan
+    texts = [(e.dxftype(), e.plain_text(), tuple(e.dxf.insert)[:2])
+             for e in dxfGeometry.iter_entities(path, ("TEXT", "MTEXT"))]
+    assert texts == [("TEXT", "RM 101", (2.0, 2.0)), ("MTEXT", "STAIR\nA", (5.0, 5.0))]
+
+
+def test_cache_is_keyed_by_file_bytes_and_format(plan, tmp_path, monkeypatch):
+    path, polylines = plan
+    cache = tmp_path / "cache"
+    geometry = dxfGeometry.load_geometry(path, cache_dir=str(cache))
+    assert os.listdir(cache) == [f"{dxfGeometry.file_digest(path)}.npz"]
+
+    # A second load is served from the cache
+    monkeypatch.setattr(dxfGeometry, "parse_dxf", lambda p: pytest.fail("parsed again"))
+    assert dxfGeometry.load_geometry(path, cache_dir=str(cache)).line_data() == polylines
+    monkeypatch.undo()
+
+    # New bytes or a new format version: a new entry, the old one is never read
+    digest = dxfGeometry.file_digest(path)
+    monkeypatch.setattr(dxfGeometry, "FORMAT_VERSION", dxfGeometry.FORMAT_VERSION + 1)
+    assert dxfGeometry.file_digest(path) != digest
+    monkeypatch.undo()
+    doc = ezdxf.readfile(path)
+    doc.modelspace().add_line((3, 3), (4, 4))
+    doc.saveas(path)
+    assert len(dxfGeometry.load_geometry(path, cache_dir=str(cache))) == len(geometry) + 1
+    assert len(os.listdir(cache)) == 2
+
+
+def test_geometry_digest_ignores_everything_but_geometry(plan, tmp_path):
+    path, _ = plan
+    cache = str(tmp_path / "cache")
+    digest = dxfGeometry.geometry_digest(path, cache)
+    doc = ezdxf.readfile(path)
+    doc.modelspace().add_text("OFFICE", dxfattribs={"insert": (7, 7)})
+    doc.saveas(path)
+    assert dxfGeometry.geometry_digest(path, cache) == digest
+    doc.modelspace().add_line((3, 3), (4, 4))
+    doc.saveas(path)
+    assert dxfGeometry.geometry_digest(path, cache) != digest
+
+
+def test_save_geometry_is_atomic(tmp_path, monkeypatch):
+    target = str(tmp_path / "cache" / "entry.npz")
+    before = Geometry.from_polylines([[(0, 0), (1, 1)]], LINE)
+    dxfGeometry.save_geometry(target, before)
+
+    def interrupted(file, **arrays):
+        with open(file, "wb") as f:
+            f.write(b"PK half an archive")
+        raise KeyboardInterrupt
+    monkeypatch.setattr(np, "savez", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        dxfGeometry.save_geometry(target, Geometry.from_polylines([[(5, 5), (6, 6)]], LINE))
+    monkeypatch.undo()
+
+    # Readers only ever see the complete earlier entry
+    assert dxfGeometry.read_saved_geometry(target).line_data() == before.line_data()
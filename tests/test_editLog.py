@@ -0,0 +1,198 @@
+"""
+Tests for floorPlans/editLog.py: edit-log replay and undo on DXFs built with
+ezdxf.new(), checked against the delete rule applied to exploded segments.
+
+Usage: python -m pytest tests/test_editLog.py
+"""
+
+import ezdxf
+import numpy as np
+import pytest
+
+import dxfGeometry
+import editLog
+
+
+def exploded_segments(msp):
+    """Every straight segment of msp's LINEs and polylines, as the delete tool saw them when exploded."""
+    point_lists, _ = editLog.entity_segments(editLog.editable_entities(msp))
+    return point_lists
+
+
+def expected_segments(segments, edits):
+    """The delete rule on a plain list: a rectangle removes the live segments with a vertex in it."""
+    alive = [True] * len(segments)
+    undo_stack = []
+    for edit in edits:
+        if edit["op"] == "delete":
+            x1, y1, x2, y2 = edit["rect"]
+            hit = [i for i, seg in enumerate(segments)
+                   if alive[i] and any(x1 <= x <= x2 and y1 <= y <= y2 for x, y in seg)]
+            for i in hit:
+                alive[i] = False
+            undo_stack.append(hit)
+        elif undo_stack:
+            for i in undo_stack.pop():
+                alive[i] = True
+    return [seg for seg, keep in zip(segments, alive) if keep]
+
+
+def as_multiset(segments):
+    # Direction and float noise do not matter for a wall
+    return sorted(tuple(sorted((round(x, 6), round(y, 6)) for x, y in seg)) for seg in segments)
+
+
+@pytest.fixture
+def cropped(tmp_path):
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    msp.add_line((0, 0), (10, 0))
+    msp.add_lwpolyline([(0, 5, 0, 0, 0.5), (10, 5), (10, 15), (0, 15)], format="xyseb",
+                       dxfattribs={"layer": "WALLS", "color": 3})
+    msp.add_lwpolyline([(20, 0), (30, 0), (30, 10), (20, 10)], close=True)
+    msp.add_polyline2d([(40, 0), (50, 0), (50, 10), (40, 10)], close=True)
+    msp.add_polyline3d([(60, 0, 1), (70, 0, 2), (70, 10, 3)])
+    msp.add_text("RM 101", dxfattribs={"insert": (5, 10)})
+    path = str(tmp_path / "cropped.dxf")
+    doc.saveas(path)
+    return path
+
+
+def around(x, y):
+    return editLog.delete_op(x - 1, y - 1, x + 1, y + 1)
+
+
+EDITS = [
+    around(0, 0),         # the LINE
+    around(10, 15),       # two spans of the open polyline
+    around(30, 10),       # two middle spans of the closed LWPOLYLINE
+    around(40, 0),        # two spans of the closed POLYLINE
+    around(70, 10),       # last span of the 3D polyline
+    editLog.undo_op(),    # ... brings the 3D polyline back
+    editLog.delete_op(100, 100, 101, 101), # hits nothing (the plan changed since it was logged)
+    editLog.undo_op(),    # ... so this undoes nothing and the closed POLYLINE stays cut
+]
+
+
+def test_entity_segments_close_closed_polylines(cropped):
+    msp = ezdxf.readfile(cropped).modelspace()
+    point_lists, owners = editLog.entity_segments(editLog.editable_entities(msp))
+    assert [int((owners[:, 0] == i).sum()) for i in range(5)] == [1, 3, 4, 4, 2]
+    assert point_lists[7] == [(20.0, 10.0), (20.0, 0.0)] # closing span of the square
+    assert all(len(seg) == 2 for seg in point_lists)
+
+
+def test_replay_removes_the_segments_the_exploded_rule_removes(cropped, tmp_path):
+    edits_path, cleaned = str(tmp_path / "edits.json"), str(tmp_path / "cleaned.dxf")
+    editLog.save_edits(edits_path, EDITS)
+    ops, removed = editLog.replay_edits(cropped, edits_path, cleaned)
+
+    before = exploded_segments(ezdxf.readfile(cropped).modelspace())
+    after = exploded_segments(ezdxf.readfile(cleaned).modelspace())
+    assert ops == len(EDITS) and removed == len(before) - len(after) == 7
+    assert as_multiset(after) == as_multiset(expected_segments(before, EDITS))
+
+
+def test_replay_keeps_untouched_entities_and_splits_touched_polylines_into_runs(cropped, tmp_path):
+    edits_path, cleaned = str(tmp_path / "edits.json"), str(tmp_path / "cleaned.dxf")
+    editLog.save_edits(edits_path, EDITS)
+    editLog.replay_edits(cropped, edits_path, cleaned)
+    msp = ezdxf.readfile(cleaned).modelspace()
+
+    assert len(msp.query("LINE")) == 0
+    assert len(msp.query("TEXT")) == 1
+
+    # Restored by the undo: still whole
+    run_2d, poly_3d = sorted(msp.query("POLYLINE"), key=lambda e: e.is_3d_polyline)
+    assert [tuple(v.dxf.location) for v in poly_3d.vertices] == [(60, 0, 1), (70, 0, 2), (70, 10, 3)]
+    assert not run_2d.is_closed
+    assert [tuple(v.dxf.location)[:2] for v in run_2d.vertices] == [(50, 0), (50, 10), (40, 10)]
+
+    # Open run left of the open polyline keeps its layer, colour and bulge
+    open_run, square_run = sorted(msp.query("LWPOLYLINE"), key=lambda e: e.dxf.layer, reverse=True)
+    assert open_run.dxf.layer == "WALLS" and open_run.dxf.color == 3
+    assert [tuple(p) for p in open_run.get_points("xyb")] == [(0, 5, 0.5), (10, 5, 0)]
+    assert not open_run.closed
+
+    # The closed square lost two spans: one open run that wraps past its start
+    assert [tuple(p) for p in square_run.get_points("xy")] == [(20, 10), (20, 0), (30, 0)]
+    assert not square_run.closed
+
+
+def test_replay_matches_the_exploded_rule_on_random_edits(tmp_path):
+    rng = np.random.default_rng(5)
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    for _ in range(120):
+        pts = rng.uniform(0, 100, size=(rng.integers(2, 7), 2)).round(2).tolist()
+        kind = rng.integers(4)
+        if kind == 0:
+            msp.add_line(pts[0], pts[1])
+        elif kind == 1:
+            msp.add_lwpolyline(pts, close=bool(rng.integers(2)))
+        else:
+            msp.add_polyline2d(pts, close=bool(rng.integers(2)))
+    cropped, cleaned, edits_path = (str(tmp_path / name) for name in ("cropped.dxf", "cleaned.dxf", "edits.json"))
+    doc.saveas(cropped)
+
+    edits = []
+    for _ in range(40):
+        if edits and rng.random() < 0.25:
+            edits.append(editLog.undo_op())
+        else:
+            x, y = rng.uniform(0, 100, 2)
+            w, h = rng.uniform(1, 15, 2)
+            edits.append(editLog.delete_op(x, y, x + w, y + h))
+    editLog.save_edits(edits_path, edits)
+    editLog.replay_edits(cropped, edits_path, cleaned)
+
+    before = exploded_segments(ezdxf.readfile(cropped).modelspace())
+    after = exploded_segments(ezdxf.readfile(cleaned).modelspace())
+    assert as_multiset(after) == as_multiset(expected_segments(before, edits))
+
+
+def test_undo_after_a_delete_that_now_hits_nothing_undoes_that_delete():
+    index = editLog.EntityIndex([[(0, 0), (1, 0)], [(5, 5), (6, 5)]])
+    deleted = editLog.apply_edits(index, [
+        editLog.delete_op(-1, -1, 2, 1),   # A
+        editLog.delete_op(10, 10, 12, 12), # B: its entity is gone from the regenerated plan
+        editLog.undo_op(),                 # undoes B, not A
+    ])
+    assert deleted.tolist() == [0]
+
+
+def test_unknown_operation_is_rejected():
+    index = editLog.EntityIndex([[(0, 0), (1, 1)]])
+    with pytest.raises(ValueError):
+        editLog.apply_edits(index, [{"op": "move"}])
+
+
+def test_missing_cropped_dxf_is_reported(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        editLog.replay_edits(str(tmp_path / "cropped.dxf"), str(tmp_path / "edits.json"), str(tmp_path / "out.dxf"))
+
+
+def test_canvas_redraws_match_a_full_redraw():
+    rng = np.random.default_rng(6)
+    segments = [rng.uniform(0, 300, size=(2, 2)).tolist() for _ in range(600)]
+    xs, ys = zip(*[p for seg in segments for p in seg])
+    bounds = (min(xs), max(xs), min(ys), max(ys))
+    canvas = editLog.EditCanvas(segments, *bounds, cell_size=1, scale=0.37)
+
+    undo_stack = []
+    for _ in range(30):
+        if undo_stack and rng.random() < 0.3:
+            canvas.restore(undo_stack.pop())
+        else:
+            x, y = rng.uniform(0, 300, 2)
+            hit = canvas.delete(x, y, x + 40, y + 25)
+            if len(hit):
+                undo_stack.append(hit)
+
+        live = [seg for seg, alive in zip(segments, canvas.index.alive) if alive]
+        full = dxfGeometry.rasterize(dxfGeometry.Geometry.from_polylines(live, dxfGeometry.LINE), *bounds)
+        assert np.array_equal(canvas.img, full)
+        fresh = editLog.EditCanvas(segments, *bounds, cell_size=1, scale=0.37)
+        fresh.index.alive[:] = canvas.index.alive
+        fresh.redraw()
+        assert np.array_equal(canvas.display, fresh.display)
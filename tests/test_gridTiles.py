@@ -0,0 +1,60 @@
+"""
+Tests for controllers/gridTiles.py: lookups on a tile store against the
+dense grid it was written from.
+
+Usage: python -m pytest tests/test_gridTiles.py
+"""
+
+import numpy as np
+import pytest
+
+import gridTiles
+
+
+@pytest.fixture
+def stored(tmp_path):
+    """(dense grid, TiledGrid) for a 150 x 100 grid with free, wall and mixed 32-cell tiles."""
+    rng = np.random.default_rng(3)
+    grid = (rng.random((150, 100)) < 0.3).astype(np.uint8)
+    grid[:32, :32] = 0
+    grid[32:64, :32] = 1
+    path = str(tmp_path / "floorplan_tiles.npz")
+    gridTiles.save_grid_tiles(grid, path, tile=32)
+    return grid, gridTiles.TiledGrid(path, cache_tiles=4)
+
+
+def test_lookups_match_the_dense_grid(stored):
+    grid, tiled = stored
+    for r, c in [(0, 0), (40, 5), (149, 99), (-1, -1), (-150, 3), (77, -100)]:
+        assert tiled[r, c] == grid[r, c], (r, c)
+    assert np.array_equal(tiled[20:90, 30:99], grid[20:90, 30:99])
+    assert np.array_equal(tiled[-5, 10:40], grid[-5, 10:40])
+    assert np.array_equal(tiled[:, -1], grid[:, -1])
+
+
+@pytest.mark.parametrize("index", [(150, 0), (0, 100), (-151, 0), (0, -101), (140, 120)])
+def test_out_of_range_lookups_raise(stored, index):
+    _, tiled = stored
+    with pytest.raises(IndexError):
+        tiled[index]
+
+
+def test_dense_copy_bypasses_the_tile_cache(stored):
+    grid, tiled = stored
+    tiled[100, 50]
+    cached = list(tiled._cache)
+    assert np.array_equal(gridTiles.dense(tiled), grid)
+    assert np.array_equal(np.asarray(tiled), grid)
+    assert list(tiled._cache) == cached and tiled.loads == 1
+
+
+def test_digest_is_recorded_in_the_store(stored, tmp_path):
+    grid, tiled = stored
+    assert tiled.digest == gridTiles.grid_digest(grid) == gridTiles.grid_digest(grid.astype(np.int32) * 7)
+    assert tiled.loads == 0
+
+    # A store without a recorded digest still gets the same one
+    path = str(tmp_path / "old_tiles.npz")
+    with np.load(str(tmp_path / "floorplan_tiles.npz")) as npz:
+        np.savez_compressed(path, **{k: npz[k] for k in npz.files if k != "digest"})
+    assert gridTiles.TiledGrid(path).digest == tiled.digest
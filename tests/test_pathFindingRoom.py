@@ -0,0 +1,430 @@
+"""
+Tests for controllers/pathFindingRoom.py.
+
+Usage: python -m pytest tests/test_pathFindingRoom.py
+"""
+
+import collections
+import io
+import json
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from conftest import FLOORPLANS_DIR
+
+# =============================================================
+# === SYNTHETIC BUILDING ===
+# =============================================================
+
+# Two 48 x 80 floors: rooms above and below a corridor (rows 16-23), joined
+# by stairs A and B at the corridor's ends. Floor 2's corridor is split by a
+# wall with a one-cell gap. Some doors are one cell wide, so the coarse
+# pyramid levels are closed there.
+ROWS, COLS = 48, 80
+CODE = "zz01"
+
+
+def floor_grid(top_doors, bottom_doors, corridor_wall=None):
+    grid = np.zeros((ROWS, COLS), dtype=np.uint8)
+    grid[[0, -1], :] = 1
+    grid[:, [0, -1]] = 1
+    grid[[15, 24], :] = 1
+    grid[:15, [20, 40]] = 1
+    grid[25:, 45] = 1
+    for c0, c1 in top_doors:
+        grid[15, c0:c1 + 1] = 0
+    for c0, c1 in bottom_doors:
+        grid[24, c0:c1 + 1] = 0
+    if corridor_wall is not None:
+        grid[16:24, corridor_wall] = 1
+        grid[20, corridor_wall] = 0
+    return grid
+
+
+# floor -> (grid, {label: (row, col)})
+FLOORS = {
+    1: (floor_grid([(8, 11), (28, 31), (60, 63)], [(12, 12), (50, 50)]),
+        {"101": (8, 10), "102": (8, 30), "103": (8, 60), "104": (35, 20), "105": (35, 60),
+         "stairs A": (20, 3), "stairs B": (20, 76), "entranceNorth": (18, 40)}),
+    2: (floor_grid([(10, 10), (25, 25), (70, 70)], [(50, 53)], corridor_wall=35),
+        {"201": (8, 10), "202": (8, 30), "203": (35, 60), "stairs A": (21, 3), "stairs B": (19, 76)}),
+}
+
+
+@pytest.fixture
+def building(pathfinder, tmp_path):
+    """The pathfinder with CODE loaded from a tmp floorPlans tree (tmp_path/floorPlans)."""
+    base_dir = tmp_path / "floorPlans"
+    for floor, (grid, labels) in FLOORS.items():
+        floor_dir = base_dir / CODE[:2] / CODE[2:] / f"F{floor}"
+        floor_dir.mkdir(parents=True)
+        np.save(floor_dir / "floorplan_grid.npy", grid)
+        (floor_dir / "meta.json").write_text(json.dumps(
+            {"min_x": 0.0, "max_x": float(COLS), "min_y": 0.0, "max_y": float(ROWS), "cell_size": 1}))
+        (floor_dir / "labels.json").write_text(json.dumps(
+            [{"x": c + 0.5, "y": ROWS - r - 0.5, "label": label} for label, (r, c) in labels.items()]))
+    pathfinder.load_buildings([CODE], base_dir=str(base_dir))
+    return pathfinder
+
+
+def state(label, floor=None):
+    """Grid state of a label in the synthetic building."""
+    floor = floor or (int(label[0]) if label[0].isdigit() else 1)
+    r, c = FLOORS[floor][1][label]
+    return (CODE, floor, r, c)
+
+
+def distances(P, source):
+    """Reference BFS over neighbors() (closures included): {state: moves from source}."""
+    dist = {source: 0}
+    q = collections.deque([source])
+    while q:
+        current = q.popleft()
+        for nxt in P.neighbors(current):
+            if nxt not in dist:
+                dist[nxt] = dist[current] + 1
+                q.append(nxt)
+    return dist
+
+
+def assert_walkable(P, path, start, goal):
+    """path runs from start to goal in unit moves: open cell steps and open portal hops."""
+    assert path[0] == start and path[-1] == goal
+    for a, b in zip(path, path[1:]):
+        assert b in set(P.neighbors(a)), f"{a} -> {b} is not a move"
+
+# =============================================================
+# === ENGINES ===
+# =============================================================
+
+PAIRS = [("101", "105"), ("101", "102"), ("104", "103"), ("102", "201"), ("105", "203"),
+         ("201", "202"), ("entranceNorth", "203"), ("203", "101")]
+
+
+@pytest.mark.parametrize("engine", ["astar", "bfs", "pyramid", "lpa"])
+def test_engines_find_shortest_paths(building, engine):
+    P = building
+    for a, b in PAIRS:
+        start, goal = state(a), state(b)
+        path = P.SEARCH_ENGINES[engine](start, goal)
+        assert_walkable(P, path, start, goal)
+        assert len(path) - 1 == distances(P, start)[goal], (a, b)
+
+
+def test_skeleton_paths_are_walkable(building):
+    P = building
+    for a, b in PAIRS:
+        start, goal = state(a), state(b)
+        path = P.skeleton_multi_floor(start, goal)
+        assert_walkable(P, path, start, goal)
+        assert len(path) - 1 >= distances(P, start)[goal]
+
+
+def test_unreachable_goal_has_no_path(building):
+    P = building
+    P.close_portal(state("stairs A"))
+    P.close_portal(state("stairs B"))
+    for engine in ("astar", "bfs", "pyramid", "lpa"):
+        assert P.SEARCH_ENGINES[engine](state("101"), state("201")) is None
+
+# =============================================================
+# === REACHABILITY ===
+# =============================================================
+
+@pytest.mark.parametrize("steps", [0, 12, 40, 200])
+def test_reachable_within_matches_bfs(building, steps):
+    P = building
+    source = state("101")
+    dist = distances(P, source)
+    reach = P.reachable_within([source], steps)
+
+    expected = {s for s, d in dist.items() if d <= steps}
+    found = {(b, f, int(r), int(c)) for (b, f), mask in reach["masks"].items() for r, c in zip(*np.nonzero(mask))}
+    assert found == expected
+    assert reach["summary"]["cells"] == len(expected)
+    for (b, f), field in reach["distances"].items():
+        for r, c in zip(*np.nonzero(field >= 0)):
+            assert field[r, c] == dist[(b, f, int(r), int(c))]
+
+    rooms = reach["summary"]["rooms"]
+    assert [d for _, _, d in rooms] == sorted(d for _, _, d in rooms)
+    assert {label for label, _, _ in rooms} == {
+        str(room) for room, locs in P.ROOM_COORDS.items() if dist.get(locs[0], steps + 1) <= steps}
+
+# =============================================================
+# === NEAREST FACILITY ===
+# =============================================================
+
+def test_saved_facility_maps_answer_without_a_wavefront(building, tmp_path, monkeypatch):
+    P = building
+    queries = [(label, kind) for label in ("101", "105", "203") for kind in ("stairs", "entrance")]
+    expected = {q: P.nearest_facility(state(q[0]), q[1]) for q in queries}
+    assert expected[("105", "stairs")]["label"] == "stairs B"
+    assert expected[("105", "stairs")]["distance"] == distances(P, state("105"))[state("stairs B")]
+    assert expected[("203", "entrance")]["distance"] == distances(P, state("203"))[state("entranceNorth")]
+    P.save_facility_maps(CODE)
+
+    # A fresh process: the maps come from disk, no wavefront runs
+    from conftest import reset_pathfinder
+    reset_pathfinder()
+    P.load_buildings([CODE], base_dir=str(tmp_path / "floorPlans"))
+    waves = []
+    wavefront = P.wavefront_multi_floor
+    monkeypatch.setattr(P, "wavefront_multi_floor", lambda *a, **k: waves.append(a) or wavefront(*a, **k))
+    assert {q: P.nearest_facility(state(q[0]), q[1]) for q in queries} == expected
+    assert waves == []
+
+    # A closure makes the saved map stale: it is rebuilt in-process
+    P.close_area(CODE, 1, 16, 65, 23, 66) # corridor between room 105 and stairs B
+    found = P.nearest_facility(state("105"), "stairs")
+    assert len(waves) == 1
+    assert found["label"] == "stairs A"
+    assert found["distance"] == distances(P, state("105"))[state("stairs A")]
+
+# =============================================================
+# === ROUTE TABLE ===
+# =============================================================
+
+def test_route_table_round_trip(building, tmp_path):
+    P = building
+    base_dir = str(tmp_path / "floorPlans")
+    P.build_route_table(CODE, base_dir=base_dir)
+    table = P.load_route_table(CODE, base_dir=base_dir)
+    assert table is not None
+    assert table["starts"].dtype == np.int32 and table["waypoints"].dtype == np.int16
+
+    nodes = table["nodes"]
+    for i, (_, a) in enumerate(nodes):
+        dist = distances(P, a)
+        for j, (_, b) in enumerate(nodes):
+            assert table["dist"][i, j] == dist.get(b, -1)
+            route = P._table_route(table, i, j)
+            assert route[0] == a and route[-1] == b
+            if j < i: # stored once, for i < j
+                assert route == P._table_route(table, j, i)[::-1]
+                continue
+            for p, q in zip(route, route[1:]):
+                assert P.is_line_of_sight(p, q) if p[:2] == q[:2] else q in P.PORTALS[p]
+
+    route = P.find_route(CODE, "101", CODE, "203")
+    assert route["path"] is None # served from the table
+    assert route["steps"] == distances(P, state("101"))[state("203")] + 1
+    assert P.find_route(CODE, "101", CODE, "203", epsilon=1.0)["bound"] == 1.0
+    # Another engine runs that engine, unless the table is asked for
+    assert P.find_route(CODE, "101", CODE, "203", engine="bfs")["path"] is not None
+    assert P.find_route(CODE, "101", CODE, "203", engine="bfs", use_tables=True)["path"] is None
+
+
+def test_route_table_goes_stale_with_the_grid(building, tmp_path):
+    P = building
+    base_dir = str(tmp_path / "floorPlans")
+    P.build_route_table(CODE, base_dir=base_dir)
+
+    P.ALL_BUILDING_DATA[CODE]["grids"][2][40, 70] = 1 # a new wall in room 203
+    P.ROUTE_TABLES.clear()
+    assert P.load_route_table(CODE, base_dir=base_dir) is None
+    assert P.find_route(CODE, "101", CODE, "203")["path"] is not None # searched instead
+
+
+def test_tiled_building_keeps_its_route_table_and_routes(building, tmp_path):
+    P = building
+    base_dir = str(tmp_path / "floorPlans")
+    P.build_route_table(CODE, base_dir=base_dir)
+    start, goal = state("101"), state("203")
+    steps = distances(P, start)[goal]
+    for floor in FLOORS:
+        floor_dir = P._floor_dir(CODE, floor, base_dir=base_dir)
+        P.gridTiles.save_grid_tiles(P.ALL_BUILDING_DATA[CODE]["grids"][floor], os.path.join(floor_dir, P.GRID_TILES_FILE), tile=16)
+        os.remove(os.path.join(floor_dir, "floorplan_grid.npy"))
+
+    from conftest import reset_pathfinder
+    reset_pathfinder()
+    P.load_buildings([CODE], base_dir=base_dir)
+    grids = P.ALL_BUILDING_DATA[CODE]["grids"]
+    assert all(isinstance(grid, P.gridTiles.TiledGrid) for grid in grids.values())
+    loads = lambda: sum(grid.loads for grid in grids.values())
+
+    assert P.load_route_table(CODE, base_dir=base_dir) is not None # same digest, from the stores
+    loaded = loads() # only the tiles under the labelled points, snapped to free cells
+    assert loaded < sum(int((grid.kinds == P.gridTiles.MIXED).sum()) for grid in grids.values())
+    assert len(P.bfs_multi_floor(start, goal)) - 1 == steps # eager: one dense copy per floor
+    assert loads() == loaded
+    for grid in grids.values():
+        grid._cache.clear()
+    assert len(P.astar_multi_floor(start, goal)) - 1 == steps # lazy: reads tiles on the way
+    assert loads() > loaded
+
+# =============================================================
+# === CLOSURES ===
+# =============================================================
+
+def test_close_area_and_reopen_update_every_engine(building, tmp_path):
+    P = building
+    start, goal = state("101"), state("105")
+    P.build_route_table(CODE, base_dir=str(tmp_path / "floorPlans"))
+    P.load_route_table(CODE, base_dir=str(tmp_path / "floorPlans"))
+    open_steps = distances(P, start)[goal]
+    assert len(P.lpa_multi_floor(start, goal)) - 1 == open_steps # planner now cached
+
+    # Block floor 1's corridor: the route has to go up stairs A and down stairs B
+    closure = P.close_area(CODE, 1, 16, 30, 23, 35)
+    closed_steps = distances(P, start)[goal]
+    assert closed_steps > open_steps
+    for engine in ("astar", "bfs", "pyramid", "lpa"):
+        path = P.SEARCH_ENGINES[engine](start, goal)
+        assert_walkable(P, path, start, goal)
+        assert len(path) - 1 == closed_steps, engine
+        assert any(s[1] == 2 for s in path)
+    route = P.find_route(CODE, "101", CODE, "105")
+    assert route["path"] is not None and route["steps"] == closed_steps + 1 # table route crosses the closure
+
+    # Closing stairs A as well cuts room 105 off
+    stairs = P.close_portal(state("stairs A"))
+    assert P.lpa_multi_floor(start, goal) is None
+    with pytest.raises(LookupError):
+        P.find_route(CODE, "101", CODE, "105", use_tables=False)
+
+    P.reopen(stairs)
+    assert len(P.lpa_multi_floor(start, goal)) - 1 == closed_steps
+    P.reopen(closure)
+    for engine in ("bfs", "pyramid", "lpa"):
+        assert len(P.SEARCH_ENGINES[engine](start, goal)) - 1 == open_steps, engine
+    assert P.find_route(CODE, "101", CODE, "105")["path"] is None # the table serves it again
+    with pytest.raises(LookupError):
+        P.reopen(closure)
+
+
+def test_closure_ids_are_not_reused_after_a_reopen(building):
+    P = building
+    start, goal = state("101"), state("105")
+    P.lpa_multi_floor(start, goal)
+
+    first = P.close_area(CODE, 1, 30, 5, 34, 6)
+    corridor = P.close_area(CODE, 1, 16, 30, 23, 35)
+    P.reopen(first)
+    third = P.close_area(CODE, 1, 40, 5, 44, 6)
+    assert len({first, corridor, third}) == 3 and set(P.CLOSURES) == {corridor, third}
+    # The corridor closure is still live, so the cached planner still routes around it
+    assert len(P.lpa_multi_floor(start, goal)) - 1 == distances(P, start)[goal]
+    assert any(s[1] == 2 for s in P.lpa_multi_floor(start, goal))
+
+    with pytest.raises(ValueError):
+        P.close_area(CODE, 1, 1, 1, 2, 2, closure_id=corridor)
+    with pytest.raises(ValueError):
+        P.close_portal(state("stairs A"), closure_id=third)
+    assert P.CLOSURES[corridor]["rect"] == (16, 30, 23, 35)
+
+# =============================================================
+# === ANYTIME A* ===
+# =============================================================
+
+@pytest.mark.parametrize("epsilon", [1.0, 2.5, 5.0])
+def test_anytime_astar_reaches_bound_one_without_budget(building, epsilon):
+    P = building
+    start, goal = state("104"), state("203")
+    path, bound = P.anytime_astar(start, goal, epsilon=epsilon)
+    assert_walkable(P, path, start, goal)
+    assert bound == 1.0
+    assert len(path) - 1 == distances(P, start)[goal]
+
+
+def test_anytime_astar_bound_holds_under_a_budget(building):
+    P = building
+    start, goal = state("104"), state("203")
+    shortest = distances(P, start)[goal]
+    for budget in (0.0, 0.001, 0.01, 1.0):
+        path, bound = P.anytime_astar(start, goal, budget=budget, epsilon=5.0)
+        assert bound >= 1.0
+        assert_walkable(P, path, start, goal) # a route even when the budget is already spent
+        assert len(path) - 1 <= bound * shortest
+
+
+def test_exhausted_budget_still_returns_a_route(building, monkeypatch):
+    P = building
+    clock = iter(range(0, 10 ** 6, 100)) # every reading is 100 s after the last
+    monkeypatch.setattr(P.time, "perf_counter", lambda: next(clock))
+    route = P.find_route(CODE, "104", CODE, "203", use_tables=False, budget=1.0, epsilon=1.0)
+    assert_walkable(P, route["path"], state("104"), state("203"))
+    assert route["steps"] - 1 <= route["bound"] * distances(P, state("104"))[state("203")]
+
+
+def test_route_result_reports_an_unbounded_route(building):
+    P = building
+    route = P.find_route(CODE, "104", CODE, "203", use_tables=False, epsilon=2.5)
+    assert route["bound"] >= 1.0
+    route["bound"] = P.INF # as when the budget runs out before the route is certified
+    assert '"bound": Infinity' in json.dumps(P.route_result(route))
+
+# =============================================================
+# === BATCH MODE ===
+# =============================================================
+
+def test_run_batch_writes_one_ndjson_result_per_request(building, tmp_path, monkeypatch):
+    P = building
+    monkeypatch.chdir(tmp_path) # run_batch loads the buildings it needs from ./floorPlans
+    shutil.copytree(tmp_path / "floorPlans" / "zz" / "01", tmp_path / "floorPlans" / "zz" / "02")
+    from conftest import reset_pathfinder
+    reset_pathfinder()
+    lines = iter([
+        json.dumps({"id": "up", "startBuildingCode": CODE, "startRoom": "101", "goalBuildingCode": CODE, "goalRoom": "203"}),
+        json.dumps({"startBuildingCode": CODE, "startRoom": "104", "goalBuildingCode": CODE, "goalRoom": "105",
+                    "engine": "bfs"}),
+        "\n",
+        "{not json",
+        json.dumps({"id": "missing", "startBuildingCode": CODE, "startRoom": "999", "goalBuildingCode": CODE,
+                    "goalRoom": "101"}),
+        json.dumps({"id": "reach", "op": "reach", "building": CODE, "location": "101", "steps": 12}),
+        json.dumps({"id": "nowhere", "op": "reach", "building": "zz09", "location": "101", "steps": 12}),
+    ])
+    out = io.StringIO()
+    P.run_batch(lines, out, num_workers=1, max_in_flight=2)
+    assert set(P.ALL_BUILDING_DATA) == {CODE} # zz02 is never named
+
+    results = {r["id"]: r for r in map(json.loads, out.getvalue().splitlines())}
+    assert set(results) == {"up", 2, 4, "missing", "reach", "nowhere"}
+    assert not results["nowhere"]["success"]
+    assert results["up"]["success"] and results["up"]["steps"] == distances(P, state("101"))[state("203")] + 1
+    assert results["up"]["path"][0] == list(state("101")) and results["up"]["path"][-1] == list(state("203"))
+    assert results[2]["success"] and results[2]["steps"] == distances(P, state("104"))[state("105")] + 1
+    assert not results[4]["success"] and "Invalid batch request" in results[4]["error"]
+    assert not results["missing"]["success"] and "999" in results["missing"]["error"]
+    assert results["reach"]["cells"] == sum(1 for d in distances(P, state("101")).values() if d <= 12)
+
+
+def test_pool_reports_a_dead_worker_instead_of_waiting(building, monkeypatch):
+    P = building
+    monkeypatch.setattr(P, "POOL_POLL_S", 0.1)
+    with pytest.raises(RuntimeError, match="died"):
+        with P.RouteWorkerPool(1) as pool:
+            pool._workers[0].terminate()
+            pool._workers[0].join()
+            pool.submit(0, CODE, "101", CODE, "203")
+            next(pool.results())
+
+# =============================================================
+# === VISIBILITY GRAPH ON A COMMITTED FLOOR ===
+# =============================================================
+
+def test_visibility_route_close_to_bfs_on_committed_floor(pathfinder, tmp_path):
+    P = pathfinder
+    P.load_buildings(["sw05"], base_dir=FLOORPLANS_DIR)
+
+    # Build the graph from the committed cleaned.dxf into a scratch copy
+    floor_dir = tmp_path / "sw" / "05" / "F2"
+    floor_dir.mkdir(parents=True)
+    shutil.copy(os.path.join(FLOORPLANS_DIR, "sw", "05", "F2", "cleaned.dxf"), floor_dir)
+    P.save_visibility_graph("sw05", 2, base_dir=str(tmp_path))
+    assert P.load_visibility_graph("sw05", 2, base_dir=str(tmp_path)) is not None
+
+    # 2825 and 2895 are only joined by a curved corridor with no wall corners in it
+    for start, goal in [(("sw05", 2, 183, 708), ("sw05", 2, 185, 502)),
+                        (("sw05", 2, 180, 869), ("sw05", 2, 182, 334))]:
+        shortest = len(P.bfs_multi_floor(start, goal))
+        path = P.visibility_multi_floor(start, goal)
+        assert path is not None and path[0] == start and path[-1] == goal
+        assert all(s[1] == 2 for s in path) # no detour through another floor
+        # Straight legs walked cell by cell cost at most sqrt(2) times the grid optimum
+        assert shortest <= len(path) <= 1.45 * shortest
@@ -0,0 +1,48 @@
+"""
+Tests for controllers/visibilityGraph.py on hand-made wall segments.
+
+Usage: python -m pytest tests/test_visibilityGraph.py
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+import visibilityGraph as vg
+
+# A 200-unit wall along y = 0
+WALL = np.array([[0.0, 0.0, 200.0, 0.0]])
+
+
+@pytest.mark.parametrize("p, q, blocked", [
+    ((50, 0.5), (150, 0.5), True),    # parallel, within clearance of the wall's middle
+    ((50, 0.5), (150, 5.0), True),    # starts next to it and runs along it
+    ((50, 1.5), (150, 1.5), False),   # parallel, clear of it
+    ((50, 0.3), (50, 40.0), False),   # starts next to it, leaves at a right angle
+    ((50, -5.0), (60, 5.0), True),    # crosses it
+    ((202.0, 0.5), (240.0, 0.5), False), # beyond its end, clear of it
+    ((200.5, 5.0), (200.5, -5.0), True), # within clearance of its end
+])
+def test_legs_keep_clear_of_the_whole_wall(p, q, blocked):
+    index = vg.SegmentIndex(WALL)
+    assert index.blocked(np.array(p, dtype=float), [q], vg.CLEARANCE)[0] == blocked
+
+
+def test_segment_distance_broadcasts():
+    d = vg.segment_distance(np.array([[100.0], [-3.0]]), np.array([[4.0], [4.0]]), *WALL.T[:, None, :])
+    assert d.ravel().tolist() == [4.0, 5.0]
+
+
+def test_nodes_grow_with_the_walls_not_the_floor_area():
+    counts = []
+    for size in (100.0, 1000.0):
+        room = np.array([[0, 0, size, 0], [size, 0, size, size], [size, size, 0, size], [0, size, 0, 0.0]])
+        anchors = [(size / 2, size / 2), (size / 4, size / 4)]
+        graph = vg.build_visibility_graph(room, anchors)
+        counts.append(len(graph["nodes"]))
+        wall_length = 4 * size
+        assert counts[-1] <= 2 * math.ceil(wall_length / vg.WALL_SPACING) + 4 * 2 + len(anchors)
+        assert any(np.allclose(node, anchors[0]) for node in graph["nodes"])
+    # Ten times the side: about ten times the nodes, not a hundred
+    assert counts[1] < 12 * counts[0]